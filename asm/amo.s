@@ -0,0 +1,75 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   amo.s: Shared counters updated by several harts (RV32A)
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+# This program runs on NHARTS harts (snurisc.py -N 4 amo). Each hart
+# increments three shared counters ITER times:
+#   count1 with amoadd.w,
+#   count2 with lw/sw inside a spinlock taken with amoswap.w and
+#          released with a plain sw,
+#   count3 with an lr.w/sc.w loop.
+# Hart 0 then waits for the other harts and loads the counters. Every
+# hart ends in a loop to itself, which the simulator takes as the end of
+# the hart. At the end, the a0, a1 and a2 registers of hart 0 should all
+# have the value of NHARTS * ITER = 8000 (= 0x1f40).
+
+    .equ    NHARTS, 4
+    .equ    ITER, 2000
+
+    .text
+    .align  2
+    .globl  _start
+_start:                         # code entry point
+    csrr    s0, mhartid
+    la      s1, count1
+    la      s2, lock
+    la      s3, count2
+    la      s4, count3
+    la      s5, done
+    li      t0, ITER
+    li      t1, 1
+Loop:
+    amoadd.w zero, t1, (s1)     # count1++
+Acquire:
+    amoswap.w t2, t1, (s2)      # lock = 1
+    bnez    t2, Acquire
+    lw      t3, 0(s3)           # count2++ in the critical section
+    addi    t3, t3, 1
+    sw      t3, 0(s3)
+    sw      zero, 0(s2)         # lock = 0
+Retry:
+    lr.w    t3, (s4)            # count3++
+    addi    t3, t3, 1
+    sc.w    t2, t3, (s4)
+    bnez    t2, Retry
+    addi    t0, t0, -1
+    bnez    t0, Loop
+    amoadd.w zero, t1, (s5)     # done++
+    bnez    s0, Exit
+    li      t0, NHARTS
+Wait:
+    lw      t2, 0(s5)
+    bne     t2, t0, Wait
+    lw      a0, 0(s1)
+    lw      a1, 0(s3)
+    lw      a2, 0(s4)
+Exit:
+    j       Exit
+
+    .data
+    .align  2
+count1:     .word   0
+lock:       .word   0
+count2:     .word   0
+count3:     .word   0
+done:       .word   0
@@ -0,0 +1,116 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Asynchronous log writer.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import sys
+import queue
+import atexit
+import threading
+
+from consts import *
+from isa import *
+from program import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+LOG_BATCH           = 4096      # records handed to the writer at once
+LOG_QUEUE_DEPTH     = 16        # batches in flight before the simulator waits
+
+
+#--------------------------------------------------------------------------
+#   AsyncWriter: formats and writes log records in a background thread
+#--------------------------------------------------------------------------
+
+# The simulator only appends a tuple of raw values per log line. Full
+# batches are passed to a writer thread through a bounded queue, which
+# blocks the simulator when the writer falls behind. The writer turns a
+# batch into text with the given format function and writes it at once.
+# sync() must be called before anything else is printed so that the
+# output stays in the original order.
+
+class AsyncWriter(object):
+
+    def __init__(self, format, out = None):
+
+        self.format     = format            # list of records -> str
+        self.out        = out or sys.stdout
+        self.records    = [ ]
+        self.queue      = queue.Queue(LOG_QUEUE_DEPTH)
+        self.asm        = { }               # inst -> asm, or None if pc-relative
+        self.asm_pc     = { }               # (pc, inst) -> asm
+        self.thread     = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def put(self, record):
+
+        self.records.append(record)
+        if len(self.records) >= LOG_BATCH:
+            self.queue.put(self.records)
+            self.records = [ ]
+
+    def run(self):
+
+        while True:
+            batch = self.queue.get()
+            try:
+                if batch is None:
+                    return
+                self.out.write(self.format(batch))
+            except (OSError, ValueError):
+                pass                        # e.g. closed pipe; keep draining
+            finally:
+                self.queue.task_done()
+
+    def sync(self):
+
+        if self.records:
+            self.queue.put(self.records)
+            self.records = [ ]
+        self.queue.join()
+        try:
+            self.out.flush()
+        except (OSError, ValueError):
+            pass
+
+    def close(self):
+
+        if self.thread.is_alive():
+            self.sync()
+            self.queue.put(None)
+            self.thread.join()
+
+    def disasm(self, pc, inst):
+
+        # Disassembles inst, caching the result by the instruction word
+        # unless it depends on pc (branches and jumps)
+        asm = self.asm.get(inst, False)
+        if asm is None:
+            asm = self.asm_pc.get((pc, inst))
+            if asm is None:
+                asm = Program.disasm(pc, inst)
+                self.asm_pc[(pc, inst)] = asm
+        elif asm is False:
+            asm = Program.disasm(pc, inst)
+            opcode = RISCV.opcode(inst)
+            if opcode != ILLEGAL and isa[opcode][IN_TYPE] in [ B_TYPE, J_TYPE ]:
+                self.asm[inst] = None
+                self.asm_pc[(pc, inst)] = asm
+            else:
+                self.asm[inst] = asm
+        return asm
@@ -0,0 +1,227 @@
+#!/usr/bin/python3
+
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Compact binary execution trace: writer, reader, and text converter.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import sys
+import zlib
+import lzma
+import struct
+import atexit
+
+import numpy as np
+
+from consts import *
+from isa import *
+from program import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+# File layout:
+#   header: magic 'PYRT', version (u16), compression (u8), source (u8)
+#   body:   TRACE_NONE  -> fixed-size records back to back (can be memmapped)
+#           otherwise   -> chunks of (record count (u32), payload size (u32),
+#                          compressed records)
+
+TRACE_MAGIC         = b'PYRT'
+TRACE_VERSION       = 1
+TRACE_HEADER        = struct.Struct('<4sHBB')
+TRACE_CHUNK         = struct.Struct('<II')
+
+TRACE_NONE          = 0
+TRACE_ZLIB          = 1
+TRACE_LZMA          = 2
+
+TRACE_COMPRESSION   = { 'none': TRACE_NONE, 'zlib': TRACE_ZLIB, 'lzma': TRACE_LZMA }
+
+TRACE_SIM           = 0         # written by snurisc (ISA simulator)
+TRACE_PIPE5         = 1         # written by snurisc5 (retired from WB)
+
+TRACE_CHUNK_RECORDS = 65536     # records buffered before each write
+
+# Record flags
+TR_LOAD             = 1
+TR_STORE            = 2
+TR_RF_WEN           = 4         # snurisc5 only: register file written
+
+TRACE_DTYPE         = np.dtype([ ('cycle',      np.uint64),
+                                 ('pc',         np.uint32),
+                                 ('inst',       np.uint32),
+                                 ('pc_next',    np.uint32),
+                                 ('wbdata',     np.uint32),
+                                 ('mem_addr',   np.uint32),
+                                 ('mem_data',   np.uint32),
+                                 ('rd',         np.uint8),
+                                 ('flags',      np.uint8) ])
+
+
+#--------------------------------------------------------------------------
+#   TraceWriter: streams trace records to a file in chunks
+#--------------------------------------------------------------------------
+
+class TraceWriter(object):
+
+    def __init__(self, filename, compression = TRACE_NONE, source = TRACE_SIM):
+
+        self.f          = open(filename, 'wb')
+        self.compression = compression
+        self.f.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, compression, source))
+        self.records    = [ ]
+        self.count      = 0
+        if compression == TRACE_ZLIB:
+            self.compress = zlib.compress
+        elif compression == TRACE_LZMA:
+            self.compress = lzma.compress
+        atexit.register(self.close)
+
+    def write(self, cycle, pc, inst, pc_next, rd, wbdata, mem_addr, mem_data, flags):
+
+        self.records.append((cycle, pc, inst, pc_next, wbdata, mem_addr, mem_data, rd, flags))
+        if len(self.records) >= TRACE_CHUNK_RECORDS:
+            self.flush()
+
+    def flush(self):
+
+        if not self.records:
+            return
+        # Values are masked since the simulators may pass negative integers
+        chunk = np.array([ (c, int(pc), int(inst), int(pn) & 0xffffffff, int(wb) & 0xffffffff,
+                            int(ma) & 0xffffffff, int(md) & 0xffffffff, int(rd), fl)
+                           for c, pc, inst, pn, wb, ma, md, rd, fl in self.records ],
+                         dtype = TRACE_DTYPE).tobytes()
+        if self.compression != TRACE_NONE:
+            payload = self.compress(chunk)
+            self.f.write(TRACE_CHUNK.pack(len(self.records), len(payload)))
+            chunk = payload
+        self.f.write(chunk)
+        self.count += len(self.records)
+        self.records = [ ]
+
+    def close(self):
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+
+
+#--------------------------------------------------------------------------
+#   Reading and converting traces
+#--------------------------------------------------------------------------
+
+def read_header(filename):
+
+    with open(filename, 'rb') as f:
+        magic, version, compression, source = TRACE_HEADER.unpack(f.read(TRACE_HEADER.size))
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError("%s is not a trace file" % filename)
+    return compression, source
+
+
+def iter_chunks(filename):
+
+    # Yields the records as structured arrays, one chunk at a time
+    compression, source = read_header(filename)
+    if compression == TRACE_NONE:
+        yield load_trace(filename)
+        return
+    decompress = zlib.decompress if compression == TRACE_ZLIB else lzma.decompress
+    with open(filename, 'rb') as f:
+        f.seek(TRACE_HEADER.size)
+        while True:
+            hdr = f.read(TRACE_CHUNK.size)
+            if len(hdr) < TRACE_CHUNK.size:
+                return
+            count, size = TRACE_CHUNK.unpack(hdr)
+            yield np.frombuffer(decompress(f.read(size)), dtype = TRACE_DTYPE, count = count)
+
+
+def load_trace(filename):
+
+    # Returns all records as a structured array; uncompressed traces are
+    # memory-mapped instead of being read
+    compression, source = read_header(filename)
+    if compression == TRACE_NONE:
+        return np.memmap(filename, dtype = TRACE_DTYPE, mode = 'r', offset = TRACE_HEADER.size)
+    chunks = list(iter_chunks(filename))
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype = TRACE_DTYPE)
+
+
+def render(rec, source, level):
+
+    # Formats a record the same way as the simulator does with log level
+    # 'level' (Sim.log for snurisc, the WB line of Pipe.log for snurisc5)
+    pc, inst, rd = rec['pc'], rec['inst'], int(rec['rd'])
+    if source == TRACE_SIM:
+        if level >= 4:
+            info = "# R[%d] <- 0x%08x, pc_next=0x%08x" % (rd, rec['wbdata'], rec['pc_next']) if rd else \
+                   "# pc_next=0x%08x" % rec['pc_next']
+        else:
+            info = ''
+        return "%d 0x%08x: %-29s %-s" % (rec['cycle'], pc, Program.disasm(pc, inst), info)
+    else:
+        if level < 5:
+            info = ''
+        elif inst == BUBBLE or not (rec['flags'] & TR_RF_WEN):
+            info = '# -'
+        else:
+            info = '# R[%d] <- 0x%08x' % (rd, rec['wbdata'])
+        return "%d [WB] 0x%08x: %-29s %-s" % (rec['cycle'], pc, Program.disasm(pc, inst), info)
+
+
+def convert(filename, level, start_cycle, out, elf_file = None):
+
+    compression, source = read_header(filename)
+    Program()
+    if elf_file:
+        Program.symtab = SymbolIndex.load(elf_file)
+    for chunk in iter_chunks(filename):
+        lines = [ render(rec, source, level) for rec in chunk if rec['cycle'] >= start_cycle ]
+        if lines:
+            out.write('\n'.join(lines) + '\n')
+
+
+#--------------------------------------------------------------------------
+#   Trace converter main
+#--------------------------------------------------------------------------
+
+def main():
+
+    args = sys.argv[1:]
+    level, start_cycle, elf_file = 3, 0, None
+    try:
+        while len(args) > 1 and args[0] in [ '-l', '-c', '-e' ]:
+            if args[0] == '-l':
+                level = int(args[1])
+            elif args[0] == '-c':
+                start_cycle = int(args[1])
+            else:
+                elf_file = args[1]
+            args = args[2:]
+    except ValueError:
+        args = [ ]
+    if len(args) != 1:
+        print("Usage: %s [-l n] [-c m] [-e elf] tracefile" % sys.argv[0])
+        print("\tprints a binary trace in the text format of log level n (default: 3)")
+        print("\t-c shows the instructions from cycle m (default: 0)")
+        print("\t-e annotates branch and jump targets with the symbols of the executable file")
+        sys.exit()
+    convert(args[0], level, start_cycle, sys.stdout, elf_file)
+
+
+if __name__ == '__main__':
+    main()
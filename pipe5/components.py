@@ -87,6 +87,21 @@ class Register(object):
         self.r = WORD(val)
 
 
+#--------------------------------------------------------------------------
+#   MemoryFault: raised by the load and store methods of the memory
+#--------------------------------------------------------------------------
+
+# Loads and stores return plain ints and report an address outside the
+# memory, or not aligned to a word, by raising MEM_FAULT. The instance is
+# created once, so that no object is allocated on any path; it is raised
+# with its traceback cleared, which would otherwise grow with every raise.
+
+class MemoryFault(Exception):
+    pass
+
+MEM_FAULT           = MemoryFault()
+
+
 #--------------------------------------------------------------------------
 #   Memory: models a memory
 #--------------------------------------------------------------------------
@@ -99,24 +114,36 @@ class Memory(object):
         self.mem_start  = mem_start
         self.mem_end    = mem_start + mem_size
         self.mem        = WORD([0] * self.mem_words)
+        self.start      = int(mem_start)        # plain ints for the hot paths
+        self.size       = int(mem_size)
 
-    def access(self, valid, addr, data, fcn):
+    def load32(self, addr):
 
-        if (not valid):                    
-            res = [ WORD(0), True ]
-        elif (WORD(addr) < self.mem_start) or (WORD(addr) > self.mem_end) or \
-            addr % self.word_size != 0:
-            res = [ WORD(0) , False ]
-        elif fcn == M_XRD:
-            val = self.mem[(addr - self.mem_start) // self.word_size]
-            res = [ val, True ]
-        elif fcn == M_XWR:
-            self.mem[(addr - self.mem_start) // self.word_size] = WORD(data) 
-            res = [ WORD(0), True ]
-        else:
-            res = [ WORD(0), False ]
+        i = addr - self.start
+        if i < 0 or i >= self.size or i & 3:
+            raise MEM_FAULT.with_traceback(None)
+        return self.mem.item(i >> 2)
+
+    def store32(self, addr, value):
+
+        i = addr - self.start
+        if i < 0 or i >= self.size or i & 3:
+            raise MEM_FAULT.with_traceback(None)
+        self.mem[i >> 2] = value & 0xffffffff
+
+    def access(self, valid, addr, data, fcn):
 
-        return res
+        if (not valid):
+            return [ WORD(0), True ]
+        try:
+            if fcn == M_XRD:
+                return [ WORD(self.load32(int(addr))), True ]
+            elif fcn == M_XWR:
+                self.store32(int(addr), int(data))
+                return [ WORD(0), True ]
+        except MemoryFault:
+            pass
+        return [ WORD(0), False ]
 
     def dump(self, skipzero = False):
 
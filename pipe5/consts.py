@@ -32,6 +32,7 @@ N                   = False
 
 WORD_SIZE           = 4
 NUM_REGS            = 32
+PAGE_SHIFT          = 12                    # 4KB pages, for the interval stats
 
 BUBBLE              = WORD(0x00004033)      # Machine-generated NOP:  xor x0, x0, x0
 NOP                 = WORD(0x00000013)      # Software-generated NOP: addi zero, zero, 0
@@ -15,12 +15,16 @@
 
 
 import sys
+import asyncio
 
 from consts import *
 from isa import *
 from components import *
 from program import *
 from control import *
+from bintrace import *
+from asynclog import *
+from roi import *
 
 
 #--------------------------------------------------------------------------
@@ -35,6 +39,38 @@ S_WB      = 4
 
 S = [ 'IF', 'ID', 'EX', 'MM', 'WB' ]
 
+RUN_QUANTUM         = 10000     # cycles per step of run_iter()
+
+# Class attributes that belong to a single run, swapped by Pipe.switch()
+# together with the pipeline registers of the stages
+PIPE_STATE          = [ 'cpu', 'stages', 'IF', 'ID', 'EX', 'MM', 'WB', 'CTL', 'tracer',
+                        'callgraph', 'pending_call', 'opcodes',
+                        'pc_base', 'pc_insts', 'pc_cycles', 'last_retired', 'roi', 'tracing',
+                        'intervals', 'interval_at' ]
+STAT_FIELDS         = [ 'cycle', 'icount', 'inst_alu', 'inst_mem', 'inst_ctrl', 'inst_store',
+                        'taken_branches', 'stall_cycles', 'flushes' ]
+PROGRAM_STATE       = [ 'asmcache', 'symtab' ]
+
+
+#--------------------------------------------------------------------------
+#   RunStatus: the progress of a run, yielded by Pipe.run_iter()
+#--------------------------------------------------------------------------
+
+class RunStatus(object):
+
+    def __init__(self, status, icount, cycle, pc):
+
+        self.status     = status        # exception in WB, EXC_NONE until the run ends
+        self.done       = status != EXC_NONE
+        self.icount     = icount
+        self.cycle      = cycle
+        self.pc         = pc            # PC of the IF stage
+        self.stats      = None          # Stat counters of the run
+
+    def __repr__(self):
+        return "RunStatus(status=%d, done=%s, icount=%d, cycle=%d, pc=0x%08x)" % \
+               (self.status, self.done, self.icount, self.cycle, self.pc)
+
 
 #--------------------------------------------------------------------------
 #   Pipe: manages overall execution with logging support
@@ -55,10 +91,101 @@ class Pipe(object):
         Pipe.MM = stages[S_MM]
         Pipe.WB = stages[S_WB]
         Pipe.CTL = ctl
+        Pipe.tracer = cpu.tracer
 
     @staticmethod
     def run(entry_point):
+        Pipe.start(entry_point)
+        Pipe.execute()
+        Pipe.finish()
+
+    @staticmethod
+    def run_iter(cpu, entry_point, quantum = RUN_QUANTUM):
+
+        # Returns a generator which simulates up to quantum cycles each
+        # time it is resumed and yields a RunStatus; the last one has done
+        # set, after the run is finished as in run(). The state of the run
+        # (Pipe, the pipeline registers, Stat and Program) is saved when
+        # the generator yields and installed again when it is resumed, so
+        # that the generators of several CPUs can be interleaved in a
+        # single thread. The run starts from the current Stat counters and
+        # program.
+        outer = Pipe.switch(None)
+        Pipe.set_stages(cpu, cpu.stages, cpu.ctl)
+        Pipe.start(entry_point)
+        return Pipe.steps(Pipe.switch(outer), quantum)
+
+    @staticmethod
+    def steps(state, quantum):
+
+        done = False
+        while not done:
+            outer = Pipe.switch(state)
+            try:
+                done = not Pipe.execute(Stat.cycle + quantum)
+                if done:
+                    Pipe.finish()
+                progress = RunStatus(int(Pipe.WB.exception) if done else EXC_NONE,
+                                     Stat.icount, Stat.cycle, int(IF.reg_pc))
+            finally:
+                state = Pipe.switch(outer)
+            progress.stats = state[2]
+            yield progress
+
+    @staticmethod
+    async def run_async(cpu, entry_point, quantum = RUN_QUANTUM):
+
+        # Runs to the end, giving control to the event loop after every
+        # quantum cycles, and returns the last RunStatus
+        for progress in Pipe.run_iter(cpu, entry_point, quantum):
+            if progress.done:
+                return progress
+            await asyncio.sleep(0)
+
+    @staticmethod
+    def switch(state):
+
+        # Installs state (from a previous call; None leaves everything as
+        # it is) and returns the state it replaces
+        stages = [ IF, ID, EX, MM, WB ]
+        old = ({ f: getattr(Pipe, f, None) for f in PIPE_STATE },
+               [ { f: v for f, v in vars(c).items() if f.startswith('reg_') } for c in stages ],
+               { f: getattr(Stat, f) for f in STAT_FIELDS },
+               { f: getattr(Program, f, None) for f in PROGRAM_STATE })
+        if state is not None:
+            pipe, regs, stat, program = state
+            for cls, values in [ (Pipe, pipe), (Stat, stat), (Program, program) ] + list(zip(stages, regs)):
+                for f, value in values.items():
+                    setattr(cls, f, value)
+        return old
+
+    @staticmethod
+    def start(entry_point):
         IF.reg_pc = entry_point
+        Pipe.roi = Pipe.cpu.roi
+        Pipe.tracing = True
+        Pipe.intervals = Pipe.cpu.intervals
+        Pipe.interval_at = Pipe.intervals.start() if Pipe.intervals else 0
+        Pipe.callgraph = Pipe.cpu.callgraph
+        Pipe.pending_call = None
+        Pipe.opcodes = Pipe.cpu.metrics.opcodes if Pipe.cpu.metrics else None
+        if Log.line_file:
+            # Instructions and cycles per PC in imem; the cycles since the
+            # previous instruction left WB are charged to the next one
+            Pipe.pc_base = int(Pipe.cpu.imem.mem_start)
+            words = (int(Pipe.cpu.imem.mem_end) - Pipe.pc_base) // WORD_SIZE
+            Pipe.pc_insts = np.zeros(words, dtype = np.int64)
+            Pipe.pc_cycles = np.zeros(words, dtype = np.int64)
+            Pipe.last_retired = Stat.cycle
+        if Log.async_log and Log.level in [ 3, 4, 5 ] and not Log.writer:
+            Log.writer = AsyncWriter(Pipe.format_log)
+
+    @staticmethod
+    def execute(cycle_limit = 0):
+
+        # Runs until an instruction with an exception leaves WB, and
+        # returns False then. If cycle_limit is given, also stops when
+        # Stat.cycle reaches it, and returns True.
         while True:
             # Run each stage 
             # Should be run in the reverse order because forwarding and 
@@ -68,6 +195,12 @@ class Pipe(object):
             Pipe.EX.compute()
             Pipe.ID.compute()
             Pipe.IF.compute()
+            if Pipe.CTL.ID_stall:
+                Stat.stall_cycles += 1
+            if Pipe.CTL.ID_bubble:
+                Stat.flushes += 1
+                if EX.reg_c_br_type not in [ BR_J, BR_JR ]:
+                    Stat.taken_branches += 1
 
             # Update states
             Pipe.IF.update()
@@ -75,6 +208,8 @@ class Pipe(object):
             Pipe.EX.update()
             Pipe.MM.update()
             ok = Pipe.WB.update()
+            if Pipe.tracer:
+                Pipe.WB.trace()
 
             Stat.cycle      += 1
             if Pipe.WB.inst != BUBBLE:
@@ -84,8 +219,24 @@ class Pipe(object):
                     Stat.inst_alu += 1
                 elif isa[opcode][IN_CLASS] == CL_MEM:
                     Stat.inst_mem += 1
+                    if Pipe.WB.c_dmem_rw == M_XWR:
+                        Stat.inst_store += 1
                 elif isa[opcode][IN_CLASS] == CL_CTRL:
                     Stat.inst_ctrl += 1
+                if Pipe.opcodes:
+                    Pipe.opcodes.count(opcode)
+                if opcode == ADDI and Pipe.WB.rd == 0:
+                    Pipe.marker(ROI.marker(Pipe.WB.inst))
+                if Stat.icount == Pipe.interval_at:
+                    Pipe.interval_at += Pipe.intervals.sample()
+                if Pipe.callgraph:
+                    Pipe.profile_call(opcode)
+                if Log.line_file:
+                    i = (int(Pipe.WB.pc) - Pipe.pc_base) >> 2
+                    if 0 <= i < len(Pipe.pc_insts):
+                        Pipe.pc_insts[i] += 1
+                        Pipe.pc_cycles[i] += Stat.cycle - Pipe.last_retired
+                    Pipe.last_retired = Stat.cycle
 
             # Show logs after executing a single instruction
             if Log.level >= 6:
@@ -94,7 +245,17 @@ class Pipe(object):
                 Pipe.cpu.dmem.dump(skipzero = True)     # dump dmem
 
             if not ok:
-                break;
+                return False
+            if Stat.cycle == cycle_limit:
+                return True
+
+    @staticmethod
+    def finish():
+        if Pipe.callgraph:
+            Pipe.callgraph.finish((Stat.icount, Stat.cycle))
+        if Pipe.intervals:
+            Pipe.intervals.finish()
+        Log.flush()
 
         # Handle exceptions, if any
         if (Pipe.WB.exception & EXC_DMEM_ERROR):
@@ -112,21 +273,67 @@ class Pipe(object):
             if Log.level > 1 and Log.level < 7:
                 Pipe.cpu.dmem.dump(skipzero = True)     # dump dmem
        
+    @staticmethod
+    def profile_call(opcode):
+
+        # Called for each instruction leaving WB. The target of a jal/jalr
+        # is the next instruction that leaves WB, so the call or return is
+        # reported then; the cycles until that point belong to the caller.
+        if Pipe.pending_call:
+            pc, rd, rs1 = Pipe.pending_call
+            Pipe.callgraph.transfer(pc, rd, rs1, int(Pipe.WB.pc), (Stat.icount - 1, Stat.cycle - 1))
+            Pipe.pending_call = None
+        if opcode in [ JAL, JALR ]:
+            inst = Pipe.WB.inst
+            Pipe.pending_call = (int(Pipe.WB.pc), int(RISCV.rd(inst)),
+                                 int(RISCV.rs1(inst)) if opcode == JALR else 0)
+
+    @staticmethod
+    def marker(code):
+
+        # Acts on a region of interest marker (see roi.py) leaving WB. The
+        # trace markers affect the logs from the next cycle on.
+        if code == ROI_BEGIN:
+            Pipe.roi.start()
+        elif code == ROI_END:
+            Pipe.roi.stop()
+        elif code in [ ROI_TRACE_ON, ROI_TRACE_OFF ]:
+            Pipe.tracing = code == ROI_TRACE_ON
+            Pipe.tracer = Pipe.cpu.tracer if Pipe.tracing else None
+
     # This function is called by each stage after updating its states
     @staticmethod
     def log(stage, pc, inst, info):
 
-        if Stat.cycle < Log.start_cycle:
+        if Stat.cycle < Log.start_cycle or not Pipe.tracing:
+            return
+        if Log.writer:
+            Log.writer.put((Stat.cycle, stage, pc, inst, info))
             return
         if Log.level >= 4 and stage == S_IF:
             print("-" * 50)
         if Log.level < 5:
             info = ''
         if Log.level >= 4 or (Log.level == 3 and stage == S_WB):
-            print("%d [%s] 0x%08x: %-30s%-s" % (Stat.cycle, S[stage], pc, Program.disasm(pc, inst), info))
+            print("%d [%s] 0x%08x: %-29s %-s" % (Stat.cycle, S[stage], pc, Program.disasm(pc, inst), info))
         else:
             return
 
+    @staticmethod
+    def format_log(records):
+
+        # Formats the records queued by log(), in the writer thread
+        lines = [ ]
+        disasm = Log.writer.disasm
+        for cycle, stage, pc, inst, info in records:
+            if Log.level >= 4 and stage == S_IF:
+                lines.append("-" * 50 + "\n")
+            if Log.level < 5:
+                info = ''
+            if Log.level >= 4 or (Log.level == 3 and stage == S_WB):
+                lines.append("%d [%s] 0x%08x: %-29s %-s\n" % (cycle, S[stage], pc, disasm(pc, inst), info))
+        return ''.join(lines)
+
 
 #--------------------------------------------------------------------------
 #   IF: Instruction fetch stage
@@ -159,15 +366,15 @@ class IF(Pipe):
         # Readout pipeline register values 
         self.pc     = IF.reg_pc
 
-        # Fetch an instruction from instruction memory (imem)
-        self.inst, status = Pipe.cpu.imem.access(Pipe.CTL.imem_en, self.pc, 0, Pipe.CTL.imem_rw)
-
-        # Handle exception during imem access
-        if not status:
+        # Fetch an instruction from instruction memory (imem), which is
+        # always enabled for reads (Pipe.CTL.imem_en, Pipe.CTL.imem_rw)
+        try:
+            self.inst = WORD(Pipe.cpu.imem.load32(int(self.pc)))
+            self.exception = EXC_NONE
+        except MemoryFault:
+            # Handle exception during imem access
             self.exception = EXC_IMEM_ERROR
             self.inst = BUBBLE
-        else:
-            self.exception = EXC_NONE
 
         # Compute PC + 4 using an adder
         self.pcplus4 = Pipe.cpu.adder_pcplus4.op(self.pc, 4)
@@ -185,6 +392,7 @@ class IF(Pipe):
             IF.reg_pc           = self.pc_next
 
         if (Pipe.CTL.ID_bubble and Pipe.CTL.ID_stall):
+            Log.flush()
             print("Assert failed: ID_bubble && ID_stall")
             sys_exit()
         
@@ -537,15 +745,22 @@ class MM(Pipe):
         self.rs2_data       = MM.reg_rs2_data 
 
         # Access data memory (dmem) if needed
-        mem_data, status = Pipe.cpu.dmem.access(self.c_dmem_en, self.alu_out, self.rs2_data, self.c_dmem_rw)
-
-        # Handle exception during dmem access
-        if not status:
-            self.exception |= EXC_DMEM_ERROR
-            self.c_rf_wen   = False
+        mem_data = 0
+        if self.c_dmem_en:
+            if Pipe.intervals:
+                Pipe.intervals.pages.add(int(self.alu_out) >> PAGE_SHIFT)
+            try:
+                if self.c_dmem_rw == M_XRD:
+                    mem_data = Pipe.cpu.dmem.load32(int(self.alu_out))
+                else:
+                    Pipe.cpu.dmem.store32(int(self.alu_out), int(self.rs2_data))
+            except MemoryFault:
+                # Handle exception during dmem access
+                self.exception |= EXC_DMEM_ERROR
+                self.c_rf_wen   = False
 
         # For load instruction, we need to store the value read from dmem
-        self.wbdata         = mem_data          if self.c_wb_sel == WB_MEM  else \
+        self.wbdata         = WORD(mem_data)    if self.c_wb_sel == WB_MEM  else \
                               self.alu_out  
 
 
@@ -557,6 +772,10 @@ class MM(Pipe):
         WB.reg_rd           = self.rd
         WB.reg_c_rf_wen     = self.c_rf_wen
         WB.reg_wbdata       = self.wbdata
+        WB.reg_c_dmem_en    = self.c_dmem_en
+        WB.reg_c_dmem_rw    = self.c_dmem_rw
+        WB.reg_alu_out      = self.alu_out
+        WB.reg_rs2_data     = self.rs2_data
 
         Pipe.log(S_MM, self.pc, self.inst, self.log())
 
@@ -585,6 +804,12 @@ class WB(Pipe):
     reg_c_rf_wen        = False             # WB.reg_c_rf_wen
     reg_wbdata          = WORD(0)           # WB.reg_wbdata
 
+    # Used only for tracing memory accesses
+    reg_c_dmem_en       = False             # WB.reg_c_dmem_en
+    reg_c_dmem_rw       = WORD(M_X)         # WB.reg_c_dmem_rw
+    reg_alu_out         = WORD(0)           # WB.reg_alu_out
+    reg_rs2_data        = WORD(0)           # WB.reg_rs2_data
+
     #--------------------------------------------------
 
 
@@ -600,6 +825,10 @@ class WB(Pipe):
         self.rd                 = WB.reg_rd    
         self.c_rf_wen           = WB.reg_c_rf_wen 
         self.wbdata             = WB.reg_wbdata
+        self.c_dmem_en          = WB.reg_c_dmem_en
+        self.c_dmem_rw          = WB.reg_c_dmem_rw
+        self.alu_out            = WB.reg_alu_out
+        self.rs2_data           = WB.reg_rs2_data
 
 
     def update(self):
@@ -614,6 +843,21 @@ class WB(Pipe):
         else:
             return True
 
+    def trace(self):
+
+        # Writes the instruction leaving the pipeline to the binary trace
+        flags = TR_RF_WEN if self.c_rf_wen else 0
+        if not self.c_dmem_en:
+            mem_data = 0
+        elif self.c_dmem_rw == M_XRD:
+            flags |= TR_LOAD
+            mem_data = self.wbdata
+        else:
+            flags |= TR_STORE
+            mem_data = self.rs2_data
+        mem_addr = self.alu_out if self.c_dmem_en else 0
+        Pipe.tracer.write(Stat.cycle, self.pc, self.inst, 0, self.rd, self.wbdata, mem_addr, mem_data, flags)
+
     def log(self):
         if self.inst == BUBBLE or (not self.c_rf_wen):
             return('# -')
@@ -17,6 +17,7 @@ from elftools.elf import elffile as elf
 from consts import *
 from isa import *
 from components import *
+from symbols import *
 
 
 #--------------------------------------------------------------------------
@@ -59,6 +60,7 @@ class Program(object):
 
     def __init__(self):
         Program.asmcache = AsmCache()
+        Program.symtab = SymbolIndex()  # address -> function or object symbol
 
 
     def check_elf(self, filename, header):
@@ -100,7 +102,8 @@ class Program(object):
                 return WORD(0)
 
             entry_point = WORD(efh['e_entry'])
-            
+            Program.symtab = SymbolIndex.load(filename, ef)
+
             for seg in ef.iter_segments():
                 addr = seg.header['p_vaddr']
                 memsz = seg.header['p_memsz']
@@ -121,6 +124,13 @@ class Program(object):
                     addr += WORD_SIZE
             return entry_point
                    
+    @staticmethod
+    def target(addr):
+
+        # Annotates a branch or jump target with its symbol, as objdump does
+        name = Program.symtab.name(int(addr) & 0xffffffff)
+        return " <%s>" % name if name else ''
+
     @staticmethod
     def disasm(pc, inst):
 
@@ -167,8 +177,10 @@ class Program(object):
             asm = "%-7s%s, %d(%s)" % (opname, rname[rs2], SWORD(imm_s), rname[rs1])
         elif info[IN_TYPE] == B_TYPE:
             asm = "%-7s%s, %s, 0x%08x" % (opname, rname[rs1], rname[rs2], pc + SWORD(imm_b))
+            asm += Program.target(pc + SWORD(imm_b))
         elif info[IN_TYPE] == J_TYPE:
             asm = "%-7s%s, 0x%08x" % (opname, rname[rd], pc + SWORD(imm_j))
+            asm += Program.target(pc + SWORD(imm_j))
         elif info[IN_TYPE] == X_TYPE:
             return info[IN_NAME]
         else:
@@ -189,6 +201,26 @@ class Log(object):
     level           = 4         # default log level
     start_cycle     = 0
 
+    trace_file      = None      # binary trace output
+    trace_compression = 0       # TRACE_NONE, TRACE_ZLIB, or TRACE_LZMA
+    async_log       = True      # format logs in a background thread
+    writer          = None      # AsyncWriter in use, if any
+    callgraph_files = [ ]       # call graph outputs (callgrind or .folded)
+    line_file       = None      # source line profile output ('-' for stdout)
+    metrics_files   = [ ]       # metrics outputs (.json or Prometheus text)
+    interval        = 0         # instructions per interval of the interval stats
+    interval_files  = [ ]       # interval stats outputs (.npz or .csv)
+    heartbeat       = 0.0       # seconds between progress reports (0: off)
+    status_file     = None      # file rewritten with the progress at each report
+
+    @staticmethod
+    def flush():
+
+        # Waits until the queued logs are written so that any other output
+        # appears in the same order as with synchronous logging
+        if Log.writer:
+            Log.writer.sync()
+
 
 #--------------------------------------------------------------------------
 #   Stat: supports run-time stat collecting and printing
@@ -202,6 +234,11 @@ class Stat(object):
     inst_alu        = 0         # number of ALU instructions
     inst_mem        = 0         # number of load/store instructions
     inst_ctrl       = 0         # number of control transfer instructions
+    inst_store      = 0         # number of stores among inst_mem
+    taken_branches  = 0         # number of conditional branches taken (among flushes)
+
+    stall_cycles    = 0         # cycles IF and ID were stalled by load-use hazards
+    flushes         = 0         # mispredicted branches and jumps (IF and ID flushed)
 
     @staticmethod
     def show():
@@ -0,0 +1,99 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   Region of interest markers.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+from consts import *
+from program import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+# Markers are 'addi zero, zero, imm' instructions (HINTs in RISC-V, which
+# do nothing on real hardware) with the following immediates
+ROI_BEGIN           = 1         # starts counting the stats of the region
+ROI_END             = 2         # stops counting the stats of the region
+ROI_TRACE_ON        = 3         # resumes logs and binary traces
+ROI_TRACE_OFF       = 4         # suspends logs and binary traces
+
+ROI_MASK            = 0x000fffff    # rd, funct3, rs1 and opcode
+ROI_MATCH           = 0x00000013    # addi zero, zero, imm
+
+
+#--------------------------------------------------------------------------
+#   ROI: the stats of the regions of interest
+#--------------------------------------------------------------------------
+
+# The Stat counters are not touched: they are copied when a region begins
+# and the differences are added up when it ends, so that the simulation of
+# other instructions is unchanged. A region still open when the program
+# ends is closed by show().
+
+class ROI(object):
+
+    def __init__(self, fields):
+
+        self.fields     = fields        # Stat attributes to count
+        self.active     = False
+        self.regions    = 0             # number of regions begun
+        self.begin      = { }           # Stat values when the region began
+        self.stats      = dict.fromkeys(fields, 0)
+
+    @staticmethod
+    def marker(inst):
+
+        # Returns the immediate of a marker, or 0 for any other instruction
+        return (int(inst) >> 20) if int(inst) & ROI_MASK == ROI_MATCH else 0
+
+    def counters(self, pending):
+
+        # pending is 1 if the cycle and the instruction count of the
+        # marker are not added to Stat yet
+        values = { f: getattr(Stat, f) for f in self.fields }
+        values['cycle'] += pending
+        values['icount'] += pending
+        return values
+
+    def start(self, pending = 0):
+
+        # The region begins after the marker
+        if not self.active:
+            self.active = True
+            self.regions += 1
+            self.begin = self.counters(pending)
+
+    def stop(self, pending = 0):
+
+        # The region ends with the marker
+        if self.active:
+            self.active = False
+            end = self.counters(pending)
+            for f in self.fields:
+                self.stats[f] += end[f] - self.begin[f]
+
+    def show(self):
+
+        # Shows the stats of the regions in the same format as Stat.show()
+        if not self.regions:
+            return
+        self.stop()
+        print("Region of interest (%d region%s):" % (self.regions, 's' if self.regions > 1 else ''))
+        total = { f: getattr(Stat, f) for f in self.fields }
+        for f in self.fields:
+            setattr(Stat, f, self.stats[f])
+        Stat.show()
+        for f in self.fields:
+            setattr(Stat, f, total[f])
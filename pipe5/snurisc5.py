@@ -16,6 +16,7 @@
 #==========================================================================
 
 import sys
+import os
 
 from consts import *
 from isa import *
@@ -23,6 +24,13 @@ from components import *
 from program import *
 from datapath import *
 from control import *
+from bintrace import *
+from callgraph import *
+from lines import *
+from metrics import *
+from heartbeat import *
+from roi import *
+from intervals import *
 
 
 #--------------------------------------------------------------------------
@@ -47,9 +55,18 @@ class SNURISC5(object):
 
     def __init__(self):
 
-        stages = [ IF(), ID(), EX(), MM(), WB() ]
+        self.tracer = TraceWriter(Log.trace_file, Log.trace_compression, TRACE_PIPE5) if Log.trace_file else None
+        self.callgraph = None
+        self.metrics = None
+        self.intervals = None
+        self.heartbeat = None
+        self.roi = ROI(STAT_FIELDS)
+        if Log.heartbeat or Log.status_file:
+            self.heartbeat = Heartbeat(lambda: (Stat.icount, IF.reg_pc),
+                                       Log.heartbeat or HEARTBEAT_INTERVAL, Log.status_file, Log.heartbeat > 0)
+        self.stages = [ IF(), ID(), EX(), MM(), WB() ]
         self.ctl = Control()
-        Pipe.set_stages(self, stages, self.ctl)
+        Pipe.set_stages(self, self.stages, self.ctl)
        
         self.rf = RegisterFile()
         self.alu = ALU()
@@ -59,7 +76,28 @@ class SNURISC5(object):
         self.adder_pcplus4 = Adder()
 
     def run(self, entry_point):
+        if Log.callgraph_files:
+            self.callgraph = CallGraph([ 'Ir', 'Cycle' ], int(entry_point), (Stat.icount, Stat.cycle))
+        if self.metrics:
+            self.metrics.start()
+        if self.heartbeat:
+            self.heartbeat.start()
         Pipe.run(entry_point)
+        if self.heartbeat:
+            self.heartbeat.stop()
+        if self.metrics:
+            self.metrics.stop()
+
+    def write_metrics(self):
+
+        m = self.metrics
+        m.collect()
+        m.add_labeled('pipeline_events_total', 'counter', 'Load-use stall cycles and branch/jump flushes',
+                      'event', { 'load_use_stall_cycles': Stat.stall_cycles, 'flushes': Stat.flushes })
+        m.add_labeled('guest_memory_bytes', 'gauge', 'Guest memory allocated by the simulator', 'memory',
+                      { 'imem': int(self.imem.mem_end - self.imem.mem_start),
+                        'dmem': int(self.dmem.mem_end - self.dmem.mem_start) })
+        m.write(Log.metrics_files)
 
 
 #--------------------------------------------------------------------------
@@ -68,7 +106,7 @@ class SNURISC5(object):
 
 def show_usage(name):
     print("SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator in Python")
-    print("Usage: %s [-l n] [-c m] filename" % name)
+    print("Usage: %s [-l n] [-c m] [-t file] [-z none|zlib|lzma] [-a a] [-C file] [-L file] [-M file] [-I file] [-i n] [-H T] [-S file] filename" % name)
     print("\tfilename: RISC-V executable file name")
     print("\t-l sets the desired log level n (default: 4)")
     print("\t   0: shows no output message")
@@ -80,10 +118,20 @@ def show_usage(name):
     print("\t   6: 5 + dumps registers for each cycle")
     print("\t   7: 6 + dumps data memory for each cycle")
     print("\t-c shows logs after cycle m (default: 0, only effective for log level 3 or higher)")
+    print("\t-t writes a binary trace of the instructions leaving the WB stage to the file (see bintrace.py)")
+    print("\t-z sets the compression of the binary trace (default: none)")
+    print("\t-a formats the logs of level 3 to 5 in a background thread (default: 1, 0 to disable)")
+    print("\t-L writes the instructions, cycles, and stall cycles per source line and annotated sources to the file ('-' for stdout)")
+    print("\t-M writes run metrics (wall time, MIPS, instruction mix, pipeline stalls and flushes) as JSON if file ends with .json, or in the Prometheus text format, can be repeated")
+    print("\t-I writes the instruction mix, loads, stores, taken branches, data pages touched, CPI, and stalls per interval as CSV if file ends with .csv, or as NumPy arrays (.npz), can be repeated")
+    print("\t-i sets the number of instructions per interval of -I (default: %d)" % INTERVAL_LENGTH)
+    print("\t-H prints the instruction count, PC, and MIPS to stderr every T seconds")
+    print("\t-S rewrites the file with the same progress report as JSON at every report (every 10 seconds unless -H is given)")
+    print("\t-C writes a call graph profile in callgrind format, or as folded stacks if file ends with .folded, can be repeated")
 
 
 def parse_args(args):
-    if (not len(args) in [ 2, 4, 6 ]):
+    if len(args) < 2 or len(args) % 2 != 0:
         return None
 
     index = 1
@@ -107,6 +155,55 @@ def parse_args(args):
                     return None
                 index += 2
                 Log.start_cycle = cycle
+            elif args[index] == '-a':
+                try:
+                    async_log = int(args[index + 1])
+                except ValueError:
+                    async_log = 1
+                index += 2
+                Log.async_log = (async_log != 0)
+            elif args[index] == '-t':
+                Log.trace_file = args[index + 1]
+                index += 2
+            elif args[index] == '-z':
+                if args[index + 1] not in TRACE_COMPRESSION:
+                    print("Invalid trace compression '%s'" % args[index + 1])
+                    return None
+                Log.trace_compression = TRACE_COMPRESSION[args[index + 1]]
+                index += 2
+            elif args[index] == '-L':
+                Log.line_file = args[index + 1]
+                index += 2
+            elif args[index] == '-C':
+                Log.callgraph_files.append(args[index + 1])
+                index += 2
+            elif args[index] == '-M':
+                Log.metrics_files.append(args[index + 1])
+                index += 2
+            elif args[index] == '-I':
+                Log.interval_files.append(args[index + 1])
+                index += 2
+            elif args[index] == '-i':
+                try:
+                    Log.interval = int(args[index + 1])
+                except ValueError:
+                    Log.interval = 0
+                if Log.interval <= 0:
+                    print("Invalid interval '%s'" % args[index + 1])
+                    return None
+                index += 2
+            elif args[index] == '-H':
+                try:
+                    Log.heartbeat = float(args[index + 1])
+                except ValueError:
+                    Log.heartbeat = -1
+                if Log.heartbeat <= 0:
+                    print("Invalid heartbeat interval '%s'" % args[index + 1])
+                    return None
+                index += 2
+            elif args[index] == '-S':
+                Log.status_file = args[index + 1]
+                index += 2
             else:
                 print("Invalid option '%s'" % args[index])
                 return None
@@ -120,6 +217,19 @@ def parse_args(args):
     return args[index]      # executable file name
 
 
+def show_lines(filename):
+
+    hists = [ Pipe.pc_insts, Pipe.pc_cycles, Pipe.pc_cycles - Pipe.pc_insts ]
+    events = [ 'Ir', 'Cycle', 'Stall' ]
+    search = [ '.', os.path.dirname(filename) ]
+    table = LineTable.load(filename)
+    if Log.line_file == '-':
+        table.listing(Pipe.pc_base, hists, events, sys.stdout, search)
+    else:
+        with open(Log.line_file, 'w') as out:
+            table.listing(Pipe.pc_base, hists, events, out, search)
+
+
 #--------------------------------------------------------------------------
 #   Simulator main
 #--------------------------------------------------------------------------
@@ -136,8 +246,21 @@ def main():
     entry_point = prog.load(cpu, filename)  # load a program
     if not entry_point:                     # if no entry point, exit
         sys.exit()
+    if Log.metrics_files:                   # collect metrics during the run
+        cpu.metrics = Metrics('snurisc5', filename)
+    if Log.interval_files:                  # sample the stats every interval
+        cpu.intervals = IntervalStats(Log.interval or INTERVAL_LENGTH)
     cpu.run(entry_point)                    # run the program starting from entry_point
     Stat.show()                             # show stats
+    cpu.roi.show()                          # show stats of the regions of interest, if any
+    if cpu.callgraph:                       # write the call graph profile
+        cpu.callgraph.write(Log.callgraph_files, filename, Program.symtab)
+    if Log.line_file:                       # write the source line profile
+        show_lines(filename)
+    if cpu.metrics:                         # write the metrics
+        cpu.write_metrics()
+    if cpu.intervals:                       # write the interval stats
+        cpu.intervals.write(Log.interval_files)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,141 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC5: A 5-stage Pipelined RISC-V ISA Simulator
+#
+#   ELF symbol index for address-to-symbol lookups.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import os
+import bisect
+
+import numpy as np
+from elftools.elf import elffile as elf
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+# Of the symbols at the same address, the one of the highest rank is kept.
+# Untyped symbols are labels in assembly programs.
+SYMBOL_RANK         = { 'STT_FUNC': 2, 'STT_OBJECT': 2, 'STT_NOTYPE': 1 }
+
+SYMBOL_DTYPE        = np.dtype([ ('start',      np.uint32),
+                                 ('size',       np.uint32),
+                                 ('name',       np.int32) ])
+
+
+#--------------------------------------------------------------------------
+#   SymbolIndex: sorted table of the function and object symbols
+#--------------------------------------------------------------------------
+
+# The table is sorted by address, and each entry covers [start, end) where
+# end is start + size, or the next symbol for a symbol without a size.
+# A single address is looked up with bisect on a list of the start
+# addresses, and arrays of addresses (e.g. histogram bins) with
+# np.searchsorted. 'symbols' maps the name of every defined symbol to its
+# address, for the options that take symbol names. Indexes are cached per
+# ELF file, so the symbol table of a file is parsed only once.
+
+class SymbolIndex(object):
+
+    cache = { }         # (path, mtime, size) -> SymbolIndex
+
+    def __init__(self, entries = (), symbols = None):
+
+        # entries: iterable of (name, start, size, rank)
+        self.symbols = symbols if symbols is not None else { }
+        best = { }
+        for name, start, size, rank in entries:
+            old = best.get(start)
+            if old is None or (rank, size) > (old[3], old[2]):
+                best[start] = (name, start, size, rank)
+        rows = sorted(best.values(), key = lambda e: e[1])
+        self.names  = [ name for name, start, size, rank in rows ]
+        self.table  = np.array([ (start, size, i) for i, (name, start, size, rank) in enumerate(rows) ],
+                               dtype = SYMBOL_DTYPE)
+        starts      = self.table['start'].astype(np.int64)
+        ends        = starts + self.table['size']
+        nexts       = np.append(starts[1:], starts[-1:] + 4) if len(starts) else starts
+        self.starts = starts
+        self.ends   = np.where(self.table['size'] > 0, ends, nexts)
+        self.start_list = starts.tolist()
+        self.end_list   = self.ends.tolist()
+        self.index  = { name: i for i, name in enumerate(self.names) }
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def from_elf(ef):
+
+        symtab = ef.get_section_by_name('.symtab')
+        if symtab is None:
+            return SymbolIndex()
+        entries = [ ]
+        symbols = { }
+        for sym in symtab.iter_symbols():
+            if not sym.name or sym['st_shndx'] == 'SHN_UNDEF':
+                continue
+            symbols[sym.name] = sym['st_value']
+            if sym['st_info']['type'] in SYMBOL_RANK:
+                entries.append((sym.name, sym['st_value'], sym['st_size'], SYMBOL_RANK[sym['st_info']['type']]))
+        return SymbolIndex(entries, symbols)
+
+    @staticmethod
+    def load(filename, ef = None):
+
+        st = os.stat(filename)
+        key = (os.path.realpath(filename), st.st_mtime_ns, st.st_size)
+        index = SymbolIndex.cache.get(key)
+        if index is None:
+            if ef is None:
+                with open(filename, 'rb') as f:
+                    index = SymbolIndex.from_elf(elf.ELFFile(f))
+            else:
+                index = SymbolIndex.from_elf(ef)
+            SymbolIndex.cache[key] = index
+        return index
+
+    def lookup(self, addr):
+
+        # Returns the index of the symbol covering addr, or -1
+        i = bisect.bisect_right(self.start_list, addr) - 1
+        if i >= 0 and addr < self.end_list[i]:
+            return i
+        return -1
+
+    def find(self, addrs):
+
+        # Vectorized lookup(): returns an array of indexes (-1 if none)
+        addrs = np.asarray(addrs, dtype = np.int64)
+        i = np.searchsorted(self.starts, addrs, side = 'right') - 1
+        ok = (i >= 0) & (addrs < self.ends[np.maximum(i, 0)]) if len(self) else np.zeros(len(addrs), dtype = bool)
+        return np.where(ok, i, -1)
+
+    def name(self, addr):
+
+        # Returns 'symbol' or 'symbol+offset' for addr, or None
+        i = self.lookup(int(addr))
+        if i < 0:
+            return None
+        offset = int(addr) - self.start_list[i]
+        return self.names[i] if offset == 0 else "%s+0x%x" % (self.names[i], offset)
+
+    def range(self, i):
+        return self.start_list[i], self.end_list[i]
+
+    def size(self, name):
+
+        # Returns the size of the symbol, or 0 if it has none
+        i = self.index.get(name)
+        return int(self.table['size'][i]) if i is not None else 0
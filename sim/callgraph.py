@@ -0,0 +1,182 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Call-graph profiler based on a shadow call stack.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+from consts import *
+from program import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+# A jal/jalr that writes ra (x1) or t0 (x5) is a call, and a jalr x0
+# through one of them is a return (RISC-V calling convention hints)
+LINK_REGS           = [ 1, 5 ]
+
+
+#--------------------------------------------------------------------------
+#   CallGraph: inclusive and exclusive costs per function and call site
+#--------------------------------------------------------------------------
+
+# The simulator reports every jal/jalr with its target and the current
+# values of the cost counters ('now', one per event: instructions for
+# snurisc, instructions and cycles for snurisc5). The costs between two
+# reports are charged to the function on top of the shadow stack and to
+# the whole stack path (for folded stacks). A function is identified by
+# the address it was called at, and is named after the symbol there.
+
+class CallGraph(object):
+
+    def __init__(self, events, root, now):
+
+        self.events     = events
+        self.zero       = [ 0 ] * len(events)
+        self.stack      = [ ]       # (caller, path, call site, return address, costs at the call)
+        self.func       = root      # function running now
+        self.path       = (root,)   # functions on the stack, outermost first
+        self.begin      = now       # costs when profiling started
+        self.last       = now
+        self.exclusive  = { }       # function -> costs
+        self.inclusive  = { }       # function -> costs, not counting recursive calls twice
+        self.calls      = { }       # (caller, call site, callee) -> [count, costs]
+        self.folded     = { }       # path -> costs
+        self.active     = { root: 1 }   # function -> frames on the stack
+
+    @staticmethod
+    def add(table, key, delta):
+        costs = table.get(key)
+        if costs is None:
+            table[key] = list(delta)
+        else:
+            for i in range(len(delta)):
+                costs[i] += delta[i]
+
+    def switch(self, now):
+
+        # Charges the costs since the last switch to the running function
+        delta = [ n - l for n, l in zip(now, self.last) ]
+        self.add(self.exclusive, self.func, delta)
+        self.add(self.folded, self.path, delta)
+        self.last = now
+
+    def transfer(self, pc, rd, rs1, target, now):
+
+        # Called for a jal (with rs1 = 0) or jalr instruction at pc
+        if rd in LINK_REGS:
+            self.call(pc, target, now)
+        elif rd == 0 and rs1 in LINK_REGS:
+            self.ret(target, now)
+
+    def call(self, pc, target, now):
+
+        self.switch(now)
+        self.stack.append((self.func, self.path, pc, pc + 4, now))
+        self.func = target
+        self.path = self.path + (target,)
+        self.active[target] = self.active.get(target, 0) + 1
+
+    def ret(self, target, now):
+
+        # Pops the frames up to the one returning to target; a return to
+        # an address not on the stack (e.g. longjmp) is ignored
+        for depth in range(len(self.stack) - 1, -1, -1):
+            if self.stack[depth][3] == target:
+                break
+        else:
+            return
+        self.switch(now)
+        while len(self.stack) > depth:
+            self.pop(now)
+
+    def pop(self, now):
+
+        caller, path, site, ret_addr, start = self.stack.pop()
+        cost = [ n - s for n, s in zip(now, start) ]
+        call = self.calls.setdefault((caller, site, self.func), [ 0, list(self.zero) ])
+        call[0] += 1
+        for i in range(len(cost)):
+            call[1][i] += cost[i]
+        self.active[self.func] -= 1
+        if not self.active[self.func]:
+            self.add(self.inclusive, self.func, cost)
+        self.func = caller
+        self.path = path
+
+    def finish(self, now):
+
+        # Unwinds the frames still on the stack at the end of the run
+        self.switch(now)
+        while self.stack:
+            self.pop(now)
+        self.add(self.inclusive, self.func, [ n - b for n, b in zip(now, self.begin) ])
+
+    def report(self, name, limit = 20):
+
+        # Prints the functions with the largest inclusive costs
+        print("Call graph: %d functions, %d call sites" % (len(self.exclusive), len(self.calls)))
+        print("%s  function" % '  '.join("%12s %12s" % ("incl " + e, "excl " + e) for e in self.events))
+        funcs = sorted(self.inclusive.items(), key = lambda f: -f[1][-1])[:limit]
+        for func, incl in funcs:
+            excl = self.exclusive.get(func, self.zero)
+            print("%s  %s" % ('  '.join("%12d %12d" % (i, e) for i, e in zip(incl, excl)), name(func)))
+
+    def write_callgrind(self, filename, cmd, name):
+
+        # Callgrind format with the exclusive costs at the function
+        # address and the inclusive costs of the calls at the call sites
+        ids = { }
+        def ref(prefix, func):
+            if func in ids:
+                return "%s=(%d)" % (prefix, ids[func])
+            ids[func] = len(ids) + 1
+            return "%s=(%d) %s" % (prefix, ids[func], name(func))
+        total = [ 0 ] * len(self.events)
+        for costs in self.exclusive.values():
+            for i, c in enumerate(costs):
+                total[i] += c
+        callees = { }
+        for (caller, site, callee), (count, costs) in self.calls.items():
+            callees.setdefault(caller, [ ]).append((site, callee, count, costs))
+        with open(filename, 'w') as f:
+            f.write("# callgrind format\nversion: 1\ncreator: snurisc\n")
+            f.write("cmd: %s\npositions: instr\nevents: %s\n" % (cmd, ' '.join(self.events)))
+            f.write("summary: %s\n" % ' '.join(str(c) for c in total))
+            for func in sorted(set(self.exclusive) | set(callees)):
+                f.write("\n%s\n" % ref('fn', func))
+                f.write("0x%x %s\n" % (func, ' '.join(str(c) for c in self.exclusive.get(func, self.zero))))
+                for site, callee, count, costs in sorted(callees.get(func, [ ])):
+                    f.write("%s\n" % ref('cfn', callee))
+                    f.write("calls=%d 0x%x\n" % (count, callee))
+                    f.write("0x%x %s\n" % (site, ' '.join(str(c) for c in costs)))
+
+    def write_folded(self, filename, name):
+
+        # One line per stack path with its exclusive cost of the last event
+        with open(filename, 'w') as f:
+            for path, costs in sorted(self.folded.items()):
+                if costs[-1]:
+                    f.write("%s %d\n" % (';'.join(name(func) for func in path), costs[-1]))
+
+    def write(self, filenames, cmd, symtab):
+
+        # Files ending with '.folded' get folded stacks, others callgrind
+        name = lambda addr: symtab.name(addr) or "0x%08x" % addr
+        for filename in filenames:
+            if filename.endswith('.folded'):
+                self.write_folded(filename, name)
+            else:
+                self.write_callgrind(filename, cmd, name)
+        self.report(name)
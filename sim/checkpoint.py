@@ -0,0 +1,122 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Checkpoints of the complete machine state.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import os
+import json
+import fcntl
+
+import numpy as np
+
+from consts import *
+from components import *
+from program import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+CHECKPOINT_VERSION  = 1
+
+STAT_FIELDS         = [ 'cycle', 'icount', 'inst_alu', 'inst_mem', 'inst_ctrl', 'inst_store', 'taken_branches',
+                        'itlb_access', 'itlb_miss', 'dtlb_access', 'dtlb_miss' ]
+KERNEL_FIELDS       = [ 'brk_start', 'brk', 'mmap_top', 'exit_code' ]
+
+
+#--------------------------------------------------------------------------
+#   Checkpoint: saves and restores a SNURISC machine
+#--------------------------------------------------------------------------
+
+# A checkpoint is a NumPy .npz file with the PC, the register file, the
+# CSRs, every memory (imem, dmem, the boot ROM and the pages of the paged
+# memory), and a JSON header with the proxy kernel state, the files the
+# program has open (host path, flags and offset), and the Stat counters.
+# The executable file itself is not included: it is loaded again for its
+# symbols when the checkpoint is restored.
+
+class Checkpoint(object):
+
+    @staticmethod
+    def save(cpu, filename):
+
+        kernel = cpu.kernel
+        files = [ ]
+        for fd, path in kernel.files.paths.items():
+            if path is None:
+                continue                    # stdin, stdout, stderr
+            hfd = kernel.files.fds[fd]
+            files.append((fd, path, fcntl.fcntl(hfd, fcntl.F_GETFL), os.lseek(hfd, 0, os.SEEK_CUR)))
+        csrs = { name: int(reg.read()) for name, reg in vars(cpu.prv_regs).items()
+                 if isinstance(reg, Register) }
+        pages = cpu.vmem.pages
+        vpns = sorted(pages.pages)
+        meta = { 'version': CHECKPOINT_VERSION, 'program': os.path.abspath(cpu.filename),
+                 'vmem': Log.vmem_activate, 'kernel': Log.kernel_activate, 'prv': int(cpu.prv),
+                 'csrs': csrs, 'files': files,
+                 'stat': { f: getattr(Stat, f) for f in STAT_FIELDS },
+                 'state': { f: int(getattr(kernel, f)) for f in KERNEL_FIELDS },
+                 'syscalls': list(kernel.calls.items()),
+                 'mapped': [ [ int(a) for a in pages.starts ], [ int(a) for a in pages.ends ] ] }
+        frames = np.stack([ pages.pages[vpn] for vpn in vpns ]) if vpns else \
+                 np.zeros((0, pages.page_words), dtype = WORD)
+        np.savez_compressed(filename, meta = np.array(json.dumps(meta)),
+                            pc = np.array(cpu.pc.read(), dtype = WORD), regs = cpu.regs.reg,
+                            imem = cpu.imem.mem, dmem = cpu.dmem.mem, rstvec = cpu.rstvec.mem,
+                            vpns = np.array(vpns, dtype = np.int64), frames = frames)
+
+    @staticmethod
+    def restore(cpu, filename):
+
+        # Returns the PC to resume from, or None if the checkpoint does
+        # not belong to the program
+        with np.load(filename) as data:
+            meta = json.loads(str(data['meta']))
+            if meta['version'] != CHECKPOINT_VERSION or \
+               os.path.basename(meta['program']) != os.path.basename(cpu.filename):
+                print("Checkpoint '%s' was not taken from '%s'" % (filename, cpu.filename))
+                return None
+            if (meta['vmem'], meta['kernel']) != (Log.vmem_activate, Log.kernel_activate):
+                print("Checkpoint '%s' was taken with different -v and -k options" % filename)
+                return None
+            cpu.regs.reg[:] = data['regs']
+            cpu.imem.mem[:] = data['imem']
+            cpu.dmem.mem[:] = data['dmem']
+            cpu.rstvec.mem[:] = data['rstvec']
+            pages = cpu.vmem.pages
+            pages.starts, pages.ends = meta['mapped']
+            pages.pages = { int(vpn): frame.copy() for vpn, frame in zip(data['vpns'], data['frames']) }
+            pc = WORD(data['pc'])
+
+        cpu.prv = meta['prv']
+        for name, value in meta['csrs'].items():
+            getattr(cpu.prv_regs, name).write(value)
+        kernel = cpu.kernel
+        for f, value in meta['state'].items():
+            setattr(kernel, f, value)
+        kernel.calls = { n: c for n, c in meta['syscalls'] }
+        for fd, path, flags, offset in meta['files']:
+            try:
+                hfd = os.open(path, flags & (os.O_ACCMODE | os.O_APPEND))
+            except OSError as e:
+                print("Cannot reopen '%s' for fd %d: %s" % (path, fd, e.strerror))
+                continue
+            os.lseek(hfd, offset, os.SEEK_SET)
+            kernel.files.fds[fd] = hfd
+            kernel.files.paths[fd] = path
+        for f, value in meta['stat'].items():
+            setattr(Stat, f, value)
+        cpu.mmu.update()
+        return pc
@@ -14,6 +14,9 @@
 #==========================================================================
 
 
+import bisect
+from multiprocessing import shared_memory
+
 from consts import *
 from isa import *
 
@@ -95,10 +98,30 @@ class Register(object):
         self.r = WORD(val)
 
 
+#--------------------------------------------------------------------------
+#   MemoryFault: raised by the load and store methods of the memories
+#--------------------------------------------------------------------------
+
+# Loads and stores return plain ints and report an address that does not
+# belong to the memory, or that is not aligned to the access size, by
+# raising MEM_FAULT. The instance is created once, so that no object is
+# allocated on any path; it is raised with its traceback cleared, which
+# would otherwise grow with every raise.
+
+class MemoryFault(Exception):
+    pass
+
+MEM_FAULT           = MemoryFault()
+
+
 #--------------------------------------------------------------------------
 #   Memory: models a memory
 #--------------------------------------------------------------------------
 
+# The load and store methods assume 32-bit words and a little-endian host.
+# Loads of halfwords and bytes are zero-extended; stores write the low bits
+# of the value. The old access() interface is kept as a wrapper around them.
+
 class Memory(object):
 
     def __init__(self, mem_start, mem_size, word_size):
@@ -108,23 +131,107 @@ class Memory(object):
         self.mem_start  = mem_start
         self.mem_end    = mem_start + mem_size
         self.mem        = WORD([0] * self.mem_words)
+        self.start      = int(mem_start)        # plain ints for the hot paths
+        self.size       = int(mem_size)
+        self.set_views()
+
+    def set_views(self):
+
+        # Halfwords and bytes are read and written through views, so that
+        # a store never rewrites the other bytes of its word
+        self.mem16      = self.mem.view(np.uint16)
+        self.mem8       = self.mem.view(np.uint8)
+
+    def share(self):
+
+        # Moves the words to a new shared memory segment, which stays mapped
+        # in the processes forked afterwards, and returns the segment
+        shm = shared_memory.SharedMemory(create = True, size = self.mem.nbytes)
+        mem = np.ndarray(self.mem.shape, dtype = WORD, buffer = shm.buf)
+        mem[:] = self.mem
+        self.mem = mem
+        self.set_views()
+        return shm
+
+    def holds(self, addr):
+        return 0 <= addr - self.start < self.size
+
+    def frame(self, addr):
+
+        # Returns the words of the page holding addr as a view, or None if
+        # the page is not entirely in this memory
+        i = (addr & ~(PAGE_SIZE - 1)) - self.start
+        if i < 0 or i + PAGE_SIZE > self.size:
+            return None
+        return self.mem[i >> 2:(i + PAGE_SIZE) >> 2]
+
+    def load32(self, addr):
+
+        i = addr - self.start
+        if i < 0 or i >= self.size or i & 3:
+            raise MEM_FAULT.with_traceback(None)
+        return self.mem.item(i >> 2)
+
+    def load16(self, addr):
+
+        i = addr - self.start
+        if i < 0 or i >= self.size or i & 1:
+            raise MEM_FAULT.with_traceback(None)
+        return self.mem16.item(i >> 1)
+
+    def load8(self, addr):
+
+        i = addr - self.start
+        if i < 0 or i >= self.size:
+            raise MEM_FAULT.with_traceback(None)
+        return self.mem8.item(i)
+
+    def store32(self, addr, value):
+
+        i = addr - self.start
+        if i < 0 or i >= self.size or i & 3:
+            raise MEM_FAULT.with_traceback(None)
+        self.mem[i >> 2] = value & 0xffffffff
+
+    def store16(self, addr, value):
+
+        i = addr - self.start
+        if i < 0 or i >= self.size or i & 1:
+            raise MEM_FAULT.with_traceback(None)
+        self.mem16[i >> 1] = value & 0xffff
+
+    def store8(self, addr, value):
+
+        i = addr - self.start
+        if i < 0 or i >= self.size:
+            raise MEM_FAULT.with_traceback(None)
+        self.mem8[i] = value & 0xff
 
     def access(self, valid, addr, data, fcn):
 
-        if (not valid):                    
-            res = [ WORD(0), True ]
-        elif (WORD(addr) < self.mem_start) or (WORD(addr) > self.mem_end) or \
-            addr % self.word_size != 0:
-            res = [ WORD(0) , False ]
-        elif fcn == M_XRD:
-            val = self.mem[(addr - self.mem_start) // self.word_size]
-            res = [ val, True ]
-        elif fcn == M_XWR:
-            self.mem[(addr - self.mem_start) // self.word_size] = WORD(data) 
-            res = [ WORD(0), True ]
-        else:
-            res = [ WORD(0), False ]
-        return res
+        if (not valid):
+            return [ WORD(0), True ]
+        try:
+            if fcn == M_XRD:
+                return [ WORD(self.load32(int(addr))), True ]
+            elif fcn == M_XWR:
+                self.store32(int(addr), int(data))
+                return [ WORD(0), True ]
+        except MemoryFault:
+            pass
+        return [ WORD(0), False ]
+
+    def view(self, addr, size):
+
+        # Returns a writable byte view of at most size bytes starting at addr
+        # which shares storage with the memory (no copy), or None if addr
+        # does not belong to this memory
+        start = int(self.mem_start)
+        end = int(self.mem_end)
+        if addr < start or addr >= end:
+            return None
+        offset = addr - start
+        return self.mem.view(np.uint8)[offset:offset + min(size, end - addr)]
 
     def dump(self, skipzero = False):
 
@@ -138,4 +245,153 @@ class Memory(object):
                 print("0x%08x: " % a, ' '.join("%02x" % ((val >> i) & 0xff) for i in [0, 8, 16, 24]), " (0x%08x)" % val)
 
 
+#--------------------------------------------------------------------------
+#   PagedMemory: models a sparse memory with demand-allocated pages
+#--------------------------------------------------------------------------
+
+# Address ranges are mapped with map() and unmapped with unmap(), but no
+# storage is allocated until a page is accessed for the first time. Hence
+# the memory cost is proportional to the number of pages actually touched.
+
+class PagedMemory(object):
+
+    def __init__(self, word_size):
+
+        self.word_size  = word_size
+        self.page_words = PAGE_SIZE // word_size
+        self.pages      = { }       # page number -> page frame
+        self.starts     = [ ]       # sorted start addresses of mapped ranges
+        self.ends       = [ ]       # corresponding end addresses
+
+    def mapped(self, addr):
+
+        i = bisect.bisect_right(self.starts, addr) - 1
+        return i >= 0 and addr < self.ends[i]
+
+    def map(self, start, end):
+
+        # Merge [start, end) with any overlapping or adjacent ranges
+        i = bisect.bisect_left(self.ends, start)
+        j = bisect.bisect_right(self.starts, end)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [ start ]
+        self.ends[i:j] = [ end ]
+
+    def unmap(self, start, end):
+
+        starts, ends = [ ], [ ]
+        for s, e in zip(self.starts, self.ends):
+            if e <= start or s >= end:
+                starts.append(s)
+                ends.append(e)
+                continue
+            if s < start:
+                starts.append(s)
+                ends.append(start)
+            if e > end:
+                starts.append(end)
+                ends.append(e)
+        self.starts, self.ends = starts, ends
+        for vpn in range(start >> PAGE_SHIFT, (end + PAGE_SIZE - 1) >> PAGE_SHIFT):
+            if vpn in self.pages and not self.mapped(vpn << PAGE_SHIFT):
+                del self.pages[vpn]
+
+    def frame(self, addr):
+
+        # Returns the page frame for addr, allocating it on the first touch
+        vpn = addr >> PAGE_SHIFT
+        page = self.pages.get(vpn)
+        if page is None and self.mapped(addr):
+            page = np.zeros(self.page_words, dtype = WORD)
+            self.pages[vpn] = page
+        return page
+
+    def holds(self, addr):
+        return (addr >> PAGE_SHIFT) in self.pages or self.mapped(addr)
+
+    def page(self, addr):
+
+        # The page frame for the fast paths, which see allocated pages
+        page = self.pages.get(addr >> PAGE_SHIFT)
+        if page is None:
+            page = self.frame(addr)
+            if page is None:
+                raise MEM_FAULT.with_traceback(None)
+        return page
+
+    def load32(self, addr):
+
+        if addr & 3:
+            raise MEM_FAULT.with_traceback(None)
+        return self.page(addr).item((addr & (PAGE_SIZE - 1)) >> 2)
+
+    def load16(self, addr):
 
+        if addr & 1:
+            raise MEM_FAULT.with_traceback(None)
+        return (self.page(addr).item((addr & (PAGE_SIZE - 1)) >> 2) >> ((addr & 2) << 3)) & 0xffff
+
+    def load8(self, addr):
+        return (self.page(addr).item((addr & (PAGE_SIZE - 1)) >> 2) >> ((addr & 3) << 3)) & 0xff
+
+    def store32(self, addr, value):
+
+        if addr & 3:
+            raise MEM_FAULT.with_traceback(None)
+        self.page(addr)[(addr & (PAGE_SIZE - 1)) >> 2] = value & 0xffffffff
+
+    def store16(self, addr, value):
+
+        if addr & 1:
+            raise MEM_FAULT.with_traceback(None)
+        page = self.page(addr)
+        shift = (addr & 2) << 3
+        w = (addr & (PAGE_SIZE - 1)) >> 2
+        page[w] = (page.item(w) & ~(0xffff << shift)) | ((value & 0xffff) << shift)
+
+    def store8(self, addr, value):
+
+        page = self.page(addr)
+        shift = (addr & 3) << 3
+        w = (addr & (PAGE_SIZE - 1)) >> 2
+        page[w] = (page.item(w) & ~(0xff << shift)) | ((value & 0xff) << shift)
+
+    def access(self, valid, addr, data, fcn):
+
+        if (not valid):
+            return [ WORD(0), True ]
+        try:
+            if fcn == M_XRD:
+                return [ WORD(self.load32(int(addr))), True ]
+            elif fcn == M_XWR:
+                self.store32(int(addr), int(data))
+                return [ WORD(0), True ]
+        except MemoryFault:
+            pass
+        return [ WORD(0), False ]
+
+    def view(self, addr, size):
+
+        page = self.frame(addr)
+        if page is None:
+            return None
+        offset = addr & (PAGE_SIZE - 1)
+        return page.view(np.uint8)[offset:offset + min(size, PAGE_SIZE - offset)]
+
+    def footprint(self):
+        return len(self.pages) * PAGE_SIZE
+
+    def dump(self, skipzero = False):
+
+        for vpn in sorted(self.pages):
+            page = self.pages[vpn]
+            if skipzero and not page.any():
+                continue
+            start = vpn << PAGE_SHIFT
+            print("Page 0x%08x - 0x%08x" % (start, start + PAGE_SIZE - 1))
+            print("=" * 30)
+            for i, val in enumerate(page):
+                if (not skipzero) or (val != 0):
+                    print("0x%08x: " % (start + i * self.word_size), ' '.join("%02x" % ((val >> b) & 0xff) for b in [0, 8, 16, 24]), " (0x%08x)" % val)
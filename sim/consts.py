@@ -87,6 +87,7 @@ J_TYPE              = 7
 X_TYPE              = 8
 P_TYPE              = 9     # Privileged instructions
 PI_TYPE             = 10    # Privileged instruction with zero-extended immediate
+A_TYPE              = 11    # Atomic memory operations: rd, rs2, (rs1)
 
 
 #--------------------------------------------------------------------------
@@ -140,6 +141,7 @@ ALU_SLT             = 9
 ALU_SLTU            = 10
 MEM_LD              = 11
 MEM_ST              = 12
+MEM_AMO             = 13        # lr.w, sc.w, and amo*.w
 
 
 #--------------------------------------------------------------------------
@@ -167,12 +169,22 @@ EXC_ILLEGAL_INST    = 4
 EXC_FIN             = 8
 EXC_FENCE           = 16
 EXC_OS_ERROR        = 32
+EXC_INTERRUPT       = 64        # stopped by SIGINT
+EXC_PENDING         = 128       # a signal is pending (handled by Sim.execute)
 
 EXC_MSG = {         EXC_IMEM_ERROR:     "imem access error", 
                     EXC_DMEM_ERROR:     "dmem access error",
                     EXC_ILLEGAL_INST:   "illegal instruction",
 }
 
+#--------------------------------------------------------------------------
+#   Signals pending for the simulation loop (Sim.pending)
+#--------------------------------------------------------------------------
+
+PENDING_DUMP        = 1         # SIGUSR1: dump the state and continue
+PENDING_CHECKPOINT  = 2         # SIGUSR2: write a checkpoint and continue
+PENDING_STOP        = 4         # SIGINT: stop the run
+
 #--------------------------------------------------------------------------
 #   Privilege level
 #--------------------------------------------------------------------------
@@ -182,6 +194,36 @@ PRV_S               = 1
 PRV_H               = 2
 PRV_M               = 3
 
+#--------------------------------------------------------------------------
+#   Sv32 virtual memory
+#--------------------------------------------------------------------------
+
+SATP_MODE_SV32      = 0x80000000
+SATP_PPN_MASK       = 0x003fffff
+
+PTE_V               = 0x01      # valid
+PTE_R               = 0x02      # readable
+PTE_W               = 0x04      # writable
+PTE_X               = 0x08      # executable
+PTE_U               = 0x10      # accessible in U mode
+PTE_G               = 0x20      # global
+PTE_A               = 0x40      # accessed
+PTE_D               = 0x80      # dirty
+PTE_PPN_SHIFT       = 10
+VPN_BITS            = 10        # per level, two levels
+
+MSTATUS_SIE         = 1 << 1
+MSTATUS_MIE         = 1 << 3
+MSTATUS_SPIE        = 1 << 5
+MSTATUS_MPIE        = 1 << 7
+MSTATUS_SPP         = 1 << 8
+MSTATUS_MPP_SHIFT   = 11
+MSTATUS_MPP         = 3 << MSTATUS_MPP_SHIFT
+MSTATUS_SUM         = 1 << 18   # S mode may access U pages
+MSTATUS_MXR         = 1 << 19   # loads from executable pages
+
+TLB_ENTRIES         = 256       # per TLB; a full TLB is flushed
+
 #--------------------------------------------------------------------------
 #   Configurations
 #--------------------------------------------------------------------------
@@ -194,8 +236,11 @@ IMEM_START          = WORD(0x80000000)      # IMEM: 0x80000000 - 0x8000ffff (102
 IMEM_SIZE           = WORD(64 * 1024)       
 DMEM_START          = WORD(0x80010000)      # DMEM: 0x80010000 - 0x8002ffff (2048KB)
 DMEM_SIZE           = WORD(128 * 1024)
-HEAP_START          = WORD(0x14cc4)      # Heap grows from here
-HEAP_SIZE           = WORD(440)
+
+# Paged memory for heap and anonymous mappings (virtual memory mode)
+PAGE_SHIFT          = 12
+PAGE_SIZE           = 1 << PAGE_SHIFT       # 4KB pages
+MMAP_TOP            = 0x70000000            # mmap() areas grow down from here
 
 DEFAULT_RSTVEC      = WORD(0x1000)          # default reset vector: beginning address
 RESET_VEC_SIZE      = 32
@@ -485,19 +530,36 @@ CSR_MHPMCOUNTER31H  = 0xb9f
 #   syscall constants: compare with a7 value
 #--------------------------------------------------------------------------
 
-sysconst_list       = [ 80, 214, 64, 57, 93, 63, 62 ]
-# SYS_exit            = 93
-# SYS_exit_group      = 94
-# SYS_getpid          = 172
-# SYS_kill            = 129
-# SYS_read            = 63
-# SYS_write           = 64
-# SYS_openat          = 56
-# SYS_close           = 57
-# SYS_lseek           = 62
-# SYS_brk             = 214
-# SYS_linkat          = 37
+SYS_OPENAT          = 56
+SYS_CLOSE           = 57
+SYS_LSEEK           = 62
+SYS_READ            = 63
+SYS_WRITE           = 64
+SYS_PREAD           = 67
+SYS_FSTAT           = 80
+SYS_EXIT            = 93
+SYS_BRK             = 214
+SYS_MUNMAP          = 215
+SYS_MMAP            = 222
+
+sysconst_list       = [ SYS_OPENAT, SYS_CLOSE, SYS_LSEEK, SYS_READ, SYS_WRITE,
+                        SYS_PREAD, SYS_FSTAT, SYS_EXIT, SYS_BRK, SYS_MUNMAP,
+                        SYS_MMAP ]
 SYS_ERROR           = -1
+
+AT_FDCWD            = -100      # dirfd for paths relative to the sandbox root
+
+# open() flags used by newlib (sys/_default_fcntl.h)
+O_ACCMODE           = 0x0003
+O_APPEND            = 0x0008
+O_CREAT             = 0x0200
+O_TRUNC             = 0x0400
+O_EXCL              = 0x0800
+
+# mmap() flags
+MAP_FIXED           = 0x10
+MAP_ANONYMOUS       = 0x20
+
 #define SYS_exit 93
 #define SYS_exit_group 94
 #define SYS_getpid 172
@@ -0,0 +1,296 @@
+#!/usr/bin/python3
+
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Instruction and branch coverage maps.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import sys
+import os
+import json
+
+import numpy as np
+from elftools.elf import elffile as elf
+from elftools.elf.constants import P_FLAGS
+
+from consts import *
+from symbols import *
+from lines import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+BRANCH_OPCODE       = 0x63          # beq, bne, blt, bge, bltu, bgeu
+OPCODE_MASK         = 0x7f
+
+COVERAGE_MAPS       = [ 'executed', 'taken', 'not_taken' ]
+
+
+#--------------------------------------------------------------------------
+#   Coverage: executed instructions and branch outcomes of the text segment
+#--------------------------------------------------------------------------
+
+# Each map has one bool per instruction word of the text segment. The
+# instructions are not marked one by one: the simulator reports every
+# control transfer, and the straight-line block from the last target up
+# to the transfer is added to a set together with the branch outcome.
+# Since the same blocks run over and over, the set stays small, and the
+# blocks are marked in the maps with slice assignments only at the end of
+# the run. Maps saved by many runs of the same program are merged with a
+# vectorized OR.
+
+class Coverage(object):
+
+    def __init__(self, text, filename = None):
+
+        self.start, self.end = text
+        self.filename   = filename          # ELF file, for symbols and lines
+        n = max(self.end - self.start, 0) // WORD_SIZE
+        self.executed   = np.zeros(n, dtype = bool)
+        self.taken      = np.zeros(n, dtype = bool)
+        self.not_taken  = np.zeros(n, dtype = bool)
+        self.block      = self.start        # first PC of the running block
+        self.blocks     = set()             # (first PC, last PC, outcome) not yet marked
+        self.words      = None              # instruction words, read on demand
+
+    def enter(self, pc):
+        self.block = pc
+
+    def branch(self, pc, target, cond, taken):
+
+        # Called for every control transfer at pc; the outcome is 0 for
+        # jumps, 1 for taken and 2 for not taken branches
+        self.blocks.add((self.block, pc, (2 - taken) if cond else 0))
+        self.block = target
+
+    def finish(self, pc):
+
+        # pc is the instruction that would have run next (or that faulted)
+        if pc > self.block:
+            self.blocks.add((self.block, pc - WORD_SIZE, 0))
+        self.block = pc
+        self.flush()
+
+    def flush(self):
+
+        # Marks the blocks collected so far in the maps
+        n = len(self.executed)
+        for first, last, outcome in self.blocks:
+            i = max((first - self.start) >> 2, 0)
+            j = min(((last - self.start) >> 2) + 1, n)
+            if i < j:
+                self.executed[i:j] = True
+            if outcome and 0 <= j - 1 < n and j - 1 == (last - self.start) >> 2:
+                (self.taken if outcome == 1 else self.not_taken)[j - 1] = True
+        self.blocks.clear()
+
+    @staticmethod
+    def merge(maps):
+
+        # ORs the maps of the same text segment in one pass per kind
+        first = maps[0]
+        for m in maps[1:]:
+            if (m.start, m.end) != (first.start, first.end):
+                return None
+        merged = Coverage((first.start, first.end), first.filename)
+        for kind in COVERAGE_MAPS:
+            setattr(merged, kind, np.logical_or.reduce(np.stack([ getattr(m, kind) for m in maps ])))
+        return merged
+
+    def save(self, filename):
+        np.savez_compressed(filename, text = np.array([ self.start, self.end ], dtype = np.int64),
+                            elf = np.array(os.path.abspath(self.filename) if self.filename else ''),
+                            **{ kind: getattr(self, kind) for kind in COVERAGE_MAPS })
+
+    @staticmethod
+    def load(filename):
+
+        with np.load(filename) as data:
+            start, end = (int(a) for a in data['text'])
+            cov = Coverage((start, end), str(data['elf']) or None)
+            for kind in COVERAGE_MAPS:
+                setattr(cov, kind, data[kind].astype(bool))
+        return cov
+
+    def read_words(self):
+
+        # Reads the instruction words of the executable segments, so that
+        # the branches that never ran are known as well
+        if self.words is not None:
+            return self.words
+        self.words = np.zeros(len(self.executed), dtype = np.uint32)
+        if self.filename:
+            with open(self.filename, 'rb') as f:
+                for seg in elf.ELFFile(f).iter_segments():
+                    if seg['p_type'] != 'PT_LOAD' or not seg['p_flags'] & P_FLAGS.PF_X:
+                        continue
+                    data = seg.data()
+                    words = np.frombuffer(data[:len(data) & ~(WORD_SIZE - 1)], dtype = '<u4')
+                    i = (seg['p_vaddr'] - self.start) >> 2
+                    if 0 <= i < len(self.words):
+                        words = words[:len(self.words) - i]
+                        self.words[i:i + len(words)] = words
+        return self.words
+
+    def summary(self):
+
+        # Returns (instructions, executed, branch edges, edges covered);
+        # zero words are not instructions (padding)
+        words = self.read_words()
+        insts = (words != 0) | self.executed
+        branches = (words & OPCODE_MASK) == BRANCH_OPCODE
+        return (int(insts.sum()), int(self.executed.sum()), 2 * int(branches.sum()),
+                int(self.taken[branches].sum() + self.not_taken[branches].sum()))
+
+    def report(self):
+
+        insts, executed, edges, covered = self.summary()
+        print("Coverage: %d/%d instructions (%.1f%%), %d/%d branch edges (%.1f%%)" %
+              (executed, insts, executed * 100.0 / max(insts, 1), covered, edges, covered * 100.0 / max(edges, 1)))
+
+    def write_json(self, filename, symtab):
+
+        # Totals, per-function coverage and the outcomes of every branch
+        words = self.read_words()
+        addrs = self.start + np.arange(len(words), dtype = np.int64) * WORD_SIZE
+        insts = (words != 0) | self.executed
+        index = symtab.find(addrs)
+        total = np.bincount(index[index >= 0], weights = insts[index >= 0], minlength = len(symtab))
+        hit = np.bincount(index[index >= 0], weights = self.executed[index >= 0], minlength = len(symtab))
+        functions = [ ]
+        for i in np.nonzero(total)[0]:
+            start, end = symtab.range(i)
+            functions.append({ 'name': symtab.names[i], 'start': start, 'end': end,
+                               'instructions': int(total[i]), 'executed': int(hit[i]) })
+        branches = [ ]
+        for i in np.nonzero((words & OPCODE_MASK) == BRANCH_OPCODE)[0]:
+            pc = int(addrs[i])
+            branches.append({ 'pc': pc, 'symbol': symtab.name(pc),
+                              'taken': bool(self.taken[i]), 'not_taken': bool(self.not_taken[i]) })
+        # Executed ranges as [start, end) pairs of addresses
+        edges = np.flatnonzero(np.diff(np.concatenate(([ 0 ], self.executed.view(np.int8), [ 0 ]))))
+        ranges = [ [ int(self.start + a * WORD_SIZE), int(self.start + b * WORD_SIZE) ]
+                   for a, b in zip(edges[::2], edges[1::2]) ]
+        n, executed, nedges, covered = self.summary()
+        with open(filename, 'w') as f:
+            json.dump({ 'file': self.filename, 'text': [ self.start, self.end ],
+                        'instructions': n, 'executed': executed,
+                        'branch_edges': nedges, 'branch_edges_covered': covered,
+                        'functions': functions, 'branches': branches, 'ranges': ranges }, f, indent = 1)
+
+    def write_lcov(self, filename, symtab, table):
+
+        # One record per source file of the line table; since the maps
+        # have no counts, every hit count is 0 or 1
+        words = self.read_words()
+        addrs = self.start + np.arange(len(words), dtype = np.int64) * WORD_SIZE
+        valid = np.nonzero((words != 0) | self.executed)[0]
+        keys = table.find(addrs[valid])
+        lines = { }                                 # key -> executed
+        for k, e in zip(keys.tolist(), self.executed[valid].tolist()):
+            if k >= 0:
+                lines[k] = lines.get(k, False) or e
+        branches = { }                              # key -> [(taken, not taken)] or None if not run
+        brs = np.nonzero((words & OPCODE_MASK) == BRANCH_OPCODE)[0]
+        for i, k in zip(brs.tolist(), table.find(addrs[brs]).tolist()):
+            if k >= 0:
+                ran = self.taken[i] or self.not_taken[i]
+                branches.setdefault(k, [ ]).append((int(self.taken[i]), int(self.not_taken[i])) if ran else None)
+        funcs = { }                                 # file -> [(line, name, hit)]
+        for i, name in enumerate(symtab.names):
+            start = symtab.start_list[i]
+            if self.start <= start < self.end and words[(start - self.start) >> 2]:
+                at = table.lookup(start)
+                if at is not None:
+                    funcs.setdefault(at[0], [ ]).append((at[1], name, int(self.executed[(start - self.start) >> 2])))
+
+        with open(filename, 'w') as f:
+            for fi, path in sorted(enumerate(table.files), key = lambda p: p[1]):
+                keys = sorted((line, k) for k, (kf, line) in enumerate(table.keys) if kf == fi and k in lines)
+                if not keys:
+                    continue
+                f.write("TN:\nSF:%s\n" % path)
+                fl = sorted(funcs.get(path, [ ]))
+                for line, name, hit in fl:
+                    f.write("FN:%d,%s\n" % (line, name))
+                for line, name, hit in fl:
+                    f.write("FNDA:%d,%s\n" % (hit, name))
+                f.write("FNF:%d\nFNH:%d\n" % (len(fl), sum(hit for line, name, hit in fl)))
+                nbr = hbr = 0
+                for line, k in keys:
+                    for block, outcome in enumerate(branches.get(k, [ ])):
+                        for b in range(2):
+                            f.write("BRDA:%d,%d,%d,%s\n" % (line, block, b, '-' if outcome is None else outcome[b]))
+                            nbr += 1
+                            hbr += outcome is not None and outcome[b]
+                f.write("BRF:%d\nBRH:%d\n" % (nbr, hbr))
+                for line, k in keys:
+                    f.write("DA:%d,%d\n" % (line, lines[k]))
+                f.write("LF:%d\nLH:%d\nend_of_record\n" % (len(keys), sum(lines[k] for line, k in keys)))
+
+    def write(self, filenames):
+
+        # '.npz' files get the maps for merging, '.json' files a summary,
+        # and the others an lcov tracefile
+        symtab = table = None
+        for filename in filenames:
+            if filename.endswith('.npz'):
+                self.save(filename)
+                continue
+            if symtab is None:
+                symtab = SymbolIndex.load(self.filename) if self.filename else SymbolIndex()
+            if filename.endswith('.json'):
+                self.write_json(filename, symtab)
+            else:
+                if table is None:
+                    table = LineTable.load(self.filename) if self.filename else LineTable()
+                self.write_lcov(filename, symtab, table)
+        self.report()
+
+
+#--------------------------------------------------------------------------
+#   Coverage merger main
+#--------------------------------------------------------------------------
+
+def main():
+
+    args = sys.argv[1:]
+    outputs, elf_file = [ ], None
+    while len(args) > 1 and args[0] in [ '-o', '-e' ]:
+        if args[0] == '-o':
+            outputs.append(args[1])
+        else:
+            elf_file = args[1]
+        args = args[2:]
+    if not args or any(a.startswith('-') for a in args):
+        print("Usage: %s [-o file] [-e elf] map.npz ..." % sys.argv[0])
+        print("\tmerges the coverage maps saved by 'snurisc.py -V file.npz' and prints the coverage")
+        print("\t-o writes the merged maps (.npz), a JSON summary (.json) or an lcov tracefile, can be repeated")
+        print("\t-e reads symbols and lines from the executable file instead of the one recorded in the maps")
+        sys.exit()
+    cov = Coverage.merge([ Coverage.load(name) for name in args ])
+    if cov is None:
+        print("Coverage maps of different text segments cannot be merged")
+        sys.exit(1)
+    if elf_file:
+        cov.filename = elf_file
+    elif cov.filename and not os.path.isfile(cov.filename):
+        cov.filename = None
+    cov.write(outputs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Flight recorder: ring buffer of the last retired instructions.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import numpy as np
+
+from consts import *
+from isa import *
+from program import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+FLIGHT_DTYPE        = np.dtype([ ('cycle',      np.uint64),
+                                 ('pc',         np.uint32),
+                                 ('inst',       np.uint32),
+                                 ('rd',         np.uint8),
+                                 ('wbdata',     np.uint32),
+                                 ('mem_addr',   np.uint32) ])
+
+
+#--------------------------------------------------------------------------
+#   FlightRecorder: keeps the last N instructions for post-mortem dumps
+#--------------------------------------------------------------------------
+
+# Each retired instruction is stored as a tuple of raw values in a
+# preallocated ring; nothing is converted or formatted until the entries
+# are requested, so the recorder can be left on for every run. (Storing a
+# tuple into a Python list is several times cheaper than into a NumPy
+# structured array, hence the conversion to FLIGHT_DTYPE is deferred.)
+
+class FlightRecorder(object):
+
+    def __init__(self, size):
+
+        self.size   = size
+        self.ring   = [ None ] * size
+        self.pos    = 0             # next slot to write (empty slots are None)
+
+    def record(self, cycle, pc, inst, rd, wbdata, mem_addr):
+
+        self.ring[self.pos] = (cycle, pc, inst, rd, wbdata, mem_addr)
+        self.pos = self.pos + 1 if self.pos + 1 < self.size else 0
+
+    def entries(self):
+
+        # Returns the recorded entries as a structured array, oldest first
+        ring = [ e for e in self.ring[self.pos:] + self.ring[:self.pos] if e is not None ]
+        return np.array([ (c, int(pc), int(inst), int(rd), int(wb) & 0xffffffff, int(ma) & 0xffffffff)
+                          for c, pc, inst, rd, wb, ma in ring ], dtype = FLIGHT_DTYPE)
+
+    def dump(self):
+
+        entries = self.entries()
+        Log.flush()
+        print("Flight recorder: last %d instructions" % len(entries))
+        print("=" * 37)
+        for e in entries:
+            pc, inst, rd = e['pc'], e['inst'], int(e['rd'])
+            opcode = RISCV.opcode(inst)
+            info = "# R[%d] <- 0x%08x" % (rd, e['wbdata']) if rd else ''
+            if opcode != ILLEGAL and isa[opcode][IN_CLASS] == CL_MEM:
+                info += "%s[0x%08x]" % (' ' if info else '# ', e['mem_addr'])
+            print("%d 0x%08x: %-29s %s" % (e['cycle'], pc, Program.disasm(pc, inst), info))
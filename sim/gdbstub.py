@@ -0,0 +1,292 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   GDB remote serial protocol (RSP) stub.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import os
+import select
+import socket
+import struct
+
+from consts import *
+from components import *
+from program import *
+from sim import *
+from watch import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+GDB_NUM_REGS        = 33            # x0 - x31 and pc
+GDB_PC_REGNO        = 32
+GDB_PACKET_SIZE     = 0x4000
+
+GDB_SIGINT          = 2
+GDB_SIGILL          = 4
+GDB_SIGTRAP         = 5
+GDB_SIGSEGV         = 11
+
+# Z packet types for watchpoints and the matching stop reasons
+GDB_WATCH_TYPE      = { '2,': WATCH_WRITE, '3,': WATCH_READ, '4,': WATCH_ACCESS }
+GDB_WATCH_REASON    = { WATCH_WRITE: 'watch', WATCH_READ: 'rwatch', WATCH_ACCESS: 'awatch' }
+
+# Instructions executed between checks for a Ctrl-C from GDB
+GDB_POLL_INTERVAL   = 10000
+
+GDB_TARGET_XML      = '<?xml version="1.0"?>' \
+                      '<!DOCTYPE target SYSTEM "gdb-target.dtd">' \
+                      '<target version="1.0">' \
+                      '<architecture>riscv:rv32</architecture>' \
+                      '<feature name="org.gnu.gdb.riscv.cpu">' + \
+                      ''.join('<reg name="%s" bitsize="32" type="%s" regnum="%d"/>' % \
+                              ("x%d" % i if i else "zero", "int", i) for i in range(NUM_REGS)) + \
+                      '<reg name="pc" bitsize="32" type="code_ptr" regnum="32"/>' \
+                      '</feature></target>'
+
+
+#--------------------------------------------------------------------------
+#   GDBStub: serves a GDB session over a TCP or Unix domain socket
+#--------------------------------------------------------------------------
+
+# Breakpoints are kept as a set of PCs and never patched into memory, so
+# software and hardware breakpoints behave the same. While continuing
+# with breakpoints or watchpoints set, Sim.execute() looks up the PC in
+# the set and tests the watchpoints after every instruction. Without
+# them, it runs the counted loop of run_iter(), which checks nothing but
+# the end of each poll interval.
+
+class GDBStub(object):
+
+    def __init__(self, cpu, target):
+
+        self.cpu            = cpu
+        self.target         = target    # TCP port number or Unix socket path
+        self.conn           = None
+        self.breakpoints    = set()
+        self.status         = EXC_NONE
+        self.pending        = b''       # bytes read ahead by interrupted()
+
+    def listen(self):
+
+        if self.target.isdigit():
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind(('127.0.0.1', int(self.target)))
+        else:
+            if os.path.exists(self.target):
+                os.unlink(self.target)
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(self.target)
+        server.listen(1)
+        print("Waiting for GDB connection on %s" % self.target)
+        self.conn, _ = server.accept()
+        server.close()
+        if self.target.isdigit():
+            self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    #----------------------------------------------------------------------
+    #   Packet layer
+    #----------------------------------------------------------------------
+
+    def recv_packet(self):
+
+        # Returns the payload of the next packet, b'\x03' for an interrupt,
+        # or None if the connection is closed
+        buf = b''
+        while True:
+            c = self.recv_byte()
+            if not c:
+                return None
+            if c == b'\x03' and not buf:
+                return c
+            if c == b'$':
+                buf = b'$'
+            elif buf:
+                buf += c
+                if len(buf) >= 4 and buf[-3:-2] == b'#':
+                    payload = buf[1:-3]
+                    if sum(payload) & 0xff == int(buf[-2:], 16):
+                        self.conn.sendall(b'+')
+                        return payload
+                    self.conn.sendall(b'-')
+                    buf = b''
+
+    def send_packet(self, payload):
+
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.conn.sendall(b'$' + payload + b'#%02x' % (sum(payload) & 0xff))
+
+    def recv_byte(self):
+
+        if self.pending:
+            c, self.pending = self.pending[:1], self.pending[1:]
+            return c
+        return self.conn.recv(1)
+
+    def interrupted(self):
+
+        # Any byte other than ^C is kept for the next recv_packet()
+        r, _, _ = select.select([ self.conn ], [ ], [ ], 0)
+        if not r:
+            return False
+        c = self.conn.recv(1)
+        if c == b'\x03':
+            return True
+        self.pending += c
+        return False
+
+    #----------------------------------------------------------------------
+    #   Target access
+    #----------------------------------------------------------------------
+
+    def read_reg(self, n):
+        return self.cpu.pc.read() if n == GDB_PC_REGNO else self.cpu.regs.read(n)
+
+    def write_reg(self, n, val):
+        if n == GDB_PC_REGNO:
+            self.cpu.pc.write(val)
+        else:
+            self.cpu.regs.write(n, val)
+
+    def read_mem(self, addr, size):
+        views = self.cpu.mem_views(addr, size)
+        if views is None:
+            return None
+        return b''.join(bytes(v) for v in views)
+
+    def stop_reply(self):
+
+        if self.cpu.watch.triggered:
+            wid, kind, addr = self.cpu.watch.triggered
+            self.cpu.watch.triggered = None
+            return 'T%02x%s:%x;' % (GDB_SIGTRAP, GDB_WATCH_REASON[kind], addr)
+        if self.status & EXC_FIN:
+            return 'W%02x' % (self.cpu.kernel.exit_code & 0xff)
+        if self.status & (EXC_IMEM_ERROR | EXC_DMEM_ERROR):
+            return 'S%02x' % GDB_SIGSEGV
+        if self.status & (EXC_ILLEGAL_INST | EXC_OS_ERROR):
+            return 'S%02x' % GDB_SIGILL
+        if self.status & EXC_INTERRUPT:
+            return 'S%02x' % GDB_SIGINT
+        return 'S%02x' % GDB_SIGTRAP
+
+    def resume(self, step):
+
+        if step:
+            self.status = Sim.step()
+            return self.stop_reply()
+        while True:
+            checks = self.breakpoints if self.breakpoints or self.cpu.watch.pages else None
+            self.status = Sim.execute(checks, Stat.icount + GDB_POLL_INTERVAL)
+            if self.status != EXC_NONE or self.cpu.pc.read() in self.breakpoints or \
+               self.cpu.watch.triggered:
+                return self.stop_reply()
+            if self.interrupted():
+                return 'S%02x' % GDB_SIGINT
+
+    #----------------------------------------------------------------------
+    #   Command handling
+    #----------------------------------------------------------------------
+
+    def handle(self, pkt):
+
+        cmd, args = pkt[:1], pkt[1:]
+
+        if cmd == '?':
+            return self.stop_reply()
+        elif cmd == 'g':
+            return ''.join(struct.pack('<I', self.read_reg(n)).hex() for n in range(GDB_NUM_REGS))
+        elif cmd == 'G':
+            data = bytes.fromhex(args)
+            for n in range(min(GDB_NUM_REGS, len(data) // 4)):
+                self.write_reg(n, struct.unpack_from('<I', data, n * 4)[0])
+            return 'OK'
+        elif cmd == 'p':
+            n = int(args, 16)
+            return struct.pack('<I', self.read_reg(n)).hex() if n < GDB_NUM_REGS else 'E01'
+        elif cmd == 'P':
+            n, val = args.split('=')
+            n = int(n, 16)
+            if n >= GDB_NUM_REGS:
+                return 'E01'
+            self.write_reg(n, struct.unpack('<I', bytes.fromhex(val))[0])
+            return 'OK'
+        elif cmd == 'm':
+            addr, size = [ int(x, 16) for x in args.split(',') ]
+            data = self.read_mem(addr, size)
+            return 'E01' if data is None else data.hex()
+        elif cmd == 'M':
+            loc, data = args.split(':')
+            addr, size = [ int(x, 16) for x in loc.split(',') ]
+            return 'OK' if self.cpu.write_bytes(addr, bytes.fromhex(data)[:size]) else 'E01'
+        elif cmd in [ 'c', 's' ]:
+            if args:
+                self.cpu.pc.write(int(args, 16))
+            return self.resume(cmd == 's')
+        elif cmd in [ 'Z', 'z' ] and args[:2] in [ '0,', '1,' ]:
+            _, addr, _ = args.split(',')
+            if cmd == 'Z':
+                self.breakpoints.add(int(addr, 16))
+            else:
+                self.breakpoints.discard(int(addr, 16))
+            return 'OK'
+        elif cmd in [ 'Z', 'z' ] and args[:2] in GDB_WATCH_TYPE:
+            _, addr, length = args.split(',')
+            if cmd == 'Z':
+                self.cpu.watch.add(int(addr, 16), int(length, 16), GDB_WATCH_TYPE[args[:2]])
+                return 'OK'
+            found = self.cpu.watch.remove(int(addr, 16), int(length, 16), GDB_WATCH_TYPE[args[:2]])
+            return 'OK' if found else 'E01'
+        elif cmd == 'H':
+            return 'OK'
+        elif pkt.startswith('qSupported'):
+            return 'PacketSize=%x;qXfer:features:read+' % GDB_PACKET_SIZE
+        elif pkt.startswith('qXfer:features:read:target.xml:'):
+            offset, length = [ int(x, 16) for x in pkt.split(':')[-1].split(',') ]
+            chunk = GDB_TARGET_XML[offset:offset + length]
+            return ('m' if offset + length < len(GDB_TARGET_XML) else 'l') + chunk
+        elif pkt == 'qAttached':
+            return '1'
+        elif pkt == 'qC':
+            return 'QC1'
+        elif pkt == 'qfThreadInfo':
+            return 'm1'
+        elif pkt == 'qsThreadInfo':
+            return 'l'
+        return ''                       # not supported
+
+    def serve(self, entry_point):
+
+        Sim.start(self.cpu, entry_point)
+        self.listen()
+        while True:
+            pkt = self.recv_packet()
+            if pkt is None or pkt == b'k':
+                break
+            if pkt == b'\x03':
+                self.send_packet('S%02x' % GDB_SIGINT)
+                continue
+            if pkt.startswith(b'D'):
+                self.send_packet('OK')
+                self.status = Sim.execute()
+                break
+            reply = self.handle(pkt.decode(errors = 'replace'))
+            self.send_packet(reply)
+            if self.status & EXC_FIN:
+                break
+        self.conn.close()
+        Sim.finish(self.status)
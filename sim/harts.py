@@ -0,0 +1,141 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Multiple harts running in worker processes.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import sys
+import threading
+import multiprocessing
+
+from consts import *
+from components import *
+from program import *
+from sim import *
+from checkpoint import STAT_FIELDS
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+HART_QUANTUM        = 1000      # instructions between synchronizations
+HART_LOCKS          = 64        # locks shared by the harts, chosen by word address
+
+
+#--------------------------------------------------------------------------
+#   Harts: runs a program on several harts sharing imem and dmem
+#--------------------------------------------------------------------------
+
+# imem and dmem are moved to multiprocessing.shared_memory segments, and a
+# process is forked for each hart. A hart has its own copy of everything
+# else: the register file, the PC, the CSRs (with mhartid set), the stats,
+# and the Sim state. Every store, lr.w, sc.w and amo*.w takes one of the
+# locks in cpu.locks, picked by the word address, so that a plain store
+# (e.g. one releasing a spinlock) cannot fall between the load and the
+# store of an amo*.w or sc.w of another hart on the same word. Loads go
+# to the shared memory directly. After every quantum of instructions, the
+# harts wait for each other at a barrier, so that none of them runs far
+# ahead, e.g. while the others spin on a lock. A hart other than hart 0
+# that finishes (e.g. by parking in a loop to itself, as the riscv-tests
+# startup code does) just waits at the barrier. The run ends when hart 0
+# finishes or any hart stops on an exception or SIGINT; the other harts
+# stop at the end of their quantum. The harts print nothing themselves:
+# each sends its status, PC, registers and stats back, and report()
+# prints them in the order of the hart numbers.
+
+class Harts(object):
+
+    def __init__(self, cpu, nharts, quantum = HART_QUANTUM):
+
+        self.cpu        = cpu
+        self.nharts     = nharts
+        self.quantum    = quantum
+        self.ctx        = multiprocessing.get_context('fork')
+        self.segments   = [ cpu.imem.share(), cpu.dmem.share() ]
+        self.barrier    = self.ctx.Barrier(nharts)
+        self.stop       = self.ctx.Value('i', 0, lock = False)
+        self.results    = self.ctx.Queue()
+        cpu.locks       = [ self.ctx.Lock() for i in range(HART_LOCKS) ]
+
+    def run(self, entry_point):
+
+        # Returns a list of (hartid, status, pc, regs, stats) sorted by hartid
+        procs = [ self.ctx.Process(target = self.hart, args = (h, entry_point))
+                  for h in range(self.nharts) ]
+        for p in procs:
+            p.start()
+        results = sorted(self.results.get() for p in procs)
+        for p in procs:
+            p.join()
+        self.release()
+        return results
+
+    def release(self):
+
+        # Copies imem and dmem back to private memory for the dumps
+        self.cpu.mmu.flush()
+        for mem in [ self.cpu.imem, self.cpu.dmem ]:
+            mem.mem = mem.mem.copy()
+            mem.set_views()
+        for shm in self.segments:
+            shm.close()
+            shm.unlink()
+
+    def hart(self, hartid, entry_point):
+
+        cpu = self.cpu
+        cpu.hartid = hartid
+        cpu.prv_regs.mhartid.write(hartid)
+        status = None
+        try:
+            Sim.start(cpu, entry_point)
+            status = EXC_NONE
+            while True:
+                if status == EXC_NONE:
+                    status = Sim.execute(None, Stat.icount + self.quantum)
+                if status != EXC_NONE and (status != EXC_FIN or hartid == 0):
+                    self.stop.value = 1
+                    self.barrier.abort()
+                    break
+                if self.stop.value:
+                    break
+                try:
+                    self.barrier.wait()
+                except threading.BrokenBarrierError:
+                    break
+            Sim.finish(status, quiet = True)
+        finally:
+            sys.stdout.flush()
+            self.results.put((hartid, status, int(cpu.pc.read()), cpu.regs.reg.copy(),
+                              { f: getattr(Stat, f) for f in STAT_FIELDS }))
+
+    def report(self, results):
+
+        # The state and the registers of each hart, the data memory, and
+        # then the totals with the cycles of the slowest hart
+        regs = RegisterFile()
+        for hartid, status, pc, reg, stats in results:
+            regs.reg = reg
+            state = EXC_MSG.get(status, 'finished' if status == EXC_FIN else 'stopped')
+            if status in EXC_MSG or status == EXC_INTERRUPT:
+                state += " at 0x%08x" % pc
+            print("Hart %d: %d instructions executed (%s)" % (hartid, stats['icount'], state))
+            if Log.level > 0 and Log.level < 5:
+                regs.dump()
+        if Log.level > 1 and Log.level < 6:
+            self.cpu.dmem.dump(skipzero = True)
+        for f in STAT_FIELDS:
+            setattr(Stat, f, sum(stats[f] for h, s, p, r, stats in results))
+        Stat.cycle = max(stats['cycle'] for h, s, p, r, stats in results)
+        Stat.show()
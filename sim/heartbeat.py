@@ -0,0 +1,110 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Periodic progress reports from a background thread.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import sys
+import os
+import json
+import time
+import threading
+
+from consts import *
+from program import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+HEARTBEAT_INTERVAL  = 10.0      # seconds between beats if only -S is given
+
+
+#--------------------------------------------------------------------------
+#   Heartbeat: reports the progress of a run every few seconds
+#--------------------------------------------------------------------------
+
+# A daemon thread wakes up every 'interval' seconds and reads the counters
+# the simulator keeps anyway (the instruction count and the PC, through
+# 'probe'), so the simulation loop does no extra work. Each beat is
+# printed to stderr and/or written to a status file, which is replaced
+# atomically so that a monitor never reads half of it.
+
+class Heartbeat(object):
+
+    def __init__(self, probe, interval, status_file = None, show = True, out = None):
+
+        self.probe      = probe             # () -> (instructions, pc)
+        self.interval   = interval
+        self.status_file = status_file
+        self.show       = show
+        self.out        = out or sys.stderr
+        self.done       = threading.Event()
+        self.thread     = None
+
+    def start(self):
+
+        self.t0 = self.last_time = time.perf_counter()
+        self.icount0 = self.last_icount = self.probe()[0]
+        self.done.clear()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    def stop(self):
+
+        # Writes the last status with state 'finished'
+        if self.thread:
+            self.done.set()
+            self.thread.join()
+            self.thread = None
+            self.beat('finished')
+
+    def run(self):
+
+        while not self.done.wait(self.interval):
+            self.beat('running')
+
+    def sample(self, state):
+
+        icount, pc = self.probe()
+        now = time.perf_counter()
+        elapsed = now - self.t0
+        delta = now - self.last_time
+        sample = { 'state': state, 'elapsed': round(elapsed, 3), 'instructions': icount,
+                   'pc': int(pc), 'symbol': Program.symtab.name(pc),
+                   'mips': round((icount - self.last_icount) / delta / 1e6, 6) if delta > 0 else 0.0,
+                   'avg_mips': round((icount - self.icount0) / elapsed / 1e6, 6) if elapsed > 0 else 0.0 }
+        self.last_time, self.last_icount = now, icount
+        return sample
+
+    def beat(self, state):
+
+        s = self.sample(state)
+        if self.show:
+            symbol = " <%s>" % s['symbol'] if s['symbol'] else ''
+            try:
+                self.out.write("[%.1fs] %d instructions, pc 0x%08x%s, %.4f MIPS (average %.4f)\n" %
+                               (s['elapsed'], s['instructions'], s['pc'], symbol, s['mips'], s['avg_mips']))
+                self.out.flush()
+            except (OSError, ValueError):
+                pass
+        if self.status_file:
+            tmp = self.status_file + '.tmp'
+            try:
+                with open(tmp, 'w') as f:
+                    json.dump(s, f)
+                    f.write('\n')
+                os.replace(tmp, self.status_file)
+            except OSError:
+                pass
@@ -0,0 +1,166 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Host file I/O proxy: descriptor table for file-related syscalls.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import os
+import sys
+import errno
+import struct
+
+from consts import *
+from program import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+# Guest open() flags -> host open() flags
+O_FLAGS = [ (O_APPEND,  os.O_APPEND),
+            (O_CREAT,   os.O_CREAT),
+            (O_TRUNC,   os.O_TRUNC),
+            (O_EXCL,    os.O_EXCL),
+          ]
+
+# struct kernel_stat in RV32 newlib (libgloss/riscv/kernel_stat.h), 128 bytes
+KSTAT_FORMAT        = '<QQIIIIQQqiiqqi4xqi4xqi4x8x'
+KSTAT_SIZE          = struct.calcsize(KSTAT_FORMAT)
+
+
+#--------------------------------------------------------------------------
+#   FileTable: maps guest file descriptors to host file descriptors
+#--------------------------------------------------------------------------
+
+# Every guest path is resolved relative to the sandbox directory and may
+# not escape from it. Data is moved between host files and guest memory
+# with readv()/writev() on views of the guest memory, hence no copies are
+# made in Python. All methods return the syscall return value: a
+# non-negative result or -errno.
+
+class FileTable(object):
+
+    STDIO = [ 0, 1, 2 ]
+
+    def __init__(self, root):
+
+        self.root   = os.path.realpath(root)
+        self.fds    = { 0: sys.stdin.fileno(), 1: sys.stdout.fileno(), 2: sys.stderr.fileno() }
+        self.paths  = { 0: None, 1: None, 2: None }
+
+    def resolve(self, dirfd, path):
+
+        if path.startswith('/') or dirfd == AT_FDCWD:
+            base = self.root
+        elif self.paths.get(dirfd):
+            base = self.paths[dirfd]
+        else:
+            return None
+        host_path = os.path.realpath(os.path.join(base, path.lstrip('/')))
+        if host_path != self.root and not host_path.startswith(self.root + os.sep):
+            return None
+        return host_path
+
+    def openat(self, dirfd, path, flags, mode):
+
+        host_path = self.resolve(dirfd, path)
+        if host_path is None:
+            return -errno.EACCES
+        host_flags = flags & O_ACCMODE
+        for guest_flag, host_flag in O_FLAGS:
+            if flags & guest_flag:
+                host_flags |= host_flag
+        try:
+            hfd = os.open(host_path, host_flags, mode)
+        except OSError as e:
+            return -e.errno
+        fd = 3
+        while fd in self.fds:
+            fd += 1
+        self.fds[fd] = hfd
+        self.paths[fd] = host_path
+        return fd
+
+    def close(self, fd):
+
+        hfd = self.fds.pop(fd, None)
+        if hfd is None:
+            return -errno.EBADF
+        self.paths.pop(fd, None)
+        if fd not in FileTable.STDIO:
+            os.close(hfd)
+        return 0
+
+    def read(self, fd, views):
+
+        hfd = self.fds.get(fd)
+        if hfd is None:
+            return -errno.EBADF
+        try:
+            return os.readv(hfd, views)
+        except OSError as e:
+            return -e.errno
+
+    def pread(self, fd, views, offset):
+
+        hfd = self.fds.get(fd)
+        if hfd is None:
+            return -errno.EBADF
+        try:
+            return os.preadv(hfd, views, offset)
+        except OSError as e:
+            return -e.errno
+
+    def write(self, fd, views):
+
+        hfd = self.fds.get(fd)
+        if hfd is None:
+            return -errno.EBADF
+        if fd in FileTable.STDIO:
+            Log.flush()
+            sys.stdout.flush()          # keep order with the simulator's own output
+        try:
+            return os.writev(hfd, views)
+        except OSError as e:
+            return -e.errno
+
+    def lseek(self, fd, offset, whence):
+
+        hfd = self.fds.get(fd)
+        if hfd is None:
+            return -errno.EBADF
+        try:
+            return os.lseek(hfd, offset, whence)
+        except OSError as e:
+            return -e.errno
+
+    def fstat(self, fd):
+
+        # Returns (result, struct kernel_stat image)
+        hfd = self.fds.get(fd)
+        if hfd is None:
+            return -errno.EBADF, None
+        try:
+            st = os.fstat(hfd)
+        except OSError as e:
+            return -e.errno, None
+        kstat = struct.pack(KSTAT_FORMAT,
+                    st.st_dev, st.st_ino, st.st_mode, st.st_nlink,
+                    st.st_uid, st.st_gid, getattr(st, 'st_rdev', 0), 0,
+                    st.st_size, getattr(st, 'st_blksize', 4096), 0,
+                    getattr(st, 'st_blocks', 0),
+                    int(st.st_atime), st.st_atime_ns % 1000000000,
+                    int(st.st_mtime), st.st_mtime_ns % 1000000000,
+                    int(st.st_ctime), st.st_ctime_ns % 1000000000)
+        return 0, kstat
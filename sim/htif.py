@@ -0,0 +1,79 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Host-target interface (HTIF): tohost/fromhost emulation.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import errno
+import struct
+
+from consts import *
+from kernel import *
+
+
+#--------------------------------------------------------------------------
+#   HTIF: handles the commands a program writes to the tohost variable
+#--------------------------------------------------------------------------
+
+# The riscv-tests benchmarks talk to the host through two 64-bit variables
+# found in the ELF symbol table:
+#   tohost = (code << 1) | 1    exits the program with the given code
+#   tohost = &magic_mem         performs the syscall described in magic_mem
+#                               (uint64_t magic_mem[8] = { n, a0, a1, ... })
+# After a syscall, the result is written back to magic_mem[0] and fromhost
+# is set to 1. The simulator calls store() only when a store instruction
+# writes to the tohost address, so nothing is polled per instruction.
+
+class HTIF(object):
+
+    def __init__(self, cpu, tohost, fromhost):
+
+        self.cpu        = cpu
+        self.tohost     = tohost
+        self.fromhost   = fromhost
+
+    def read64(self, addr, count = 1):
+
+        views = self.cpu.mem_views(addr, count * 8)
+        if views is None:
+            return None
+        return struct.unpack('<%dQ' % count, b''.join(bytes(v) for v in views))
+
+    def store(self):
+
+        val = self.read64(self.tohost)
+        if val is None or val[0] == 0:
+            return EXC_NONE
+        cmd = val[0]
+        kernel = self.cpu.kernel
+
+        if cmd & 1:
+            kernel.exit_code = Kernel.signed((cmd >> 1) & 0xffffffff)
+            return EXC_FIN
+
+        magic_mem = self.read64(cmd & 0xffffffff, 8)
+        if magic_mem is None:
+            return EXC_DMEM_ERROR
+        n = magic_mem[0]
+        args = [ a & 0xffffffff for a in magic_mem[1:7] ]
+        ret = kernel.dispatch(n, args) if n in sysconst_list else -errno.ENOSYS
+        if ret is None:
+            return EXC_OS_ERROR
+        if n == SYS_EXIT:
+            return EXC_FIN
+
+        self.cpu.write_bytes(cmd & 0xffffffff, struct.pack('<q', ret))
+        self.cpu.write_bytes(self.tohost, struct.pack('<Q', 0))
+        if self.fromhost is not None:
+            self.cpu.write_bytes(self.fromhost, struct.pack('<Q', 1))
+        return EXC_NONE
@@ -0,0 +1,122 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Interval statistics (time series of the Stat counters).
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import numpy as np
+
+from consts import *
+from program import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+INTERVAL_LENGTH     = 100000    # instructions per interval if only -I is given
+INTERVAL_ROWS       = 4096      # intervals preallocated (doubled when full)
+
+# Output columns for the Stat counters; inst_mem is split into loads and
+# stores, and the columns of counters a simulator lacks are left out
+INTERVAL_COLUMNS    = [ ('instructions', 'icount'), ('cycles', 'cycle'), ('alu', 'inst_alu'),
+                        ('loads', None), ('stores', 'inst_store'), ('ctrl', 'inst_ctrl'),
+                        ('taken_branches', 'taken_branches'), ('stall_cycles', 'stall_cycles'),
+                        ('flushes', 'flushes') ]
+
+
+#--------------------------------------------------------------------------
+#   IntervalStats: the Stat counters sampled every n instructions
+#--------------------------------------------------------------------------
+
+# The simulator calls sample() when Stat.icount reaches the end of an
+# interval, in the way it takes PC samples, and adds the page number of
+# each load and store to 'pages'. Nothing else is done per instruction:
+# sample() copies the counters into the next row of a preallocated array,
+# and the rows are differenced only when the series is written. The data
+# pages touched are counted per interval and the set is then cleared.
+
+class IntervalStats(object):
+
+    def __init__(self, period):
+
+        self.period     = period
+        self.fields     = [ 'icount' ] + [ f for n, f in INTERVAL_COLUMNS
+                                           if f and f != 'icount' and hasattr(Stat, f) ] + [ 'inst_mem' ]
+        self.counts     = np.zeros((INTERVAL_ROWS, len(self.fields)), dtype = np.int64)
+        self.npages     = np.zeros(INTERVAL_ROWS, dtype = np.int64)
+        self.rows       = 0             # rows of counts filled, including the start
+        self.pages      = set()         # data pages touched in this interval
+
+    def counters(self):
+
+        if self.rows == len(self.counts):
+            self.counts = np.concatenate([ self.counts, np.zeros_like(self.counts) ])
+            self.npages = np.concatenate([ self.npages, np.zeros_like(self.npages) ])
+        row = self.counts[self.rows]
+        for i, f in enumerate(self.fields):
+            row[i] = getattr(Stat, f)
+        self.rows += 1
+
+    def start(self):
+
+        # Returns the instruction count at the end of the first interval
+        self.rows = 0
+        self.pages.clear()
+        self.counters()
+        return Stat.icount + self.period
+
+    def sample(self):
+
+        # Returns the length of the next interval
+        row = self.rows
+        self.counters()
+        self.npages[row] = len(self.pages)
+        self.pages.clear()
+        return self.period
+
+    def finish(self):
+
+        # Closes the last interval if it is not empty
+        if Stat.icount > self.counts[self.rows - 1][0]:
+            self.sample()
+
+    def series(self):
+
+        # Returns the names and the arrays of the columns
+        counts = self.counts[:self.rows]
+        deltas = { f: np.diff(counts[:, i]) for i, f in enumerate(self.fields) }
+        columns = [ ('start', counts[:-1, 0]) ]
+        for name, f in INTERVAL_COLUMNS:
+            if name == 'loads' and 'inst_store' in deltas:
+                columns.append((name, deltas['inst_mem'] - deltas['inst_store']))
+            elif f in deltas:
+                columns.append((name, deltas[f]))
+        columns.append(('pages', self.npages[1:self.rows]))
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            cpi = np.where(deltas['icount'] > 0, deltas['cycle'] / deltas['icount'], 0.0)
+        columns.append(('cpi', cpi))
+        return columns
+
+    def write(self, filenames):
+
+        # Writes CSV if a file name ends with '.csv', or NumPy .npz
+        columns = self.series()
+        for filename in filenames:
+            if filename.endswith('.csv'):
+                table = np.column_stack([ c for n, c in columns ]) if len(columns[0][1]) else \
+                        np.zeros((0, len(columns)))
+                np.savetxt(filename, table, delimiter = ',', header = ','.join(n for n, c in columns),
+                           comments = '', fmt = [ '%d' ] * (len(columns) - 1) + [ '%.4f' ])
+            else:
+                np.savez_compressed(filename, period = self.period, **dict(columns))
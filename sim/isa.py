@@ -69,6 +69,7 @@ FENCE       = WORD(0b00000000000000000000000000001111)
 SFENCE_VMA  = WORD(0b00010010000000000000000001110011)
 
 MRET        = WORD(0b00110000001000000000000001110011)
+SRET        = WORD(0b00010000001000000000000001110011)
 
 CSRRW       = WORD(0b00000000000000000001000001110011)
 CSRRS       = WORD(0b00000000000000000010000001110011)
@@ -85,6 +86,24 @@ LHU         = WORD(0b00000000000000000101000000000011)
 SB          = WORD(0b00000000000000000000000000100011)
 SH          = WORD(0b00000000000000000001000000100011)
 
+#--------------------------------------------------------------------------
+#   RV32A: atomic instructions (the aq and rl bits are ignored)
+#--------------------------------------------------------------------------
+
+LR_W        = WORD(0b00010000000000000010000000101111)
+SC_W        = WORD(0b00011000000000000010000000101111)
+AMOSWAP_W   = WORD(0b00001000000000000010000000101111)
+AMOADD_W    = WORD(0b00000000000000000010000000101111)
+AMOXOR_W    = WORD(0b00100000000000000010000000101111)
+
+AMOAND_W    = WORD(0b01100000000000000010000000101111)
+AMOOR_W     = WORD(0b01000000000000000010000000101111)
+AMOMIN_W    = WORD(0b10000000000000000010000000101111)
+AMOMAX_W    = WORD(0b10100000000000000010000000101111)
+AMOMINU_W   = WORD(0b11000000000000000010000000101111)
+
+AMOMAXU_W   = WORD(0b11100000000000000010000000101111)
+
 #--------------------------------------------------------------------------
 #   Instruction masks
 #--------------------------------------------------------------------------
@@ -136,6 +155,7 @@ FENCE_MASK      = WORD(0b00000000000000000111000001111111)
 SFENCE_VMA_MASK = WORD(0b11111110000000000111111111111111)
 
 MRET_MASK       = WORD(0b11111111111111111111111111111111)
+SRET_MASK       = WORD(0b11111111111111111111111111111111)
 
 CSRRW_MASK      = WORD(0b00000000000000000111000001111111)
 CSRRS_MASK      = WORD(0b00000000000000000111000001111111)
@@ -152,6 +172,9 @@ LHU_MASK        = WORD(0b00000000000000000111000001111111)
 SB_MASK         = WORD(0b00000000000000000111000001111111)
 SH_MASK         = WORD(0b00000000000000000111000001111111)
 
+LR_MASK         = WORD(0b11111001111100000111000001111111)
+AMO_MASK        = WORD(0b11111000000000000111000001111111)
+
 #--------------------------------------------------------------------------
 #   ISA table
 #--------------------------------------------------------------------------
@@ -206,6 +229,7 @@ isa         = {
     SFENCE_VMA : [ "sfence_vma",  SFENCE_VMA_MASK,  X_TYPE,  CL_CSR,  OP1_RS1, OP2_X,   ALU_X,    MT_X,  ],
 
     MRET       : [ "mret",        MRET_MASK,        X_TYPE,  CL_CSR,  OP1_X,   OP2_X,   ALU_X,    MT_X,  ],
+    SRET       : [ "sret",        SRET_MASK,        X_TYPE,  CL_CSR,  OP1_X,   OP2_X,   ALU_X,    MT_X,  ],
 
     LB         : [ "lb",          LB_MASK,          IL_TYPE, CL_MEM,  OP1_RS1, OP2_IMI, MEM_LD,   MT_W,  ],
     LBU        : [ "lbu",         LBU_MASK,         IL_TYPE, CL_MEM,  OP1_RS1, OP2_IMI, MEM_LD,   MT_W,  ],
@@ -213,6 +237,18 @@ isa         = {
     LHU        : [ "lhu",         LHU_MASK,         IL_TYPE, CL_MEM,  OP1_RS1, OP2_IMI, MEM_LD,   MT_W,  ],
     SB         : [ "sb",          SB_MASK,          S_TYPE,  CL_MEM,  OP1_RS1, OP2_IMS, MEM_ST,   MT_W,  ],
     SH         : [ "sh",          SH_MASK,          S_TYPE,  CL_MEM,  OP1_RS1, OP2_IMS, MEM_ST,   MT_W,  ],
+
+    LR_W       : [ "lr.w",        LR_MASK,          A_TYPE,  CL_MEM,  OP1_RS1, OP2_X,   MEM_AMO,  MT_W,  ],
+    SC_W       : [ "sc.w",        AMO_MASK,         A_TYPE,  CL_MEM,  OP1_RS1, OP2_RS2, MEM_AMO,  MT_W,  ],
+    AMOSWAP_W  : [ "amoswap.w",   AMO_MASK,         A_TYPE,  CL_MEM,  OP1_RS1, OP2_RS2, MEM_AMO,  MT_W,  ],
+    AMOADD_W   : [ "amoadd.w",    AMO_MASK,         A_TYPE,  CL_MEM,  OP1_RS1, OP2_RS2, MEM_AMO,  MT_W,  ],
+    AMOXOR_W   : [ "amoxor.w",    AMO_MASK,         A_TYPE,  CL_MEM,  OP1_RS1, OP2_RS2, MEM_AMO,  MT_W,  ],
+    AMOAND_W   : [ "amoand.w",    AMO_MASK,         A_TYPE,  CL_MEM,  OP1_RS1, OP2_RS2, MEM_AMO,  MT_W,  ],
+    AMOOR_W    : [ "amoor.w",     AMO_MASK,         A_TYPE,  CL_MEM,  OP1_RS1, OP2_RS2, MEM_AMO,  MT_W,  ],
+    AMOMIN_W   : [ "amomin.w",    AMO_MASK,         A_TYPE,  CL_MEM,  OP1_RS1, OP2_RS2, MEM_AMO,  MT_W,  ],
+    AMOMAX_W   : [ "amomax.w",    AMO_MASK,         A_TYPE,  CL_MEM,  OP1_RS1, OP2_RS2, MEM_AMO,  MT_W,  ],
+    AMOMINU_W  : [ "amominu.w",   AMO_MASK,         A_TYPE,  CL_MEM,  OP1_RS1, OP2_RS2, MEM_AMO,  MT_W,  ],
+    AMOMAXU_W  : [ "amomaxu.w",   AMO_MASK,         A_TYPE,  CL_MEM,  OP1_RS1, OP2_RS2, MEM_AMO,  MT_W,  ],
 }
 
 
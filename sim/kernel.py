@@ -0,0 +1,221 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Proxy kernel: user stack setup and system calls handled in Python.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import errno
+import struct
+
+from consts import *
+from components import *
+from program import *
+from hostio import *
+from replay import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+STACK_TOP           = 0x80000000            # user stack grows down from here
+STACK_SIZE          = 8 * 1024 * 1024
+
+# Auxiliary vector entries
+AT_NULL             = 0
+AT_PAGESZ           = 6
+AT_ENTRY            = 9
+AT_RANDOM           = 25
+
+SYSCALL_NAME        = { SYS_OPENAT: 'openat', SYS_CLOSE: 'close', SYS_LSEEK: 'lseek', SYS_READ: 'read',
+                        SYS_WRITE: 'write', SYS_PREAD: 'pread', SYS_FSTAT: 'fstat', SYS_EXIT: 'exit',
+                        SYS_BRK: 'brk', SYS_MUNMAP: 'munmap', SYS_MMAP: 'mmap' }
+
+
+#--------------------------------------------------------------------------
+#   Kernel: implements the Linux/pk system call ABI on behalf of the guest
+#--------------------------------------------------------------------------
+
+class Kernel(object):
+
+    def __init__(self, cpu):
+
+        self.cpu            = cpu
+        self.files          = FileTable(Log.sandbox_dir)
+        self.brk_start      = 0             # program break: [brk_start, brk)
+        self.brk            = 0
+        self.mmap_top       = MMAP_TOP      # lowest address used by mmap() so far
+        self.exit_code      = 0
+        self.calls          = { }           # system call number -> count
+        self.recorder       = Recorder(Log.record_file) if Log.record_file else None
+        self.replayer       = Replayer(Log.replay_file) if Log.replay_file else None
+
+    @staticmethod
+    def page_up(addr):
+        return (addr + PAGE_SIZE - 1) & ~(PAGE_SIZE - 1)
+
+    def set_brk(self, end):
+
+        # Called by the loader with the end of the program image
+        self.brk_start = self.brk = end
+
+    def setup_stack(self, argv, envp, auxv):
+
+        # Builds the initial user stack as the Linux/pk ABI expects:
+        #   sp -> argc, argv[0..argc-1], NULL, envp[..], NULL, auxv pairs, AT_NULL
+        # followed by the strings at the top of the stack. Returns sp.
+        pages = self.cpu.vmem.pages
+        pages.map(STACK_TOP - STACK_SIZE, STACK_TOP)
+
+        strings = b''
+        pointers = [ ]
+        for s in argv + envp:
+            pointers.append(len(strings))
+            strings += s.encode() + b'\0'
+        random = bytes(range(16))               # AT_RANDOM bytes, fixed for reproducibility
+        str_base = (STACK_TOP - len(strings) - len(random)) & ~0xf
+        self.cpu.write_bytes(str_base, strings + random)
+
+        argp = [ str_base + p for p in pointers ]
+        auxv = auxv + [ (AT_PAGESZ, PAGE_SIZE), (AT_RANDOM, str_base + len(strings)), (AT_NULL, 0) ]
+        words = [ len(argv) ] + argp[:len(argv)] + [ 0 ] + argp[len(argv):] + [ 0 ]
+        for key, val in auxv:
+            words += [ key, val ]
+        sp = (str_base - len(words) * WORD_SIZE) & ~0xf
+        self.cpu.write_bytes(sp, struct.pack('<%dI' % len(words), *words))
+        return sp
+
+    def sys_brk(self, addr):
+
+        # Returns the new program break, or the current one on failure
+        if addr < self.brk_start or Kernel.page_up(addr) > self.mmap_top:
+            return self.brk
+        old_end = Kernel.page_up(self.brk)
+        new_end = Kernel.page_up(addr)
+        if addr > self.brk:
+            self.cpu.vmem.pages.map(self.brk_start, new_end)
+        elif new_end < old_end:
+            self.cpu.vmem.pages.unmap(new_end, old_end)
+        self.brk = addr
+        return self.brk
+
+    def sys_mmap(self, addr, length, prot, flags, fd, offset):
+
+        if not (flags & MAP_ANONYMOUS):
+            return -errno.ENODEV
+        if length == 0 or addr & (PAGE_SIZE - 1):
+            return -errno.EINVAL
+        length = Kernel.page_up(length)
+        if flags & MAP_FIXED:
+            start = addr
+        else:
+            start = self.mmap_top - length
+            if start < Kernel.page_up(self.brk):
+                return -errno.ENOMEM
+            self.mmap_top = start
+        self.cpu.vmem.pages.unmap(start, start + length)    # fresh zero-filled pages
+        self.cpu.vmem.pages.map(start, start + length)
+        return start
+
+    def sys_munmap(self, addr, length):
+
+        if addr & (PAGE_SIZE - 1) or length == 0:
+            return -errno.EINVAL
+        self.cpu.vmem.pages.unmap(addr, addr + Kernel.page_up(length))
+        return 0
+
+    @staticmethod
+    def signed(val):
+        return val - (1 << 32) if val & 0x80000000 else val
+
+    def replay(self, n, args):
+
+        # Returns the recorded result without touching host files. Only the
+        # output to stdout/stderr is reproduced.
+        rec = self.replayer.next(n)
+        if rec is None:
+            return None
+        ret, data = rec
+        a0, a1, a2 = args[:3]
+        if data and not self.cpu.write_bytes(a1, data):
+            return None
+        if n == SYS_WRITE and a0 in FileTable.STDIO and ret > 0:
+            self.files.write(a0, self.cpu.mem_views(a1, ret))
+        return ret
+
+    def dispatch(self, n, args):
+
+        # Performs system call n with the arguments args (unsigned 32-bit
+        # integers) and returns the result, or None if the replay log does
+        # not match. Shared by ecall and HTIF.
+        cpu                 = self.cpu
+        a0, a1, a2, a3, a4, a5 = args
+        data                = b''
+        self.calls[n]       = self.calls.get(n, 0) + 1
+
+        if self.replayer and n in HOST_SYSCALLS:
+            return self.replay(n, args)
+
+        if n == SYS_FSTAT:
+            ret, kstat = self.files.fstat(a0)
+            if ret == 0:
+                data    = kstat
+                if not cpu.write_bytes(a1, kstat):
+                    ret = -errno.EFAULT
+        elif n == SYS_BRK:
+            ret         = self.sys_brk(a0)
+        elif n == SYS_MMAP:
+            ret         = self.sys_mmap(a0, a1, a2, a3, a4, a5)
+        elif n == SYS_MUNMAP:
+            ret         = self.sys_munmap(a0, a1)
+        elif n == SYS_OPENAT:
+            path        = cpu.read_string(a1)
+            ret         = -errno.EFAULT if path is None else \
+                          self.files.openat(Kernel.signed(a0), path, a2, a3)
+        elif n == SYS_CLOSE:
+            ret         = self.files.close(a0)
+        elif n == SYS_EXIT:
+            self.exit_code = Kernel.signed(a0)
+            ret         = 0
+        elif n in [ SYS_READ, SYS_PREAD, SYS_WRITE ]:
+            views       = cpu.mem_views(a1, a2)
+            ret         = -errno.EFAULT                     if views is None    else \
+                          self.files.read(a0, views)        if n == SYS_READ    else \
+                          self.files.pread(a0, views, a3)   if n == SYS_PREAD   else \
+                          self.files.write(a0, views)
+            if n != SYS_WRITE and ret > 0:
+                data    = b''.join(bytes(v) for v in views)[:ret]
+        elif n == SYS_LSEEK:
+            ret         = self.files.lseek(a0, Kernel.signed(a1), a2)
+        else:
+            ret         = -errno.ENOSYS
+        if self.recorder and n in HOST_SYSCALLS:
+            self.recorder.append(n, ret, data)
+        return ret
+
+    def syscall(self):
+
+        cpu                 = self.cpu
+        args                = [ int(cpu.regs.read(r)) for r in range(10, 16) ]     # a0 - a5
+        n                   = int(cpu.regs.read(17))                                # a7
+
+        if n not in sysconst_list:
+            return SYS_ERROR
+
+        ret = self.dispatch(n, args)
+        if ret is None:
+            return SYS_ERROR
+        if n == SYS_EXIT:
+            return EXC_FIN
+        cpu.regs.write(10, ret & 0xffffffff)
+        return EXC_NONE
@@ -0,0 +1,170 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Source line tables from DWARF .debug_line and annotated listings.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import os
+
+import numpy as np
+from elftools.elf import elffile as elf
+
+
+#--------------------------------------------------------------------------
+#   LineTable: PC -> (file, line) lookup table
+#--------------------------------------------------------------------------
+
+# The line number programs of all compilation units are run once (by
+# pyelftools) and flattened into arrays sorted by address: each row covers
+# the addresses up to the next row, and the rows that end a sequence have
+# no line. Every distinct (file, line) pair gets a key, so the costs of
+# many PCs are summed per line with a single np.bincount().
+
+class LineTable(object):
+
+    cache = { }         # (path, mtime, size) -> LineTable
+
+    def __init__(self, rows = (), files = ()):
+
+        # rows: iterable of (address, file index, line), line 0 for none
+        rows = sorted(rows, key = lambda r: (r[0], r[2] != 0))      # ends of sequences first
+        self.files  = list(files)               # file index -> path
+        self.addrs  = np.array([ r[0] for r in rows ], dtype = np.int64)
+        keys        = { }                       # (file, line) -> key
+        self.row_key = np.array([ keys.setdefault((f, l), len(keys)) if l else -1
+                                  for a, f, l in rows ], dtype = np.int64)
+        self.keys   = sorted(keys, key = keys.get)      # key -> (file, line)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def from_elf(ef):
+
+        if not ef.has_dwarf_info():
+            return LineTable()
+        dwarf = ef.get_dwarf_info()
+        rows, files, index = [ ], [ ], { }
+        for cu in dwarf.iter_CUs():
+            lp = dwarf.line_program_for_CU(cu)
+            if lp is None:
+                continue
+            hdr = lp.header
+            version = hdr['version']
+            comp_dir = cu.get_top_DIE().attributes.get('DW_AT_comp_dir')
+            comp_dir = comp_dir.value.decode(errors = 'replace') if comp_dir else ''
+            dirs = [ d.decode(errors = 'replace') for d in hdr['include_directory'] ]
+            cu_files = [ ]
+            for entry in hdr['file_entry']:
+                # DWARF 5 numbers the directories from 0 (the compilation
+                # directory), the older versions from 1
+                d = entry.dir_index if version >= 5 else entry.dir_index - 1
+                base = dirs[d] if 0 <= d < len(dirs) else comp_dir
+                path = os.path.normpath(os.path.join(comp_dir, base, entry.name.decode(errors = 'replace')))
+                cu_files.append(index.setdefault(path, len(index)))
+            offset = 0 if version >= 5 else 1
+            for entry in lp.get_entries():
+                state = entry.state
+                if state is None:
+                    continue
+                if state.end_sequence:
+                    rows.append((state.address, 0, 0))
+                elif 0 <= state.file - offset < len(cu_files):
+                    rows.append((state.address, cu_files[state.file - offset], state.line))
+        files = sorted(index, key = index.get)
+        return LineTable(rows, files)
+
+    @staticmethod
+    def load(filename):
+
+        st = os.stat(filename)
+        key = (os.path.realpath(filename), st.st_mtime_ns, st.st_size)
+        table = LineTable.cache.get(key)
+        if table is None:
+            with open(filename, 'rb') as f:
+                table = LineTable.from_elf(elf.ELFFile(f))
+            LineTable.cache[key] = table
+        return table
+
+    def find(self, addrs):
+
+        # Returns the (file, line) key of each address, or -1
+        i = np.searchsorted(self.addrs, np.asarray(addrs, dtype = np.int64), side = 'right') - 1
+        return np.where(i >= 0, self.row_key[np.maximum(i, 0)], -1) if len(self.addrs) else \
+               np.full(len(addrs), -1, dtype = np.int64)
+
+    def lookup(self, addr):
+
+        # Returns (file, line) of a single address, or None
+        key = int(self.find([ addr ])[0])
+        if key < 0:
+            return None
+        f, line = self.keys[key]
+        return self.files[f], line
+
+    def attribute(self, base, hist):
+
+        # Sums a histogram with one bin per instruction word from base
+        # by source line; returns the array of costs per key and the
+        # cost of the PCs without a line
+        bins = np.nonzero(hist)[0]
+        keys = self.find(base + bins * 4)
+        weights = hist[bins]
+        per_key = np.bincount(keys[keys >= 0], weights = weights[keys >= 0],
+                              minlength = len(self)).astype(np.int64)
+        return per_key, int(weights[keys < 0].sum())
+
+    def source(self, path, search):
+
+        # Returns the lines of a source file, looking for it by its full
+        # path and then by its name in the search directories
+        for name in [ path ] + [ os.path.join(d, os.path.basename(path)) for d in search ]:
+            try:
+                with open(name, errors = 'replace') as f:
+                    return f.read().splitlines()
+            except OSError:
+                continue
+        return None
+
+    def listing(self, base, hists, events, out, search = ('.',)):
+
+        # Writes the costs of each source line (one column per event),
+        # followed by the annotated sources of the files found
+        costs = [ self.attribute(base, h) for h in hists ]
+        total = [ int(h.sum()) for h in hists ]
+        order = np.argsort(-costs[0][0], kind = 'stable') if len(self) else [ ]
+        head = ''.join("%12s" % e for e in events)
+        out.write("Source line profile: %s\n" % ', '.join("%d %s" % (t, e) for t, e in zip(total, events)))
+        out.write("%s  %-8s  line\n" % (head, '%'))
+        for key in order:
+            if not any(c[0][key] for c in costs):
+                break
+            f, line = self.keys[key]
+            out.write("%s  %6.2f%%  %s:%d\n" % (''.join("%12d" % c[0][key] for c in costs),
+                      costs[0][0][key] * 100.0 / max(total[0], 1), self.files[f], line))
+        if costs[0][1]:
+            out.write("%s  %6.2f%%  (no line information)\n" % (''.join("%12d" % c[1] for c in costs),
+                      costs[0][1] * 100.0 / max(total[0], 1)))
+
+        for f, path in enumerate(self.files):
+            lines = { line: [ c[0][key] for c in costs ] for key, (kf, line) in enumerate(self.keys)
+                      if kf == f and any(c[0][key] for c in costs) }
+            if not lines:
+                continue
+            text = self.source(path, search)
+            if text is None:
+                continue
+            out.write("\n==> %s\n" % path)
+            for n, src in enumerate(text, 1):
+                cost = ''.join("%12d" % c for c in lines[n]) if n in lines else ' ' * (12 * len(events))
+                out.write("%s %6d  %s\n" % (cost, n, src))
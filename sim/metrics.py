@@ -0,0 +1,171 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Run metrics in JSON and Prometheus text formats.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import os
+import json
+import time
+import resource
+
+import numpy as np
+
+from consts import *
+from isa import *
+from program import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+METRIC_PREFIX       = 'pyrisc_'
+OPCODE_BUFFER       = 4096          # opcode ids counted per np.bincount()
+
+INST_CLASS          = [ 'alu', 'mem', 'ctrl', 'csr' ]       # by CL_* value
+
+
+#--------------------------------------------------------------------------
+#   OpcodeCounter: number of instructions executed per opcode
+#--------------------------------------------------------------------------
+
+# The simulator passes the decoded opcode of every instruction. Opcodes
+# are mapped to small ids and stored in a preallocated buffer, which is
+# summed into the counts with np.bincount() whenever it fills up.
+
+class OpcodeCounter(object):
+
+    def __init__(self):
+
+        self.opcodes    = list(isa)         # id -> opcode
+        self.index      = { op: i for i, op in enumerate(self.opcodes) }
+        self.ids        = np.zeros(OPCODE_BUFFER, dtype = np.int16)
+        self.n          = 0
+        self.counts     = np.zeros(len(self.opcodes), dtype = np.int64)
+
+    def count(self, opcode):
+
+        self.ids[self.n] = self.index[opcode]
+        self.n += 1
+        if self.n == OPCODE_BUFFER:
+            self.flush()
+
+    def flush(self):
+
+        self.counts += np.bincount(self.ids[:self.n], minlength = len(self.counts))
+        self.n = 0
+
+    def per_opcode(self):
+
+        self.flush()
+        return { isa[op][IN_NAME]: int(c) for op, c in zip(self.opcodes, self.counts) if c }
+
+    def per_class(self):
+
+        self.flush()
+        classes = np.array([ isa[op][IN_CLASS] for op in self.opcodes ], dtype = np.int64)
+        counts = np.bincount(classes, weights = self.counts, minlength = len(INST_CLASS))
+        return { name: int(c) for name, c in zip(INST_CLASS, counts) }
+
+
+#--------------------------------------------------------------------------
+#   Metrics: samples collected at the end of a run
+#--------------------------------------------------------------------------
+
+# Each sample has a name, a type ('counter' or 'gauge'), a help string,
+# and optional labels. The same samples are written as Prometheus text
+# exposition format (e.g. for the node exporter's textfile collector) or
+# as JSON, where a labeled metric becomes a dictionary keyed by its label.
+
+class Metrics(object):
+
+    def __init__(self, simulator, program):
+
+        self.labels     = { 'simulator': simulator, 'program': os.path.basename(program) }
+        self.samples    = [ ]           # (name, type, help, label, value)
+        self.opcodes    = OpcodeCounter()
+        self.wall       = 0.0
+        self.begin      = (0, 0)        # (icount, cycle) when the run started
+
+    def start(self):
+
+        self.begin = (Stat.icount, Stat.cycle)
+        self.t0 = time.perf_counter()
+
+    def stop(self):
+        self.wall += time.perf_counter() - self.t0
+
+    def add(self, name, kind, help, value, label = None):
+        self.samples.append((name, kind, help, label, value))
+
+    def add_labeled(self, name, kind, help, key, values):
+        for k, v in values.items():
+            self.add(name, kind, help, v, (key, k))
+
+    def collect(self):
+
+        # The metrics common to both simulators
+        icount = Stat.icount - self.begin[0]
+        cycles = Stat.cycle - self.begin[1]
+        self.add('wall_seconds', 'gauge', 'Host wall-clock time of the run', round(self.wall, 6))
+        self.add('instructions_total', 'counter', 'Instructions executed', icount)
+        self.add('cycles_total', 'counter', 'Simulated CPU cycles', cycles)
+        self.add('mips', 'gauge', 'Simulated instructions per host second, in millions',
+                 round(icount / self.wall / 1e6, 6) if self.wall else 0.0)
+        self.add('cpi', 'gauge', 'Simulated cycles per instruction', round(cycles / icount, 6) if icount else 0.0)
+        self.add_labeled('instructions_by_class_total', 'counter', 'Instructions executed per class',
+                         'class', self.opcodes.per_class())
+        self.add_labeled('instructions_by_opcode_total', 'counter', 'Instructions executed per opcode',
+                         'opcode', self.opcodes.per_opcode())
+        self.add('host_max_rss_bytes', 'gauge', 'Peak resident set size of the simulator process',
+                 resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+    @staticmethod
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def write_prometheus(self, filename):
+
+        labels = ','.join('%s="%s"' % (k, self.escape(v)) for k, v in self.labels.items())
+        lines, seen = [ ], set()
+        for name, kind, help, label, value in self.samples:
+            if name not in seen:
+                seen.add(name)
+                lines.append("# HELP %s%s %s" % (METRIC_PREFIX, name, help))
+                lines.append("# TYPE %s%s %s" % (METRIC_PREFIX, name, kind))
+            extra = ',%s="%s"' % (label[0], self.escape(label[1])) if label else ''
+            lines.append("%s%s{%s%s} %s" % (METRIC_PREFIX, name, labels, extra, value))
+        with open(filename, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def write_json(self, filename):
+
+        data = dict(self.labels)
+        for name, kind, help, label, value in self.samples:
+            if label:
+                data.setdefault(name, { })[label[1]] = value
+            else:
+                data[name] = value
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent = 1)
+            f.write('\n')
+
+    def write(self, filenames):
+
+        # Files ending with '.json' get JSON, others the Prometheus format
+        for filename in filenames:
+            if filename.endswith('.json'):
+                self.write_json(filename)
+            else:
+                self.write_prometheus(filename)
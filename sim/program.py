@@ -15,9 +15,11 @@
 
 
 from elftools.elf import elffile as elf
+from elftools.elf.constants import P_FLAGS
 from consts import *
 from isa import *
 from components import *
+from symbols import *
 
 
 #--------------------------------------------------------------------------
@@ -60,6 +62,9 @@ class Program(object):
 
     def __init__(self):
         Program.asmcache = AsmCache()
+        Program.symbols = { }           # symbol name -> address
+        Program.symtab = SymbolIndex()  # address -> function or object symbol
+        Program.text = (0, 0)           # address range of executable segments
 
     def check_elf(self, filename, header):
         e_ident = header['e_ident']
@@ -99,37 +104,54 @@ class Program(object):
                 return WORD(0)
 
             entry_point = WORD(efh['e_entry'])
+            Program.symtab = SymbolIndex.load(filename, ef)
+            Program.symbols = Program.symtab.symbols
+
+            image_end = 0
+            text_start, text_end = 0xffffffff, 0
             for seg in ef.iter_segments():
                 addr = seg.header['p_vaddr']
                 memsz = seg.header['p_memsz']
                 if seg.header['p_type'] != 'PT_LOAD':
                     continue
+                if seg.header['p_flags'] & P_FLAGS.PF_X:
+                    text_start = min(text_start, addr)
+                    text_end = max(text_end, addr + memsz)
 
                 if Log.vmem_activate:
-                    if addr == 0x10000:
-                        cpu.vmem.mem1_init(addr, memsz, WORD_SIZE)
-                        mem = cpu.vmem.mem1
-                    else:
-                        cpu.vmem.mem2_init(addr, memsz, WORD_SIZE)
-                        mem = cpu.vmem.mem2
-                
+                    # Load the segment at its virtual address on demand-allocated pages
+                    image_end = max(image_end, addr + memsz)
+                    cpu.vmem.pages.map(addr & ~(PAGE_SIZE - 1), addr + memsz)
+                    cpu.write_bytes(addr, seg.data())
+                    continue
+
+                if addr >= cpu.imem.mem_start and addr + memsz < cpu.imem.mem_end:
+                    mem = cpu.imem
+                elif addr >= cpu.dmem.mem_start and addr + memsz < cpu.dmem.mem_end:
+                    mem = cpu.dmem
                 else:
-                    if addr >= cpu.imem.mem_start and addr + memsz < cpu.imem.mem_end:
-                        mem = cpu.imem
-                    elif addr >= cpu.dmem.mem_start and addr + memsz < cpu.dmem.mem_end:
-                        mem = cpu.dmem
-                    else:
-                        print("Invalid address range: 0x%08x - 0x%08x" \
-                            % (addr, addr + memsz - 1))
-                        continue
+                    print("Invalid address range: 0x%08x - 0x%08x" \
+                        % (addr, addr + memsz - 1))
+                    continue
 
                 image = seg.data()
                 for i in range(0, len(image), WORD_SIZE):
                     c = int.from_bytes(image[i:i+WORD_SIZE], byteorder='little')
                     mem.access(True, addr, c, M_XWR)
                     addr += WORD_SIZE
+            if text_end:
+                Program.text = (text_start, text_end)
+            if Log.vmem_activate:
+                cpu.kernel.set_brk(image_end)
             return entry_point
     
+    @staticmethod
+    def target(addr):
+
+        # Annotates a branch or jump target with its symbol, as objdump does
+        name = Program.symtab.name(int(addr) & 0xffffffff)
+        return " <%s>" % name if name else ''
+
     @staticmethod
     def disasm(pc, inst):
         if inst == BUBBLE:
@@ -173,14 +195,21 @@ class Program(object):
             asm = "%-7s%s, %d(%s)" % (opname, rname[rs2], SWORD(imm_s), rname[rs1])
         elif info[IN_TYPE] == B_TYPE:
             asm = "%-7s%s, %s, 0x%08x" % (opname, rname[rs1], rname[rs2], pc + SWORD(imm_b))
+            asm += Program.target(pc + SWORD(imm_b))
         elif info[IN_TYPE] == J_TYPE:
             asm = "%-7s%s, 0x%08x" % (opname, rname[rd], pc + SWORD(imm_j))
+            asm += Program.target(pc + SWORD(imm_j))
         elif info[IN_TYPE] == X_TYPE:
             return info[IN_NAME]
         elif info[IN_TYPE] == P_TYPE:
             asm = "%-7s%s, %s" % (opname, csr_name(inst >> 20), rname[rd])
         elif info[IN_TYPE] == PI_TYPE:
             asm = "%-7s%s, %d" % (opname, csr_name(inst >> 20), rs1)
+        elif info[IN_TYPE] == A_TYPE:
+            if opcode == LR_W:
+                asm = "%-7s%s, (%s)" % (opname, rname[rd], rname[rs1])
+            else:
+                asm = "%-7s%s, %s, (%s)" % (opname, rname[rd], rname[rs2], rname[rs1])
         else:
             asm = "(unknown)"
 
@@ -200,6 +229,39 @@ class Log(object):
     start_cycle     = 0
 
     vmem_activate   = False
+    kernel_activate = False     # run on the built-in proxy kernel instead of pk
+    sandbox_dir     = '.'       # host directory visible to the guest program
+    record_file     = None      # log of host inputs to write (record mode)
+    replay_file     = None      # log of host inputs to read (replay mode)
+    gdb_target      = None      # TCP port or Unix socket path for the GDB stub
+    watch_list      = [ ]       # data watchpoints given in the command line
+    trigger_list    = [ ]       # trace window triggers given in the command line
+    sample_period   = 0         # instructions between PC samples (0: no sampling)
+    sample_interval = 0.0       # seconds of host CPU time between PC samples
+    callgraph_files = [ ]       # call graph outputs (callgrind or .folded)
+    line_file       = None      # source line profile output ('-' for stdout)
+    coverage_files  = [ ]       # coverage outputs (.npz maps, .json or lcov)
+    metrics_files   = [ ]       # metrics outputs (.json or Prometheus text)
+    interval        = 0         # instructions per interval of the interval stats
+    interval_files  = [ ]       # interval stats outputs (.npz or .csv)
+    heartbeat       = 0.0       # seconds between progress reports (0: off)
+    status_file     = None      # file rewritten with the progress at each report
+    restore_file    = None      # checkpoint to resume from
+    harts           = 1         # harts, each run by a worker process
+    quantum         = 1000      # instructions between synchronizations of the harts
+    flight_size     = 256       # instructions kept by the flight recorder
+    trace_file      = None      # binary trace output
+    trace_compression = 0       # TRACE_NONE, TRACE_ZLIB, or TRACE_LZMA
+    async_log       = True      # format logs in a background thread
+    writer          = None      # AsyncWriter in use, if any
+
+    @staticmethod
+    def flush():
+
+        # Waits until the queued logs are written so that any other output
+        # appears in the same order as with synchronous logging
+        if Log.writer:
+            Log.writer.sync()
 
 
 #--------------------------------------------------------------------------
@@ -214,10 +276,20 @@ class Stat(object):
     inst_alu        = 0         # number of ALU instructions
     inst_mem        = 0         # number of load/store instructions
     inst_ctrl       = 0         # number of control transfer instructions
+    inst_store      = 0         # number of stores, sc.w and amo*.w among inst_mem
+    taken_branches  = 0         # number of conditional branches taken
+
+    itlb_access     = 0         # number of translated fetches (Sv32)
+    itlb_miss       = 0         # number of I-TLB misses (page table walks)
+    dtlb_access     = 0         # number of translated loads and stores
+    dtlb_miss       = 0         # number of D-TLB misses
 
     @staticmethod
     def show():
-        print("%d instructions executed in %d cycles. CPI = %.3f" % (Stat.icount, Stat.cycle, Stat.cycle / Stat.icount))
-        print("Data transfer:    %d instructions (%.2f%%)" % (Stat.inst_mem, Stat.inst_mem * 100.0 / Stat.icount))
-        print("ALU operation:    %d instructions (%.2f%%)" % (Stat.inst_alu, Stat.inst_alu * 100.0 / Stat.icount))
-        print("Control transfer: %d instructions (%.2f%%)" % (Stat.inst_ctrl, Stat.inst_ctrl * 100.0 / Stat.icount))
+        print("%d instructions executed in %d cycles. CPI = %.3f" % (Stat.icount, Stat.cycle, 0.0 if Stat.icount == 0 else Stat.cycle / Stat.icount))
+        print("Data transfer:    %d instructions (%.2f%%)" % (Stat.inst_mem, 0.0 if Stat.icount == 0 else Stat.inst_mem * 100.0 / Stat.icount))
+        print("ALU operation:    %d instructions (%.2f%%)" % (Stat.inst_alu, 0.0 if Stat.icount == 0 else Stat.inst_alu * 100.0 / Stat.icount))
+        print("Control transfer: %d instructions (%.2f%%)" % (Stat.inst_ctrl, 0.0 if Stat.icount == 0 else Stat.inst_ctrl * 100.0 / Stat.icount))
+        if Stat.itlb_access or Stat.dtlb_access:
+            for name, access, miss in [ ('I-TLB', Stat.itlb_access, Stat.itlb_miss), ('D-TLB', Stat.dtlb_access, Stat.dtlb_miss) ]:
+                print("%s:            %d accesses, %d misses (hit rate %.2f%%)" % (name, access, miss, 0.0 if access == 0 else (access - miss) * 100.0 / access))
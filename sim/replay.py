@@ -0,0 +1,97 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Deterministic record and replay of host inputs.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import atexit
+import struct
+
+from consts import *
+from program import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+# Log file layout:
+#   header: magic 'PYRR' + version (u32)
+#   record: syscall number (u16), result (i64), data length (u32), data
+# The data is whatever the host wrote into guest memory: the bytes read by
+# read()/pread() or the struct kernel_stat image filled by fstat().
+
+REPLAY_MAGIC        = b'PYRR'
+REPLAY_VERSION      = 1
+REPLAY_HEADER       = struct.Struct('<4sI')
+REPLAY_RECORD       = struct.Struct('<HqI')
+
+# System calls whose results depend on the host
+HOST_SYSCALLS       = [ SYS_OPENAT, SYS_CLOSE, SYS_LSEEK, SYS_READ, SYS_WRITE,
+                        SYS_PREAD, SYS_FSTAT ]
+
+
+#--------------------------------------------------------------------------
+#   Recorder: appends the host inputs of a run to a log file
+#--------------------------------------------------------------------------
+
+class Recorder(object):
+
+    def __init__(self, filename):
+
+        self.f = open(filename, 'wb')
+        self.f.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION))
+        atexit.register(self.close)
+
+    def append(self, n, ret, data = b''):
+        self.f.write(REPLAY_RECORD.pack(n, ret, len(data)))
+        self.f.write(data)
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+
+
+#--------------------------------------------------------------------------
+#   Replayer: feeds the recorded host inputs back to the program
+#--------------------------------------------------------------------------
+
+class Replayer(object):
+
+    def __init__(self, filename):
+
+        with open(filename, 'rb') as f:
+            self.log = f.read()
+        magic, version = REPLAY_HEADER.unpack_from(self.log, 0)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError("not a replay log")
+        self.offset = REPLAY_HEADER.size
+        self.count  = 0             # number of records consumed
+
+    def next(self, n):
+
+        # Returns (result, data) of the next record, or None if the program
+        # does not issue the same system call as the recorded run
+        if self.offset + REPLAY_RECORD.size > len(self.log):
+            Log.flush()
+            print("Replay log exhausted at syscall #%d" % self.count)
+            return None
+        rec_n, ret, size = REPLAY_RECORD.unpack_from(self.log, self.offset)
+        if rec_n != n:
+            Log.flush()
+            print("Replay diverged at syscall #%d: expected %d, got %d" % (self.count, rec_n, n))
+            return None
+        start = self.offset + REPLAY_RECORD.size
+        self.offset = start + size
+        self.count += 1
+        return ret, self.log[start:start + size]
@@ -0,0 +1,110 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Statistical PC sampling profiler.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import signal
+
+import numpy as np
+
+from consts import *
+from program import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+SAMPLE_TIMER        = signal.ITIMER_PROF    # counts the CPU time of the simulator
+SAMPLE_SIGNAL       = signal.SIGPROF
+
+
+#--------------------------------------------------------------------------
+#   PCSampler: histogram of the guest PCs sampled during a run
+#--------------------------------------------------------------------------
+
+# A sample is taken every 'period' instructions (Sim.step() compares the
+# instruction count with the next sample point) or, if 'interval' is given
+# in seconds, on every tick of a profiling timer. Each sample increments
+# one bin per instruction word of the text segment; the PCs outside of it
+# (e.g. the boot ROM) are only counted. The bins are resolved to functions
+# once, when the profile is printed.
+
+class PCSampler(object):
+
+    def __init__(self, text, period = 0, interval = 0.0):
+
+        self.start, self.end = text
+        self.period     = period
+        self.interval   = interval
+        self.hist       = np.zeros(max(self.end - self.start, 0) // WORD_SIZE, dtype = np.int64)
+        self.other      = 0             # samples outside the text segment
+        self.cpu        = None
+
+    def sample(self, pc):
+
+        i = (int(pc) - self.start) >> 2
+        if 0 <= i < len(self.hist):
+            self.hist[i] += 1
+        else:
+            self.other += 1
+        return self.period
+
+    def tick(self, signum, frame):
+        self.sample(self.cpu.pc.read())
+
+    def start_timer(self, cpu):
+
+        if self.interval:
+            self.cpu = cpu
+            signal.signal(SAMPLE_SIGNAL, self.tick)
+            signal.setitimer(SAMPLE_TIMER, self.interval, self.interval)
+
+    def stop_timer(self):
+
+        if self.interval:
+            signal.setitimer(SAMPLE_TIMER, 0)
+            signal.signal(SAMPLE_SIGNAL, signal.SIG_DFL)
+
+    def functions(self, symtab):
+
+        # Returns [(samples, name, start, end)] sorted by the number of
+        # samples, with the samples outside of any symbol as '(unknown)'
+        bins = np.nonzero(self.hist)[0]
+        index = symtab.find(self.start + bins * WORD_SIZE)
+        counts = np.bincount(index[index >= 0], weights = self.hist[bins][index >= 0],
+                             minlength = len(symtab)).astype(np.int64)
+        result = [ ]
+        for i in np.nonzero(counts)[0]:
+            start, end = symtab.range(i)
+            result.append((int(counts[i]), symtab.names[i], start, end))
+        unknown = int(self.hist[bins][index < 0].sum())
+        if unknown:
+            result.append((unknown, '(unknown)', 0, 0))
+        return sorted(result, key = lambda r: -r[0])
+
+    def report(self, symtab):
+
+        total = int(self.hist.sum()) + self.other
+        if self.interval:
+            print("Flat profile: %d samples, one every %g ms of host CPU time" % (total, self.interval * 1000))
+        else:
+            print("Flat profile: %d samples, one every %d instructions" % (total, self.period))
+        print("  samples       %  function                        address range")
+        rows = self.functions(symtab)
+        if self.other:
+            rows.append((self.other, '(outside text)', 0, 0))
+        for count, name, start, end in rows:
+            frange = "0x%08x-0x%08x" % (start, end) if end else ''
+            print("%9d  %6.2f  %-30s  %s" % (count, count * 100.0 / total, name, frange))
@@ -15,11 +15,51 @@
 
 
 import sys
+import asyncio
 
 from consts import *
 from isa import *
 from components import *
 from program import *
+from watch import *
+from bintrace import *
+from asynclog import *
+from checkpoint import STAT_FIELDS
+from trigger import *
+from roi import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+RUN_QUANTUM         = 10000     # instructions per step of run_iter()
+
+# Class attributes that belong to a single run, swapped by Sim.switch()
+SIM_STATE           = [ 'cpu', 'boot', 'tohost', 'watch', 'watch_pages', 'flight', 'tracer',
+                        'window', 'sampler', 'callgraph', 'coverage', 'opcodes', 'sample_at',
+                        'intervals', 'interval_at', 'roi' ]
+PROGRAM_STATE       = [ 'asmcache', 'symbols', 'symtab', 'text' ]
+
+
+#--------------------------------------------------------------------------
+#   RunStatus: the progress of a run, yielded by Sim.run_iter()
+#--------------------------------------------------------------------------
+
+class RunStatus(object):
+
+    def __init__(self, status, icount, cycle, pc):
+
+        self.status     = status        # EXC_NONE until the run ends
+        self.done       = status != EXC_NONE
+        self.icount     = icount
+        self.cycle      = cycle
+        self.pc         = pc            # next instruction to execute
+        self.stats      = None          # Stat counters of the run
+
+    def __repr__(self):
+        return "RunStatus(status=%d, done=%s, icount=%d, cycle=%d, pc=0x%08x)" % \
+               (self.status, self.done, self.icount, self.cycle, self.pc)
 
 #--------------------------------------------------------------------------
 #   Sim: simulates the CPU execution
@@ -27,34 +67,182 @@ from program import *
 
 class Sim(object):
 
+    pending = 0                         # PENDING_* flags set by signal handlers
+
+    @staticmethod
+    def run(cpu, entry_point, boot = False):
+
+        Sim.start(cpu, entry_point, boot)
+        status = Sim.execute()
+        Sim.finish(status)
+        return status
+
+    @staticmethod
+    def run_iter(cpu, entry_point, quantum = RUN_QUANTUM, boot = False):
+
+        # Returns a generator which executes up to quantum instructions
+        # each time it is resumed and yields a RunStatus; the last one has
+        # done set, after the run is finished as in run(). The state of
+        # the run (Sim, Stat and Program) is saved when the generator
+        # yields and installed again when it is resumed, so that several
+        # generators can be interleaved in a single thread. The run starts
+        # from the current Stat counters and program.
+        outer = Sim.switch(None)
+        Sim.start(cpu, entry_point, boot)
+        return Sim.steps(Sim.switch(outer), quantum)
+
     @staticmethod
-    def run(cpu, entry_point):
+    def steps(state, quantum):
+
+        status = EXC_NONE
+        while status == EXC_NONE:
+            outer = Sim.switch(state)
+            try:
+                status = Sim.execute(None, Stat.icount + quantum)
+                if status != EXC_NONE:
+                    Sim.finish(status)
+                progress = RunStatus(status, Stat.icount, Stat.cycle, int(Sim.cpu.pc.read()))
+            finally:
+                state = Sim.switch(outer)
+            progress.stats = state[1]
+            yield progress
+
+    @staticmethod
+    async def run_async(cpu, entry_point, quantum = RUN_QUANTUM, boot = False):
+
+        # Runs to the end, giving control to the event loop after every
+        # quantum instructions, and returns the last RunStatus
+        for progress in Sim.run_iter(cpu, entry_point, quantum, boot):
+            if progress.done:
+                return progress
+            await asyncio.sleep(0)
+
+    @staticmethod
+    def switch(state):
+
+        # Installs state (from a previous call; None leaves everything as
+        # it is) and returns the state it replaces
+        old = ({ f: getattr(Sim, f, None) for f in SIM_STATE },
+               { f: getattr(Stat, f) for f in STAT_FIELDS },
+               { f: getattr(Program, f, None) for f in PROGRAM_STATE })
+        if state is not None:
+            for cls, values in zip([ Sim, Stat, Program ], state):
+                for f, value in values.items():
+                    setattr(cls, f, value)
+        return old
+
+    @staticmethod
+    def start(cpu, entry_point, boot = False):
 
         Sim.cpu = cpu
         Sim.cpu.pc.write(entry_point)
-        status = EXC_NONE
+        Sim.boot = boot                 # fence ends the run while booting pk
+        Sim.tohost = cpu.htif.tohost if cpu.htif else -1
+        Sim.watch = cpu.watch
+        Sim.watch_pages = cpu.watch.pages       # pages with data watchpoints
+        Sim.flight = cpu.flight
+        Sim.tracer = cpu.tracer
+        Sim.window = cpu.window
+        Sim.sampler = cpu.sampler
+        Sim.callgraph = cpu.callgraph
+        Sim.coverage = cpu.coverage
+        Sim.opcodes = cpu.metrics.opcodes if cpu.metrics else None
+        Sim.roi = cpu.roi
+        Sim.sample_at = -1              # icount before the next sampled instruction
+        Sim.intervals = cpu.intervals
+        Sim.interval_at = Sim.intervals.start() if Sim.intervals else 0
+        if Sim.sampler:
+            if Sim.sampler.period:
+                Sim.sample_at = Stat.icount + Sim.sampler.period - 1
+            Sim.sampler.start_timer(cpu)
+        if Sim.window:
+            Sim.window.branch(int(entry_point))
+        if Sim.coverage:
+            Sim.coverage.enter(int(entry_point))
+        if Log.async_log and Log.level in [ 3, 4 ] and not Log.writer:
+            Log.writer = AsyncWriter(Sim.format_log)
 
-        while True:
-            # Execute a single instruction
-            status = Sim.single_step()
-            
-            # Update stats
-            Stat.cycle      += 1
-            Stat.icount     += 1
+    @staticmethod
+    def step():
 
-            # Show logs after executing a single instruction
-            if Log.level >= 5:
-                Sim.cpu.regs.dump()
-            if Log.level >= 6:
-                Sim.cpu.dmem.dump(skipzero = True)
+        # Sample the PC of the instruction about to execute
+        if Stat.icount == Sim.sample_at:
+            Sim.sample_at += Sim.sampler.sample(Sim.cpu.pc.read())
+
+        # Execute a single instruction
+        status = Sim.single_step()
+
+        # Update stats
+        Stat.cycle      += 1
+        Stat.icount     += 1
+        if Stat.icount == Sim.interval_at:
+            Sim.interval_at += Sim.intervals.sample()
+
+        # Show logs after executing a single instruction
+        if Log.level >= 5:
+            Sim.cpu.regs.dump()
+        if Log.level >= 6:
+            Sim.cpu.dmem.dump(skipzero = True)
+        return status
+
+    @staticmethod
+    def execute(breakpoints = None, icount_limit = 0):
+
+        # Runs until an exception occurs, or for icount_limit instructions
+        # if it is given (a quantum of run_iter() or of a hart), and then
+        # returns EXC_NONE. Only a debugger passes breakpoints (a set of
+        # PCs): execution also stops before an instruction at one of them
+        # or when a watchpoint triggers. Any PC can be a breakpoint, so
+        # that path checks after every instruction; the others do not.
+        if breakpoints is None:
+            if not icount_limit:
+                while True:
+                    status = Sim.step()
+                    if status == EXC_PENDING:
+                        status = Sim.service()
+                    if not status == EXC_NONE:
+                        return status
+            for _ in range(icount_limit - Stat.icount):
+                status = Sim.step()
+                if status == EXC_PENDING:
+                    status = Sim.service()
+                if not status == EXC_NONE:
+                    return status
+            return EXC_NONE
+        while True:
+            status = Sim.step()
+            if status == EXC_PENDING:
+                status = Sim.service()
             if not status == EXC_NONE:
-                break
-      
+                return status
+            if Sim.cpu.pc.read() in breakpoints or Stat.icount >= icount_limit or \
+               Sim.watch.triggered:
+                return EXC_NONE
+
+    @staticmethod
+    def finish(status, quiet = False):
+
+        # quiet: the harts leave the messages and dumps to Harts.report()
+        Log.flush()
+        if Sim.sampler:
+            Sim.sampler.stop_timer()
+        if Sim.callgraph:
+            Sim.callgraph.finish((Stat.icount,))
+        if Sim.coverage:
+            Sim.coverage.finish(int(Sim.cpu.pc.read()))
+        if Sim.intervals:
+            Sim.intervals.finish()
+        if quiet:
+            return
+
         # Handle exceptions, if any
         if (status & EXC_DMEM_ERROR):
             print("Exception '%s' occurred at 0x%08x -- Program terminated" % (EXC_MSG[EXC_DMEM_ERROR], Sim.cpu.pc.read()))
         elif (status & EXC_FIN):
-            print("Execution completed")
+            if Sim.cpu.kernel.exit_code:
+                print("Execution completed with exit code %d" % Sim.cpu.kernel.exit_code)
+            else:
+                print("Execution completed")
         elif (status & EXC_ILLEGAL_INST):
             print("Exception '%s' occurred at 0x%08x -- Program terminated" % (EXC_MSG[EXC_ILLEGAL_INST], Sim.cpu.pc.read()))
         elif (status & EXC_IMEM_ERROR):
@@ -63,6 +251,12 @@ class Sim(object):
             print("***** pk: Ready to start C program *****")
         elif (status & EXC_OS_ERROR):
             print("Invalid ECALL. Pyrisc simulater cannot process.")
+        elif (status & EXC_INTERRUPT):
+            print("Interrupted at 0x%08x after %d instructions" % (Sim.cpu.pc.read(), Stat.icount))
+
+        # Show the instructions that led to a fault
+        if (status & (EXC_DMEM_ERROR | EXC_ILLEGAL_INST | EXC_IMEM_ERROR | EXC_INTERRUPT)) and Sim.flight:
+            Sim.flight.dump()
 
         # Show logs after finishing the program execution
         if Log.level > 0:
@@ -73,20 +267,44 @@ class Sim(object):
             
 
     @staticmethod
-    def log(pc, inst, rd, wbdata, pc_next):
+    def log(pc, inst, rd, wbdata, pc_next, mem_addr = 0, flags = 0):
 
+        if Sim.flight:
+            Sim.flight.record(Stat.cycle, pc, inst, rd, wbdata, mem_addr)
+        if Sim.window and not Sim.window.accept(Stat.cycle, pc, inst, mem_addr, flags):
+            return
+        if Sim.tracer:
+            Sim.tracer.write(Stat.cycle, pc, inst, pc_next, rd, wbdata, mem_addr, wbdata, flags)
         if Stat.cycle < Log.start_cycle:
             return
+        if Log.writer:
+            Log.writer.put((Stat.cycle, pc, inst, rd, wbdata, pc_next))
+            return
         if Log.level >= 4:
             info = "# R[%d] <- 0x%08x, pc_next=0x%08x" % (rd, wbdata, pc_next) if rd else \
                    "# pc_next=0x%08x" % pc_next
         else:
             info = ''
         if Log.level >= 3:
-            print("%d 0x%08x: %-30s%-s" % (Stat.cycle, pc, Program.disasm(pc, inst), info))
+            print("%d 0x%08x: %-29s %-s" % (Stat.cycle, pc, Program.disasm(pc, inst), info))
         else:
             return
     
+    @staticmethod
+    def format_log(records):
+
+        # Formats the records queued by log(), in the writer thread
+        lines = [ ]
+        disasm = Log.writer.disasm
+        for cycle, pc, inst, rd, wbdata, pc_next in records:
+            if Log.level >= 4:
+                info = "# R[%d] <- 0x%08x, pc_next=0x%08x" % (rd, wbdata, pc_next) if rd else \
+                       "# pc_next=0x%08x" % pc_next
+            else:
+                info = ''
+            lines.append("%d 0x%08x: %-29s %-s\n" % (cycle, pc, disasm(pc, inst), info))
+        return ''.join(lines)
+
     def run_alu(pc, inst, opcode, cs):
         np.seterr(all='ignore')
         Stat.inst_alu += 1
@@ -116,8 +334,8 @@ class Sim(object):
                       WORD(alu1 & alu2)                     if (cs[IN_OP] == ALU_AND)    else \
                       WORD(alu1 | alu2)                     if (cs[IN_OP] == ALU_OR)     else \
                       WORD(alu1 ^ alu2)                     if (cs[IN_OP] == ALU_XOR)    else \
-                      SWORD(alu1) < SWORD(alu2)             if (cs[IN_OP] == ALU_SLT)    else \
-                      WORD(alu1) < WORD(alu2)               if (cs[IN_OP] == ALU_SLTU)   else \
+                      WORD(SWORD(alu1) < SWORD(alu2))       if (cs[IN_OP] == ALU_SLT)    else \
+                      WORD(WORD(alu1) < WORD(alu2))         if (cs[IN_OP] == ALU_SLTU)   else \
                       WORD(alu1 << (alu2 & 0x1f))           if (cs[IN_OP] == ALU_SLL)    else \
                       WORD(SWORD(alu1) >> (alu2 & 0x1f))    if (cs[IN_OP] == ALU_SRA)    else \
                       WORD(alu1 >> (alu2 & 0x1f))           if (cs[IN_OP] == ALU_SRL)    else \
@@ -128,138 +346,186 @@ class Sim(object):
         Sim.cpu.regs.write(rd, alu_out)
         Sim.cpu.pc.write(pc_next)
         Sim.log(pc, inst, rd, alu_out, pc_next)
+        if rd == 0:
+            Sim.marker(ROI.marker(inst))
         return EXC_NONE
 
+    @staticmethod
+    def marker(code):
+
+        # Acts on a region of interest marker (see roi.py); the trace
+        # markers open and close the trace window, making one if needed
+        if code == ROI_BEGIN:
+            Sim.roi.start(1)
+        elif code == ROI_END:
+            Sim.roi.stop(1)
+        elif code in [ ROI_TRACE_ON, ROI_TRACE_OFF ]:
+            if not Sim.window:
+                Sim.window = Sim.cpu.window = TraceWindow()
+            Sim.window.toggle(code == ROI_TRACE_ON)
+
     def run_mem(pc, inst, opcode, cs):
+
+        # Loads and stores to a page with data watchpoints take the slow path
+        if Sim.watch_pages:
+            load        = cs[IN_OP] == MEM_LD
+            imm         = RISCV.imm_i(inst) if load else RISCV.imm_s(inst) if cs[IN_OP] == MEM_ST else 0
+            mem_addr    = (int(Sim.cpu.regs.read(RISCV.rs1(inst))) + int(SWORD(imm))) & 0xffffffff
+            size        = 1 << int(((inst & FUNCT3_MASK) >> FUNCT3_SHIFT) & 0x3)
+            if Sim.watch.watched(mem_addr, size):
+                return Sim.run_mem_watched(pc, inst, opcode, cs, mem_addr, size, load)
+        return Sim.exec_mem(pc, inst, opcode, cs)
+
+    def run_mem_watched(pc, inst, opcode, cs, mem_addr, size, load):
+
+        views = Sim.cpu.mem_views(mem_addr, size)
+        old = int.from_bytes(b''.join(bytes(v) for v in views), 'little') if views else 0
+        status = Sim.exec_mem(pc, inst, opcode, cs)
+        if status == EXC_NONE:
+            new = int.from_bytes(b''.join(bytes(v) for v in views), 'little') if views else 0
+            Sim.watch.hit(pc, inst, mem_addr, size, WATCH_READ if load else WATCH_WRITE, old, new)
+        return status
+
+    def exec_mem(pc, inst, opcode, cs):
+        if cs[IN_OP] == MEM_AMO:
+            return Sim.exec_amo(pc, inst, opcode)
         Stat.inst_mem += 1
-       
-        rs1         = RISCV.rs1(inst)
-        rs1_data    = Sim.cpu.regs.read(rs1)
+
+        rs1_data    = int(Sim.cpu.regs.read(RISCV.rs1(inst)))
+        funct3      = (inst & FUNCT3_MASK) >> FUNCT3_SHIFT
 
         if (cs[IN_OP] == MEM_LD):
             rd          = RISCV.rd(inst)
-            imm_i       = RISCV.imm_i(inst)
-            mem_addr    = rs1_data + SWORD(imm_i)
-            funct3      = (inst & FUNCT3_MASK) >> FUNCT3_SHIFT
-            remainder   = mem_addr % WORD_SIZE
-            if (remainder != 0 and funct3 != 2):
-                mem_addr -= remainder
-            mem_data, dmem_ok = Sim.cpu.dmem.access(True, mem_addr, 0, M_XRD)
-            
-            if dmem_ok:
-                if (funct3 == 0):                           # LB
-                    mem_data = (mem_data >> (remainder * 8)) & 0xFF
-                    sign = mem_data >> 7
-                    mem_data += ((0 - sign) << 8)
+            mem_addr    = (rs1_data + int(SWORD(RISCV.imm_i(inst)))) & 0xffffffff
+            mem         = Sim.cpu.mmu if Sim.cpu.mmu.on else Sim.cpu.data_memory(mem_addr)
+            if Sim.intervals:
+                Sim.intervals.pages.add(mem_addr >> PAGE_SHIFT)
+            if mem is None:
+                return EXC_DMEM_ERROR
+            try:
+                if (funct3 == 2):                           # LW
+                    mem_data = mem.load32(mem_addr)
                 elif (funct3 == 4):                         # LBU
-                    mem_data = (mem_data >> (remainder * 8)) & 0xFF
-                elif (funct3 == 1):                         # LH
-                    mem_data = (mem_data >> (remainder * 8)) & 0xFFFF
-                    sign = mem_data >> 15
-                    mem_data += ((0 - sign) << 8)
+                    mem_data = mem.load8(mem_addr)
                 elif (funct3 == 5):                         # LHU
-                    mem_data = (mem_data >> (remainder * 8)) & 0xFFFF
-                elif (funct3 != 2):
-                    return EXC_ILLEGAL_INST
-                Sim.cpu.regs.write(rd, mem_data)
-            else:
-                mem_data, vdmem_ok = Sim.cpu.vmem.access(True, mem_addr, 0, M_XRD)
-                if vdmem_ok:
-                    if (funct3 == 0):                           # LB
-                        mem_data = (mem_data >> (remainder * 8)) & 0xFF
-                        sign = mem_data >> 7
-                        mem_data += ((0 - sign) << 8)
-                    elif (funct3 == 4):                         # LBU
-                        mem_data = (mem_data >> (remainder * 8)) & 0xFF
-                    elif (funct3 == 1):                         # LH
-                        mem_data = (mem_data >> (remainder * 8)) & 0xFFFF
-                        sign = mem_data >> 15
-                        mem_data += ((0 - sign) << 8)
-                    elif (funct3 == 5):                         # LHU
-                        mem_data = (mem_data >> (remainder * 8)) & 0xFFFF
-                    elif (funct3 != 2):
-                        return EXC_ILLEGAL_INST
-                    Sim.cpu.regs.write(rd, mem_data)
+                    mem_data = mem.load16(mem_addr)
+                elif (funct3 == 0):                         # LB
+                    mem_data = ((mem.load8(mem_addr) ^ 0x80) - 0x80) & 0xffffffff
+                elif (funct3 == 1):                         # LH
+                    mem_data = ((mem.load16(mem_addr) ^ 0x8000) - 0x8000) & 0xffffffff
                 else:
-                    mem_data, rstvec_ok = Sim.cpu.rstvec.access(True, mem_addr, 0, M_XRD)        # TODO: Combine memories
-                    if rstvec_ok:
-                        if (funct3 == 0):                           # LB
-                            mem_data = (mem_data >> (remainder * 8)) & 0xFF
-                            sign = mem_data >> 7
-                            mem_data += ((0 - sign) << 8)
-                        elif (funct3 == 4):                         # LBU
-                            mem_data = (mem_data >> (remainder * 8)) & 0xFF
-                        elif (funct3 == 1):                         # LH
-                            mem_data = (mem_data >> (remainder * 8)) & 0xFFFF
-                            sign = mem_data >> 15
-                            mem_data += ((0 - sign) << 8)
-                        elif (funct3 == 5):                         # LHU
-                            mem_data = (mem_data >> (remainder * 8)) & 0xFFFF
-                        elif (funct3 != 2):
-                            return EXC_ILLEGAL_INST
-                        Sim.cpu.regs.write(rd, mem_data)
-                    else:
-                        mem_data, imem_ok = Sim.cpu.imem.access(True, mem_addr, 0, M_XRD)
-                        if imem_ok:
-                            if (funct3 == 0):                           # LB
-                                mem_data = (mem_data >> (remainder * 8)) & 0xFF
-                                sign = mem_data >> 7
-                                mem_data += ((0 - sign) << 8)
-                            elif (funct3 == 4):                         # LBU
-                                mem_data = (mem_data >> (remainder * 8)) & 0xFF
-                            elif (funct3 == 1):                         # LH
-                                mem_data = (mem_data >> (remainder * 8)) & 0xFFFF
-                                sign = mem_data >> 15
-                                mem_data += ((0 - sign) << 8)
-                            elif (funct3 == 5):                         # LHU
-                                mem_data = (mem_data >> (remainder * 8)) & 0xFFFF
-                            elif (funct3 != 2):
-                                return EXC_ILLEGAL_INST
-                            Sim.cpu.regs.write(rd, mem_data)
-                        else:
-                            return EXC_DMEM_ERROR
-            
+                    return EXC_ILLEGAL_INST
+            except MemoryFault:
+                return EXC_DMEM_ERROR
+            Sim.cpu.regs.write(rd, mem_data)
+
         else:
-            rd          = 0                     
-            rs2         = RISCV.rs2(inst)
-            rs2_data    = Sim.cpu.regs.read(rs2)
-
-            imm_s       = RISCV.imm_s(inst)
-            mem_addr    = rs1_data + SWORD(imm_s)
-            funct3      = (inst & FUNCT3_MASK) >> FUNCT3_SHIFT
-            remainder   = mem_addr % WORD_SIZE
-            if (remainder != 0 and funct3 != 2):
-                mem_addr -= remainder
-            if (funct3 == 0):                               # SB
-                rs2_data = rs2_data & 0xFF
-            # elif (funct3 == 1):                           # SH
-            #     rs2_data = rs2_data & 0xFFFF
-            rs2_data = rs2_data << (remainder * 8)
-            save_data, dmem_ok = Sim.cpu.dmem.access(True, mem_addr, 0, M_XRD)
-            if dmem_ok:
-                save_data = save_data & ((1 << (remainder * 8)) - 1)
-                rs2_data += save_data
-                mem_data = Sim.cpu.dmem.access(True, mem_addr, rs2_data, M_XWR)
-            else:
-                save_data, vdmem_ok = Sim.cpu.vmem.access(True, mem_addr, 0, M_XRD)
-                if vdmem_ok:
-                    save_data = save_data & ((1 << (remainder * 8)) - 1)
-                    rs2_data += save_data
-                    mem_data = Sim.cpu.vmem.access(True, mem_addr, rs2_data, M_XWR)
-                else:
-                    save_data, imem_ok = Sim.cpu.imem.access(True, mem_addr, 0, M_XRD)
-                    if imem_ok:
-                        save_data = save_data & ((1 << (remainder * 8)) - 1)
-                        rs2_data += save_data
-                        mem_data = Sim.cpu.imem.access(True, mem_addr, rs2_data, M_XWR)
-                    else:
-                        return EXC_DMEM_ERROR
+            Stat.inst_store += 1
+            rd          = 0
+            mem_data    = int(Sim.cpu.regs.read(RISCV.rs2(inst)))
+            mem_addr    = (rs1_data + int(SWORD(RISCV.imm_s(inst)))) & 0xffffffff
+            mem         = Sim.cpu.mmu if Sim.cpu.mmu.on else Sim.cpu.data_memory(mem_addr, True)
+            if Sim.intervals:
+                Sim.intervals.pages.add(mem_addr >> PAGE_SHIFT)
+            if mem is None:
+                return EXC_DMEM_ERROR
+            lock        = Sim.lock(mem_addr) if Sim.cpu.locks else None
+            if lock is not None:
+                lock.acquire()
+            try:
+                if (funct3 == 0):                           # SB
+                    mem_data &= 0xff
+                    mem.store8(mem_addr, mem_data)
+                elif (funct3 == 1):                         # SH
+                    mem_data &= 0xffff
+                    mem.store16(mem_addr, mem_data)
+                else:                                       # SW
+                    mem.store32(mem_addr, mem_data)
+            except MemoryFault:
+                return EXC_DMEM_ERROR
+            finally:
+                if lock is not None:
+                    lock.release()
+            if mem_addr == Sim.tohost:
+                pc_next         = pc + 4
+                Sim.cpu.pc.write(pc_next)
+                Sim.log(pc, inst, rd, mem_data, pc_next, mem_addr, TR_STORE)
+                return Sim.cpu.htif.store()
 
         pc_next         = pc + 4
         Sim.cpu.pc.write(pc_next)
-        Sim.log(pc, inst, rd, mem_data, pc_next)
+        Sim.log(pc, inst, rd, mem_data, pc_next, mem_addr, TR_LOAD if cs[IN_OP] == MEM_LD else TR_STORE)
+        return EXC_NONE
+
+    def exec_amo(pc, inst, opcode):
+
+        # The read-modify-write holds the lock of the word, which the
+        # stores of the other harts also take (see harts.py). As in QEMU,
+        # sc.w succeeds if the word still holds the value read by lr.w,
+        # instead of tracking the stores of the other harts to it.
+        Stat.inst_mem += 1
+        if opcode != LR_W:
+            Stat.inst_store += 1
+        cpu         = Sim.cpu
+        rd          = RISCV.rd(inst)
+        mem_addr    = int(cpu.regs.read(RISCV.rs1(inst)))
+        rs2_data    = int(cpu.regs.read(RISCV.rs2(inst)))
+        mem         = cpu.mmu if cpu.mmu.on else cpu.data_memory(mem_addr, True)
+        if Sim.intervals:
+            Sim.intervals.pages.add(mem_addr >> PAGE_SHIFT)
+        if mem is None:
+            return EXC_DMEM_ERROR
+        lock        = Sim.lock(mem_addr) if cpu.locks else None
+        if lock is not None:
+            lock.acquire()
+        try:
+            if opcode == LR_W:
+                mem_data = mem.load32(mem_addr)
+                cpu.reservation = (mem_addr, mem_data)
+            elif opcode == SC_W:
+                mem_data = 1                        # failed
+                if cpu.reservation is not None and cpu.reservation[0] == mem_addr and \
+                   mem.load32(mem_addr) == cpu.reservation[1]:
+                    mem.store32(mem_addr, rs2_data)
+                    mem_data = 0
+                cpu.reservation = None
+            else:
+                mem_data = mem.load32(mem_addr)
+                mem.store32(mem_addr, Sim.amo[opcode](mem_data, rs2_data))
+        except MemoryFault:
+            return EXC_DMEM_ERROR
+        finally:
+            if lock is not None:
+                lock.release()
+        cpu.regs.write(rd, mem_data)
+
+        pc_next         = pc + 4
+        cpu.pc.write(pc_next)
+        Sim.log(pc, inst, rd, mem_data, pc_next, mem_addr, TR_LOAD | TR_STORE)
         return EXC_NONE
 
+    @staticmethod
+    def lock(addr):
+
+        # Returns the lock of the word at addr, one of cpu.locks shared
+        # by the harts
+        locks = Sim.cpu.locks
+        return locks[(addr >> 2) % len(locks)]
+
+    @staticmethod
+    def signed(v):
+        return v - ((v & 0x80000000) << 1)
+
+    amo = { AMOSWAP_W:  lambda m, s: s,
+            AMOADD_W:   lambda m, s: (m + s) & 0xffffffff,
+            AMOXOR_W:   lambda m, s: m ^ s,
+            AMOAND_W:   lambda m, s: m & s,
+            AMOOR_W:    lambda m, s: m | s,
+            AMOMIN_W:   lambda m, s: m if Sim.signed(m) < Sim.signed(s) else s,
+            AMOMAX_W:   lambda m, s: m if Sim.signed(m) > Sim.signed(s) else s,
+            AMOMINU_W:  min,
+            AMOMAXU_W:  max }
+
     def run_ctrl(pc, inst, opcode, cs):
 
         Stat.inst_ctrl += 1
@@ -287,10 +553,42 @@ class Sim(object):
 
         if (opcode in [ JAL, JALR ]):
             Sim.cpu.regs.write(rd, pc_plus4)
+            if Sim.callgraph:
+                # The call or return instruction is charged to the caller
+                Sim.callgraph.transfer(int(pc), int(rd), int(rs1) if opcode == JALR else 0,
+                                       int(pc_next) & 0xffffffff, (Stat.icount + 1,))
+        elif pc_next != pc_plus4:
+            Stat.taken_branches += 1
         Sim.cpu.pc.write(WORD(pc_next))
         Sim.log(pc, inst, rd, pc_plus4, WORD(pc_next))
+        if Sim.window:
+            Sim.window.branch(int(pc_next) & 0xffffffff)
+        if Sim.coverage:
+            Sim.coverage.branch(int(pc), int(pc_next) & 0xffffffff, opcode not in [ JAL, JALR ], pc_next != pc_plus4)
         if pc == pc_next:
             return EXC_FIN
+        if Sim.pending:
+            return EXC_PENDING
+        return EXC_NONE
+
+    @staticmethod
+    def post(flag):
+        Sim.pending |= flag
+
+    @staticmethod
+    def service():
+
+        # Handles the signals received before the last control transfer
+        # (block boundary), after its stats are updated; the handlers
+        # only set the flags
+        pending = Sim.pending
+        Sim.pending = 0
+        if pending & PENDING_DUMP:
+            Sim.cpu.dump_state()
+        if pending & PENDING_CHECKPOINT:
+            Sim.cpu.checkpoint()
+        if pending & PENDING_STOP:
+            return EXC_INTERRUPT
         return EXC_NONE
 
     def run_csr(pc, inst, opcode, cs):
@@ -300,7 +598,7 @@ class Sim(object):
             pc_next = pc + 4
             Sim.cpu.pc.write(pc_next)
             Sim.log(pc, inst, 0, 0, pc_next)
-            return EXC_FENCE
+            return EXC_FENCE if Sim.boot else EXC_NONE
 
         elif inst == ECALL:
             pc_next = pc + 4
@@ -318,6 +616,18 @@ class Sim(object):
             Sim.log(pc, inst, 0, 0, pc_next)
             return EXC_OS_ERROR
 
+        elif opcode == SFENCE_VMA:
+            # Flushes the whole TLB, or only the page of rs1 if nonzero
+            rs1 = RISCV.rs1(inst)
+            Sim.cpu.mmu.flush(int(Sim.cpu.regs.read(rs1)) if rs1 else None)
+            pc_next = pc + 4
+            Sim.cpu.pc.write(pc_next)
+            Sim.log(pc, inst, 0, 0, pc_next)
+            return EXC_NONE
+
+        elif opcode in [ MRET, SRET ]:
+            return Sim.xret(pc, inst, opcode)
+
 
 
         rs1             = RISCV.rs1(inst)
@@ -328,10 +638,15 @@ class Sim(object):
             rs1_data = rs1
         prv_name        = csr_name(csr_addr)
         prv_reg         = Sim.cpu.prv_regs.find(prv_name)
+        if prv_name in Sim.counters:
+            # Counters are brought up to date only when they are read
+            prv_reg.write(getattr(Stat, Sim.counters[prv_name]) & 0xffffffff)
         if (prv_reg != None):
             exc_imm = Sim.csr_handler(prv_reg, opcode, rs1_data, rd)
             if (exc_imm != EXC_NONE):
                 return exc_imm
+            if prv_name in Sim.mmu_csrs:
+                Sim.cpu.mmu.update()
 
         else:
             return EXC_ILLEGAL_INST                 
@@ -358,28 +673,71 @@ class Sim(object):
         
         return EXC_NONE
 
+    @staticmethod
+    def xret(pc, inst, opcode):
+
+        # Returns from M mode (mret) or S mode (sret) to the privilege
+        # level saved in mstatus, at mepc or sepc
+        regs = Sim.cpu.prv_regs
+        status = int(regs.mstatus.read())
+        if opcode == MRET:
+            if Sim.cpu.prv != PRV_M:
+                return EXC_ILLEGAL_INST
+            Sim.cpu.prv = (status & MSTATUS_MPP) >> MSTATUS_MPP_SHIFT
+            status = (status & ~(MSTATUS_MPP | MSTATUS_MIE)) | MSTATUS_MPIE | \
+                     (MSTATUS_MIE if status & MSTATUS_MPIE else 0)
+            pc_next = regs.mepc.read()
+        else:
+            if Sim.cpu.prv < PRV_S:
+                return EXC_ILLEGAL_INST
+            Sim.cpu.prv = PRV_S if status & MSTATUS_SPP else PRV_U
+            status = (status & ~(MSTATUS_SPP | MSTATUS_SIE)) | MSTATUS_SPIE | \
+                     (MSTATUS_SIE if status & MSTATUS_SPIE else 0)
+            pc_next = regs.sepc.read()
+        regs.mstatus.write(status)
+        Sim.cpu.mmu.update()
+        Sim.cpu.pc.write(pc_next)
+        Sim.log(pc, inst, 0, 0, pc_next)
+        if Sim.window:
+            Sim.window.branch(int(pc_next))
+        if Sim.coverage:
+            Sim.coverage.branch(int(pc), int(pc_next), False, True)
+        return EXC_NONE
+
     func = [ run_alu, run_mem, run_ctrl, run_csr ]
 
+    # CSRs whose writes change the address translation
+    mmu_csrs = { 'satp', 'mstatus', 'sstatus' }
+
+    counters = { 'mcycle': 'cycle', 'cycle': 'cycle', 'minstret': 'icount', 'instret': 'icount' }
+
     @staticmethod
     def single_step():
 
         pc         = Sim.cpu.pc.read()
-        # Instruction fetch
 
-        if Log.vmem_activate:
-            inst, imem_status = Sim.cpu.vmem.access(True, pc, 0, M_XRD)
-    
-        else:
-            inst, imem_status = Sim.cpu.imem.access(True, pc, 0, M_XRD)
-            if not imem_status:
-                inst, imem_status = Sim.cpu.rstvec.access(True, pc, 0, M_XRD)
+        # Instruction fetch; the boot ROM (rstvec) is only used without -v
+        try:
+            if Sim.cpu.mmu.on:
+                inst = Sim.cpu.mmu.fetch(int(pc))
+            elif Log.vmem_activate:
+                inst = Sim.cpu.vmem.load32(int(pc))
+            else:
+                inst = Sim.cpu.imem.load32(int(pc))
+        except MemoryFault:
+            if Sim.cpu.mmu.on or Log.vmem_activate or not Sim.cpu.rstvec.holds(int(pc)):
+                return EXC_IMEM_ERROR
+            try:
+                inst = Sim.cpu.rstvec.load32(int(pc))
+            except MemoryFault:
+                return EXC_IMEM_ERROR
+        inst    = WORD(inst)            # decoded with NumPy 32-bit arithmetic
 
-                if not imem_status:
-                    return EXC_IMEM_ERROR
-       
         # Instruction decode 
         opcode  = RISCV.opcode(inst)
         if opcode == ILLEGAL:
             return EXC_ILLEGAL_INST
         cs = isa[opcode]
+        if Sim.opcodes:
+            Sim.opcodes.count(opcode)
         return Sim.func[cs[IN_CLASS]](pc, inst, opcode, cs)
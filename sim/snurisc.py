@@ -17,6 +17,8 @@
 
 import sys
 import os
+import signal
+import contextlib
 
 from consts import *
 from isa import *
@@ -25,6 +27,23 @@ from program import *
 from sim import *
 from privReg import *
 from vmem import *
+from kernel import *
+from htif import *
+from gdbstub import *
+from watch import *
+from flight import *
+from bintrace import *
+from trigger import *
+from roi import *
+from sampler import *
+from callgraph import *
+from lines import *
+from covmap import *
+from intervals import *
+from harts import *
+from metrics import *
+from heartbeat import *
+from checkpoint import *
 
 #--------------------------------------------------------------------------
 #   SNURISC: Target machine to simulate
@@ -43,13 +62,40 @@ class SNURISC(object):
         self.prv_regs       = PrivReg()
         self.prv            = PRV_M
         self.vmem           = VirtualMem()
+        self.mmu            = MMU(self)
+        self.hartid         = 0
+        self.locks          = None          # locks for stores, lr/sc and amo* of harts, see harts.py
+        self.reservation    = None          # (address, value) of the last lr.w
         self.rstvec         = Memory(DEFAULT_RSTVEC, 0x1000, WORD_SIZE)
         self.set_rstvec()
-        self.stat_info      = os.stat("./pk")
-        self.heap_start     = HEAP_START
+        self.kernel         = Kernel(self)
+        self.htif           = None
+        self.watch          = Watchpoints()
+        self.flight         = FlightRecorder(Log.flight_size) if Log.flight_size else None
+        self.tracer         = TraceWriter(Log.trace_file, Log.trace_compression) if Log.trace_file else None
+        self.window         = None
+        self.sampler        = None
+        self.callgraph      = None
+        self.coverage       = None
+        self.metrics        = None
+        self.intervals      = None
+        self.heartbeat      = None
+        self.roi            = ROI(STAT_FIELDS)
  
-    def run(self, entry_point):
-        Sim.run(self, entry_point)
+    def run(self, entry_point, boot = False):
+        if Log.gdb_target and not boot:
+            GDBStub(self, Log.gdb_target).serve(entry_point)
+        else:
+            if self.metrics:
+                self.metrics.start()
+            if self.heartbeat:
+                self.heartbeat.start()
+            status = Sim.run(self, entry_point, boot)
+            if self.heartbeat:
+                self.heartbeat.stop()
+            if self.metrics:
+                self.metrics.stop()
+            return status
 
     def set_rstvec(self):
         self.rstvec.access(True, DEFAULT_RSTVEC, 0x297, M_XWR)
@@ -81,115 +127,178 @@ class SNURISC(object):
         
         return
     
-    var_num = -1
+    def memories(self):
+        return [ self.vmem.pages, self.dmem, self.imem, self.rstvec ]
+
+    def data_memory(self, addr, store = False):
+
+        # Returns the memory serving a load or a store to addr, or None.
+        # The boot ROM (rstvec) is read-only.
+        if self.dmem.holds(addr):
+            return self.dmem
+        elif self.vmem.pages.holds(addr):
+            return self.vmem.pages
+        elif not store and self.rstvec.holds(addr):
+            return self.rstvec
+        elif self.imem.holds(addr):
+            return self.imem
+        return None
+
+    def mem_views(self, addr, size):
+
+        # Returns a list of byte views covering [addr, addr + size) of the
+        # guest memory without copying, or None if the range has a hole
+        views = []
+        addr = int(addr)
+        while size > 0:
+            for mem in self.memories():
+                v = mem.view(addr, size)
+                if v is not None and len(v) > 0:
+                    break
+            else:
+                return None
+            views.append(v)
+            addr += len(v)
+            size -= len(v)
+        return views
+
+    def read_string(self, addr, maxlen = 4096):
+        s = b''
+        while len(s) < maxlen:
+            views = self.mem_views(addr + len(s), 1)
+            if views is None:
+                return None
+            c = bytes(views[0])
+            if c == b'\0':
+                return s.decode(errors = 'replace')
+            s += c
+        return None
+
+    def write_bytes(self, addr, data):
+        views = self.mem_views(addr, len(data))
+        if views is None:
+            return False
+        i = 0
+        for v in views:
+            v[:] = memoryview(data)[i:i + len(v)]
+            i += len(v)
+        return True
+
+    def set_watchpoints(self, specs, symbols):
+
+        for spec in specs:
+            if self.watch.add_spec(spec, symbols) is None:
+                print("Invalid watchpoint '%s'" % spec)
+                return False
+        return True
+
+    def set_trace_window(self, specs, symbols, symtab):
+
+        if not specs:
+            return True
+        self.window = TraceWindow()
+        for spec in specs:
+            if not self.window.add_spec(spec, symbols, symtab):
+                print("Invalid trace trigger '%s'" % spec)
+                return False
+        return True
+
+    def set_profilers(self, entry_point):
+
+        if Log.sample_period or Log.sample_interval:
+            self.sampler = PCSampler(Program.text, Log.sample_period, Log.sample_interval)
+        elif Log.line_file:
+            self.sampler = PCSampler(Program.text, 1)       # count every instruction
+        if Log.callgraph_files:
+            self.callgraph = CallGraph([ 'Ir' ], int(entry_point), (Stat.icount,))
+        if Log.coverage_files:
+            self.coverage = Coverage(Program.text, self.filename)
+        if Log.metrics_files:
+            self.metrics = Metrics('snurisc', self.filename)
+        if Log.interval_files:
+            self.intervals = IntervalStats(Log.interval or INTERVAL_LENGTH)
+        if Log.heartbeat or Log.status_file:
+            self.heartbeat = Heartbeat(lambda: (Stat.icount, self.pc.read()),
+                                       Log.heartbeat or HEARTBEAT_INTERVAL, Log.status_file, Log.heartbeat > 0)
+
+    def show_profiles(self):
+
+        if Log.sample_period or Log.sample_interval:
+            self.sampler.report(Program.symtab)
+        if Log.line_file:
+            table = LineTable.load(self.filename)
+            search = [ '.', os.path.dirname(self.filename) ]
+            if Log.line_file == '-':
+                table.listing(self.sampler.start, [ self.sampler.hist ], [ 'samples' ], sys.stdout, search)
+            else:
+                with open(Log.line_file, 'w') as out:
+                    table.listing(self.sampler.start, [ self.sampler.hist ], [ 'samples' ], out, search)
+        if self.callgraph:
+            self.callgraph.write(Log.callgraph_files, self.filename, Program.symtab)
+        if self.coverage:
+            self.coverage.write(Log.coverage_files)
+        if self.metrics:
+            self.write_metrics()
+        if self.intervals:
+            self.intervals.write(Log.interval_files)
+
+    def write_metrics(self):
+
+        m = self.metrics
+        m.collect()
+        m.add_labeled('syscalls_total', 'counter', 'System calls handled by the proxy kernel', 'syscall',
+                      { SYSCALL_NAME.get(n, str(n)): c for n, c in sorted(self.kernel.calls.items()) })
+        m.add_labeled('guest_memory_bytes', 'gauge', 'Guest memory allocated by the simulator', 'memory',
+                      { 'imem': int(self.imem.mem_end - self.imem.mem_start),
+                        'dmem': int(self.dmem.mem_end - self.dmem.mem_start),
+                        'pages': self.vmem.pages.footprint() })
+        m.write(Log.metrics_files)
+
+    def install_signals(self):
+
+        # The handlers only set a flag, which is checked at the next
+        # control transfer. A second SIGINT before that interrupts Python.
+        def stop(signum, frame):
+            if Sim.pending & PENDING_STOP:
+                raise KeyboardInterrupt
+            Sim.post(PENDING_STOP)
+        signal.signal(signal.SIGUSR1, lambda signum, frame: Sim.post(PENDING_DUMP))
+        signal.signal(signal.SIGUSR2, lambda signum, frame: Sim.post(PENDING_CHECKPOINT))
+        signal.signal(signal.SIGINT, stop)
+
+    def dump_state(self):
+
+        # SIGUSR1: registers, PC, stats, and the flight recorder to stderr
+        Log.flush()
+        sys.stdout.flush()
+        with contextlib.redirect_stdout(sys.stderr):
+            pc = self.pc.read()
+            name = Program.symtab.name(pc)
+            print("PC = 0x%08x%s, privilege level %d" % (pc, " <%s>" % name if name else '', self.prv))
+            self.regs.dump()
+            Stat.show()
+            if self.flight:
+                self.flight.dump()
+
+    def checkpoint(self):
+
+        # SIGUSR2: the name tells the program and the instruction count
+        filename = "%s.%d.ckpt.npz" % (os.path.basename(self.filename), Stat.icount)
+        Checkpoint.save(self, filename)
+        print("Checkpoint at 0x%08x after %d instructions written to %s" % (self.pc.read(), Stat.icount, filename),
+              file = sys.stderr)
+
+    def restore(self, filename):
+        return Checkpoint.restore(self, filename)
+
+    def attach_htif(self, symbols):
+
+        # Programs built for riscv-tests talk to the host through tohost
+        if 'tohost' in symbols:
+            self.htif = HTIF(self, symbols['tohost'], symbols.get('fromhost'))
+
     def handle_syscall(self):
-        a0                  = self.regs.read(10)
-        a1                  = self.regs.read(11)
-        a2                  = self.regs.read(12)
-        a3                  = self.regs.read(13)
-        a4                  = self.regs.read(14)
-        a5                  = self.regs.read(15)
-        a6                  = self.regs.read(16)
-        n                   = self.regs.read(17)
-
-        if n in sysconst_list:
-            if n == 80:                                 # sys_fstat
-                self.stat_info = os.stat(self.filename)
-                return EXC_NONE
-            elif n == 214:                              # sys_brk
-                # var_num     = a6
-                # if a0 == 0:
-                #     self.vmem.var_set(var_num, self.heap_start)
-                # elif var_num in self.vmem.var_list and self.vmem.var_get(var_num) == a0:
-                #     self.regs.write(10, self.heap_start)
-                #     self.regs.write(16, a6 - HEAP_SIZE)
-                # else:
-                #     self.vmem.var_set(var_num, self.heap_start)
-                #     heap            = Memory(self.heap_start, HEAP_SIZE, WORD_SIZE)
-                #     self.vmem.heap_list.append(heap)
-                #     print('heap created:')
-                #     print(hex(self.heap_start), hex(HEAP_SIZE + self.heap_start))
-                #     self.heap_start = self.heap_start + var_num - HEAP_SIZE
-                
-                #value       = self.vmem.var_get(var_num)
-                #self.regs.write(15, value)
-                
-                var_num     = a6
-                value       = self.vmem.var_get(var_num)
-                self.regs.write(15, value)
-                if a0 != 0:
-                    self.regs.write(10, self.heap_start)
-                return EXC_NONE
-            elif n == 64:                               # sys_write
-                remainder   = a1 % 4
-                address     = a1 - remainder
-                i           = 0
-                string      = ''
-                while i < a2:
-                    data    = self.vmem.access(True, address + i, 0, M_XRD)[0]
-                    if i == 0:
-                        data >>= (remainder * 8)
-                    if data == 0xff:
-                        data = self.vmem.access(True, 0x1333c, 0, M_XRD)[0]
-                        data >>= (3 * 8)
-                    while (data % 0x100 != 0):
-                        letter = chr(data % 0x100)
-                        string += letter
-                        data //= 0x100
-                    if data != 0:
-                        break
-                    i += 4
-                print(string)
-                return EXC_NONE
-            elif n == 57:                               # sys_close
-                return EXC_NONE
-            elif n == 93:                               # sys_exit
-                return EXC_FIN
-            elif n == 63:                               # sys_read
-                address             = a1
-                all_input           = input("")
-                
-                remainder           = address % 4
-                i                   = all_input[0]
-                remain_string       = all_input[1:]
-                data                = ord(i) << (remainder * 8)
-                self.regs.write(10, data)
-                self.vmem.access(True, address - remainder, data, M_XWR)
-
-                imm                 = 1
-                
-                while imm < len(all_input) - 1:
-                    i               = remain_string[0]
-                    remain_string   = remain_string[1:]
-                    remainder      += 1
-                    if remainder == 4:
-                        address    += 4
-                        remainder   = 0
-                    data            = ord(i) << (remainder * 8)
-                    self.vmem.access(True, address - remainder, data, M_XWR)
-                    imm            += 1
-                # data        = 0
-                # i           = 0
-                # for c in string:
-                #     i      += 1
-                #     if i % 4   == 1:
-                #         data += ord(c)
-                #     elif i % 4 == 2:
-                #         data += ord(c) * 256
-                #     elif i % 4 == 3:
-                #         data += ord(c) * 256 * 256
-                #     else:
-                #         data += ord(c) * 256 * 256 * 256
-                #         heap.access(True, address, data, M_XWR)
-                #         data = 0
-                #         address += 4
-                # if not (i % 4 == 0):
-                #     heap.access(True, address, data, M_XWR)
-                return EXC_NONE
-            elif n == 62:
-                return EXC_NONE
-        else:
-            return SYS_ERROR
+        return self.kernel.syscall()
 
 
 #--------------------------------------------------------------------------
@@ -198,8 +307,9 @@ class SNURISC(object):
 
 def show_usage(name):
     print("SNURISC: A RISC-V Instruction Set Simulator in Python")
-    print("Usage: %s [-l n] [-c m] [-v r] filename" % name)
+    print("Usage: %s [-l n] [-c m] [-v r] [-k k] [-d dir] [-r log | -p log] [-g port] [-w watch] [-T trigger] [-s n|Tms] [-C file] [-L file] [-V file] [-M file] [-I file] [-i n] [-H T] [-S file] [-R file] [-N n] [-q n] [-f n] [-t file] [-z none|zlib|lzma] [-a a] filename [args ...]" % name)
     print("\tfilename: RISC-V executable file name")
+    print("\targs: command line arguments passed to the program (only effective with -k)")
     print("\t-l sets the desired log level n (default: 1)")
     print("\t   0: shows no output message")
     print("\t   1: dumps registers at the end of the execution")
@@ -210,16 +320,39 @@ def show_usage(name):
     print("\t   6: 5 + dumps data memory for each cycle")
     print("\t-c shows logs after cycle m (default: 0, only effective for log level 3 or higher)")
     print("\t-v activates virtual memory, to run regular elf file (default: 0, activate for non-zero integer)")
+    print("\t-k runs the program on the built-in proxy kernel without booting pk (default: 0, activate for non-zero integer)")
+    print("\t-d sets the sandbox directory for files opened by the program (default: .)")
+    print("\t-r records all host inputs (file and stdin data, syscall results) to the log file")
+    print("\t-p replays the host inputs from the log file without accessing host files")
+    print("\t-w sets a data watchpoint addr[:len[:r|w|a]] on an address or symbol (default len: 4, w), can be repeated")
+    print("\t-T limits logs and traces to a window, e.g. start=main,stop=exit,count=n,cycle=a:b,pc=a:b,class=mem,mem=a:b, can be repeated")
+    print("\t-s samples the PC every n instructions, or every T ms of host CPU time, and prints a flat profile")
+    print("\t-C writes a call graph profile in callgrind format, or as folded stacks if file ends with .folded, can be repeated")
+    print("\t-L writes the samples per source line and annotated sources to the file ('-' for stdout); counts every instruction unless -s is given")
+    print("\t-V writes the executed instructions and branch outcomes as maps to merge (.npz), a JSON summary (.json) or an lcov tracefile, can be repeated")
+    print("\t-M writes run metrics (wall time, MIPS, instruction mix, system calls, memory) as JSON if file ends with .json, or in the Prometheus text format, can be repeated")
+    print("\t-I writes the instruction mix, loads, stores, taken branches, and data pages touched per interval as CSV if file ends with .csv, or as NumPy arrays (.npz), can be repeated")
+    print("\t-i sets the number of instructions per interval of -I (default: %d)" % INTERVAL_LENGTH)
+    print("\t-H prints the instruction count, PC, and MIPS to stderr every T seconds")
+    print("\t-S rewrites the file with the same progress report as JSON at every report (every 10 seconds unless -H is given)")
+    print("\t-R resumes from a checkpoint written on SIGUSR2 (with the same executable file, -v, and -k)")
+    print("\t-N runs the program on n harts in as many processes, sharing imem and dmem (default: 1)")
+    print("\t-q synchronizes the harts every n instructions (default: %d)" % HART_QUANTUM)
+    print("\t-f keeps the last n instructions to dump on faults, SIGINT, or SIGUSR1 (default: 256, 0 to disable)")
+    print("\t-t writes a binary trace of executed instructions to the file (see bintrace.py)")
+    print("\t-z sets the compression of the binary trace (default: none)")
+    print("\t-a formats the logs of level 3 and 4 in a background thread (default: 1, 0 to disable)")
+    print("\t-g waits for a GDB connection on the TCP port (localhost) or Unix socket path")
 
 
 def parse_args(args):
 
-    if (not len(args) in [ 2, 4, 6, 8 ]):
-        return None
-
     index = 1
-    while True:
+    while index < len(args):
         if args[index].startswith('-'):
+            if index + 1 >= len(args):
+                print("Missing value for option '%s'" % args[index])
+                return None
             if args[index] == '-l':
                 try:
                     level = int(args[index + 1])
@@ -245,17 +378,149 @@ def parse_args(args):
                     vmem_activate = 0
                 index += 2
                 Log.vmem_activate = (vmem_activate != 0)
+            elif args[index] == '-k':
+                try:
+                    kernel_activate = int(args[index + 1])
+                except ValueError:
+                    kernel_activate = 0
+                index += 2
+                Log.kernel_activate = (kernel_activate != 0)
+            elif args[index] == '-d':
+                if not os.path.isdir(args[index + 1]):
+                    print("Invalid sandbox directory '%s'" % args[index + 1])
+                    return None
+                Log.sandbox_dir = args[index + 1]
+                index += 2
+            elif args[index] == '-r':
+                Log.record_file = args[index + 1]
+                index += 2
+            elif args[index] == '-f':
+                try:
+                    size = int(args[index + 1])
+                except ValueError:
+                    size = -1
+                if size < 0:
+                    print("Invalid flight recorder size '%s'" % args[index + 1])
+                    return None
+                index += 2
+                Log.flight_size = size
+            elif args[index] == '-a':
+                try:
+                    async_log = int(args[index + 1])
+                except ValueError:
+                    async_log = 1
+                index += 2
+                Log.async_log = (async_log != 0)
+            elif args[index] == '-t':
+                Log.trace_file = args[index + 1]
+                index += 2
+            elif args[index] == '-z':
+                if args[index + 1] not in TRACE_COMPRESSION:
+                    print("Invalid trace compression '%s'" % args[index + 1])
+                    return None
+                Log.trace_compression = TRACE_COMPRESSION[args[index + 1]]
+                index += 2
+            elif args[index] == '-w':
+                Log.watch_list.append(args[index + 1])
+                index += 2
+            elif args[index] == '-T':
+                Log.trigger_list.append(args[index + 1])
+                index += 2
+            elif args[index] == '-s':
+                try:
+                    if args[index + 1].endswith('ms'):
+                        Log.sample_interval = float(args[index + 1][:-2]) / 1000
+                    else:
+                        Log.sample_period = int(args[index + 1])
+                except ValueError:
+                    Log.sample_period = -1
+                if Log.sample_period < 0 or Log.sample_interval < 0:
+                    print("Invalid sampling period '%s'" % args[index + 1])
+                    return None
+                index += 2
+            elif args[index] == '-C':
+                Log.callgraph_files.append(args[index + 1])
+                index += 2
+            elif args[index] == '-L':
+                Log.line_file = args[index + 1]
+                index += 2
+            elif args[index] == '-V':
+                Log.coverage_files.append(args[index + 1])
+                index += 2
+            elif args[index] == '-M':
+                Log.metrics_files.append(args[index + 1])
+                index += 2
+            elif args[index] == '-I':
+                Log.interval_files.append(args[index + 1])
+                index += 2
+            elif args[index] == '-i':
+                try:
+                    Log.interval = int(args[index + 1])
+                except ValueError:
+                    Log.interval = 0
+                if Log.interval <= 0:
+                    print("Invalid interval '%s'" % args[index + 1])
+                    return None
+                index += 2
+            elif args[index] == '-H':
+                try:
+                    Log.heartbeat = float(args[index + 1])
+                except ValueError:
+                    Log.heartbeat = -1
+                if Log.heartbeat <= 0:
+                    print("Invalid heartbeat interval '%s'" % args[index + 1])
+                    return None
+                index += 2
+            elif args[index] == '-S':
+                Log.status_file = args[index + 1]
+                index += 2
+            elif args[index] in [ '-N', '-q' ]:
+                try:
+                    n = int(args[index + 1])
+                except ValueError:
+                    n = 0
+                if n <= 0:
+                    print("Invalid %s '%s'" % ('number of harts' if args[index] == '-N' else 'quantum', args[index + 1]))
+                    return None
+                if args[index] == '-N':
+                    Log.harts = n
+                else:
+                    Log.quantum = n
+                index += 2
+            elif args[index] == '-R':
+                if not os.path.isfile(args[index + 1]):
+                    print("Invalid checkpoint '%s'" % args[index + 1])
+                    return None
+                Log.restore_file = args[index + 1]
+                index += 2
+            elif args[index] == '-g':
+                Log.gdb_target = args[index + 1]
+                index += 2
+            elif args[index] == '-p':
+                if not os.path.isfile(args[index + 1]):
+                    print("Invalid replay log '%s'" % args[index + 1])
+                    return None
+                Log.replay_file = args[index + 1]
+                index += 2
             else:
                 print("Invalid option '%s'" % args[index])
                 return None
         else:
             break
 
-    if len(args) != index + 1:
+    if index >= len(args) or (Log.record_file and Log.replay_file):
+        return None
+    if Log.harts > 1 and (Log.vmem_activate or Log.kernel_activate or Log.gdb_target or Log.restore_file or
+                          Log.record_file or Log.replay_file or Log.trace_file or Log.sample_period or
+                          Log.sample_interval or Log.callgraph_files or Log.line_file or Log.coverage_files or
+                          Log.metrics_files or Log.interval_files or Log.heartbeat or Log.status_file):
+        print("Option -N cannot be combined with -v, -k, -g, -r, -p, -R, -t, or the profiling options")
+        return None
+    if len(args) != index + 1 and not Log.kernel_activate:
         print("Invalid argument '%s'" % args[index + 1:])
         return None
 
-    return args[index]      # executable file name
+    return args[index:]     # executable file name followed by its arguments
 
 
 #--------------------------------------------------------------------------
@@ -263,25 +528,68 @@ def parse_args(args):
 #--------------------------------------------------------------------------
 
 def main():
-    filename = parse_args(sys.argv)
-    if not filename:
+    argv = parse_args(sys.argv)
+    if not argv:
         show_usage(sys.argv[0])
         sys.exit()
 
+    filename = argv[0]
     cpu = SNURISC(filename)
     prog = Program()
-    
-    if Log.vmem_activate:
+    cpu.install_signals()
+
+    if Log.kernel_activate:
+        Log.vmem_activate = True
+        entry_point = prog.load(cpu, filename)
+        if not entry_point:
+            sys.exit()
+        cpu.attach_htif(Program.symbols)
+        if not cpu.set_watchpoints(Log.watch_list, Program.symbols):
+            sys.exit()
+        if not cpu.set_trace_window(Log.trigger_list, Program.symbols, Program.symtab):
+            sys.exit()
+        if Log.restore_file:
+            entry_point = cpu.restore(Log.restore_file)
+            if entry_point is None:
+                sys.exit()
+        else:
+            sp = cpu.kernel.setup_stack(argv, [ ], [ (AT_ENTRY, entry_point) ])
+            cpu.regs.write(2, sp)
+        cpu.set_profilers(entry_point)
+        cpu.run(entry_point)
+        Stat.show()
+        cpu.roi.show()
+        cpu.show_profiles()
+        return
+
+    if Log.vmem_activate and not Log.restore_file:
         Log.vmem_activate = False
         entry_point = prog.load(cpu, "./pk")
-        cpu.run(DEFAULT_RSTVEC)
+        if cpu.run(DEFAULT_RSTVEC, boot = True) & EXC_INTERRUPT:
+            sys.exit()
         Log.vmem_activate = True
     entry_point = prog.load(cpu, filename)
     
     if not entry_point:
         sys.exit()
+    cpu.attach_htif(Program.symbols)
+    if not cpu.set_watchpoints(Log.watch_list, Program.symbols):
+        sys.exit()
+    if not cpu.set_trace_window(Log.trigger_list, Program.symbols, Program.symtab):
+        sys.exit()
+    if Log.harts > 1:
+        harts = Harts(cpu, Log.harts, Log.quantum)
+        harts.report(harts.run(entry_point))
+        return
+    if Log.restore_file:
+        entry_point = cpu.restore(Log.restore_file)
+        if entry_point is None:
+            sys.exit()
+    cpu.set_profilers(entry_point)
     cpu.run(entry_point)
     Stat.show()
+    cpu.roi.show()
+    cpu.show_profiles()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,192 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Trigger-based trace windows.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+import numpy as np
+
+from consts import *
+from isa import *
+from program import *
+from bintrace import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+# Instruction classes accepted by 'class=' (loads and stores are told
+# apart by the flags passed to Sim.log())
+TRIGGER_CLASS = {
+    'alu'           : [ 'alu' ],
+    'mem'           : [ 'load', 'store' ],
+    'load'          : [ 'load' ],
+    'store'         : [ 'store' ],
+    'ctrl'          : [ 'ctrl' ],
+    'csr'           : [ 'csr' ],
+}
+
+CLASS_NAME          = { CL_ALU: 'alu', CL_MEM: 'mem', CL_CTRL: 'ctrl', CL_CSR: 'csr' }
+
+NEVER               = 1 << 64
+
+
+#--------------------------------------------------------------------------
+#   TraceWindow: decides which instructions are logged and traced
+#--------------------------------------------------------------------------
+
+# The window is opened and closed by start and stop PCs. Since a function
+# entry or exit is always reached by a control transfer, these PCs are
+# checked only for the targets of branches and jumps (block boundaries)
+# instead of for every instruction. While the window is open, the
+# instructions can be further filtered by cycle range, PC ranges (looked
+# up in a precomputed bitmap), instruction class, and memory address.
+
+class TraceWindow(object):
+
+    def __init__(self):
+
+        self.start      = set()         # PCs that open the window
+        self.stop       = set()         # PCs that close the window
+        self.limit      = 0             # instructions before closing (0: no limit)
+        self.cycle_start = 0
+        self.cycle_end  = NEVER
+        self.pc_ranges  = [ ]           # [(start, end)] of PCs to accept
+        self.pc_base    = 0
+        self.pc_map     = None          # bitmap of accepted PCs, one per word
+        self.classes    = None          # set of accepted class names
+        self.mem_range  = None          # (start, end) of accepted data addresses
+        self.kinds      = { }           # inst -> class name
+        self.open       = True
+        self.count      = 0             # instructions since the window opened
+        self.windows    = 0             # number of times the window was opened
+
+    @staticmethod
+    def address(value, symbols):
+        return symbols[value] if value in symbols else int(value, 0)
+
+    @staticmethod
+    def addr_range(value, symbols, symtab):
+
+        # 'start:end' of numbers or symbols, or a symbol alone for
+        # the range covered by the symbol
+        if ':' in value:
+            start, end = value.split(':', 1)
+            return TraceWindow.address(start, symbols), TraceWindow.address(end, symbols)
+        start = TraceWindow.address(value, symbols)
+        i = symtab.lookup(start) if value in symbols else -1
+        if i >= 0 and symtab.range(i)[0] == start:
+            return symtab.range(i)
+        return start, start + WORD_SIZE
+
+    def add_spec(self, spec, symbols, symtab):
+
+        # Parses comma-separated 'key=value' terms; returns False on error
+        for term in spec.split(','):
+            key, sep, value = term.partition('=')
+            if not sep or not value:
+                return False
+            try:
+                if key == 'start':
+                    self.start.add(self.address(value, symbols))
+                elif key == 'stop':
+                    self.stop.add(self.address(value, symbols))
+                elif key == 'count':
+                    self.limit = int(value, 0)
+                elif key == 'cycle':
+                    start, sep, end = value.partition(':')
+                    self.cycle_start = int(start, 0) if start else 0
+                    self.cycle_end = int(end, 0) if end else NEVER
+                elif key == 'pc':
+                    self.pc_ranges.append(self.addr_range(value, symbols, symtab))
+                elif key == 'mem':
+                    self.mem_range = self.addr_range(value, symbols, symtab)
+                elif key == 'class':
+                    if value not in TRIGGER_CLASS:
+                        return False
+                    self.classes = (self.classes or set()) | set(TRIGGER_CLASS[value])
+                else:
+                    return False
+            except ValueError:
+                return False
+        self.open = not self.start
+        self.windows = int(self.open)
+        self.build_pc_map()
+        return True
+
+    def build_pc_map(self):
+
+        if not self.pc_ranges:
+            self.pc_map = None
+            return
+        self.pc_base = min(start for start, end in self.pc_ranges) & ~(WORD_SIZE - 1)
+        top = max(end for start, end in self.pc_ranges)
+        self.pc_map = np.zeros((top - self.pc_base + WORD_SIZE - 1) // WORD_SIZE, dtype = bool)
+        for start, end in self.pc_ranges:
+            self.pc_map[(start - self.pc_base) // WORD_SIZE:(end - self.pc_base + WORD_SIZE - 1) // WORD_SIZE] = True
+
+    def branch(self, target):
+
+        # Called with the target of every control transfer (and the entry
+        # point) to check the start and stop triggers
+        if self.open:
+            if target in self.stop:
+                self.open = False
+        elif target in self.start:
+            self.open = True
+            self.count = 0
+            self.windows += 1
+
+    def toggle(self, on):
+
+        # Opens or closes the window regardless of the triggers
+        if on and not self.open:
+            self.count = 0
+            self.windows += 1
+        self.open = on
+
+    def kind(self, inst):
+
+        kind = self.kinds.get(inst)
+        if kind is None:
+            opcode = RISCV.opcode(inst)
+            kind = CLASS_NAME[isa[opcode][IN_CLASS]] if opcode != ILLEGAL else 'alu'
+            self.kinds[inst] = kind
+        return kind
+
+    def accept(self, cycle, pc, inst, mem_addr, flags):
+
+        # Returns True if the instruction should be logged and traced
+        if not self.open:
+            return False
+        self.count += 1
+        if self.count == self.limit:
+            self.open = False           # this instruction is the last one
+        if cycle < self.cycle_start or cycle >= self.cycle_end:
+            return False
+        if self.pc_map is not None:
+            i = (int(pc) - self.pc_base) >> 2
+            if i < 0 or i >= len(self.pc_map) or not self.pc_map[i]:
+                return False
+        if self.classes is not None:
+            kind = 'load' if flags & TR_LOAD else 'store' if flags & TR_STORE else self.kind(inst)
+            if kind not in self.classes:
+                return False
+        if self.mem_range is not None:
+            if not flags & (TR_LOAD | TR_STORE):
+                return False
+            addr = int(mem_addr) & 0xffffffff
+            if addr < self.mem_range[0] or addr >= self.mem_range[1]:
+                return False
+        return True
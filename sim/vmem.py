@@ -4,7 +4,7 @@
 #
 #   SNURISC: A RISC-V ISA Simulator
 #
-#   Classes for hardware components: RegisterFile, Register, and Memory. 
+#   Classes for virtual memory: VirtualMem and MMU (Sv32).
 #
 #   Jin-Soo Kim
 #   Systems Software and Architecture Laboratory
@@ -15,29 +15,181 @@
 
 from consts import *
 from components import *
+from program import *
 
 class VirtualMem(object):
 
-    mem1      = Memory(0, 0, WORD_SIZE)
-    mem2      = Memory(0, 0, WORD_SIZE)
-    var_list = {}
-    def mem1_init(self, mem_addr, mem_size, word_size):
-        self.mem1 = Memory(mem_addr, mem_size, word_size)
-
-    def mem2_init(self, mem_addr, mem_size, word_size):
-        self.mem2 = Memory(mem_addr, mem_size, word_size)
+    def __init__(self):
+        self.pages = PagedMemory(WORD_SIZE)     # program image, stack, heap, mmap() areas
+        self.load32 = self.pages.load32         # instruction fetch
 
     def access(self, valid, addr, data, fcn):
-        
-        res = self.mem1.access(valid, addr, data, fcn)
-        if not res[1]:
-            res = self.mem2.access(valid, addr, data, fcn)
-        return res
-
-    def var_get(self, var_num):
-        if not var_num in self.var_list:
-            self.var_list[var_num] = 0
-        return self.var_list[var_num]
-
-    def var_set(self, var_num, var_value):
-        self.var_list[var_num] = var_value
\ No newline at end of file
+        return self.pages.access(valid, addr, data, fcn)
+
+    def view(self, addr, size):
+        return self.pages.view(addr, size)
+
+
+#--------------------------------------------------------------------------
+#   MMU: Sv32 address translation with software TLBs
+#--------------------------------------------------------------------------
+
+# Fetches, loads and stores are translated when satp selects Sv32 and the
+# CPU runs in S or U mode. The page table walker reads the PTEs from the
+# physical memories (SNURISC.data_memory()) and sets their A and D bits.
+# Its result is cached in a TLB as the page frame itself, so a translated
+# access costs one dict lookup when it hits. There are separate TLBs for
+# fetches (itlb), loads (dtlb) and stores (stlb, writable pages already
+# marked dirty); the last two form the D-TLB in the stats. An entry also
+# caches the permission check, so the TLBs are flushed on sfence.vma and
+# whenever satp, mstatus or the privilege level changes. Translation
+# faults raise MEM_FAULT like any other bad address.
+
+class MMU(object):
+
+    def __init__(self, cpu):
+
+        self.cpu        = cpu
+        self.on         = False     # translating
+        self.itlb       = { }       # VPN -> page frame (executable)
+        self.dtlb       = { }       # VPN -> page frame (readable)
+        self.stlb       = { }       # VPN -> page frame (writable and dirty)
+
+    def update(self):
+
+        # Called when satp, mstatus or the privilege level changes
+        cpu = self.cpu
+        self.on = bool(int(cpu.prv_regs.satp.read()) & SATP_MODE_SV32) and cpu.prv != PRV_M
+        self.flush()
+
+    def flush(self, va = None):
+
+        if va is None:
+            self.itlb.clear()
+            self.dtlb.clear()
+            self.stlb.clear()
+        else:
+            vpn = va >> PAGE_SHIFT
+            self.itlb.pop(vpn, None)
+            self.dtlb.pop(vpn, None)
+            self.stlb.pop(vpn, None)
+
+    def walk(self, va, access):
+
+        # Returns the frame of the physical page va maps to, where access
+        # is one of PTE_X, PTE_R and PTE_W
+        cpu = self.cpu
+        table = (int(cpu.prv_regs.satp.read()) & SATP_PPN_MASK) << PAGE_SHIFT
+        level = 1
+        while True:
+            pte_addr = table + ((va >> (PAGE_SHIFT + VPN_BITS * level)) & ((1 << VPN_BITS) - 1)) * WORD_SIZE
+            mem = cpu.data_memory(pte_addr)
+            if mem is None:
+                raise MEM_FAULT.with_traceback(None)
+            pte = mem.load32(pte_addr)
+            if not pte & PTE_V or (pte & (PTE_R | PTE_W)) == PTE_W:
+                raise MEM_FAULT.with_traceback(None)
+            if pte & (PTE_R | PTE_X):
+                break                       # leaf
+            level -= 1
+            if level < 0:
+                raise MEM_FAULT.with_traceback(None)
+            table = (pte >> PTE_PPN_SHIFT) << PAGE_SHIFT
+
+        # sstatus is a separate register here, so SUM and MXR are taken
+        # from either
+        status = int(cpu.prv_regs.mstatus.read()) | int(cpu.prv_regs.sstatus.read())
+        if cpu.prv == PRV_U and not pte & PTE_U:
+            raise MEM_FAULT.with_traceback(None)
+        if cpu.prv == PRV_S and pte & PTE_U and (access == PTE_X or not status & MSTATUS_SUM):
+            raise MEM_FAULT.with_traceback(None)
+        readable = pte & PTE_R or (status & MSTATUS_MXR and pte & PTE_X)
+        if not (readable if access == PTE_R else pte & access):
+            raise MEM_FAULT.with_traceback(None)
+        ppn = pte >> PTE_PPN_SHIFT
+        if level and ppn & ((1 << VPN_BITS) - 1):
+            raise MEM_FAULT.with_traceback(None)        # misaligned superpage
+
+        flags = pte | PTE_A | (PTE_D if access == PTE_W else 0)
+        if flags != pte:
+            mem.store32(pte_addr, flags)
+        pa = (ppn << PAGE_SHIFT) | (va & (((1 << VPN_BITS) - 1) << PAGE_SHIFT) if level else 0)
+        mem = cpu.data_memory(pa, access == PTE_W)
+        frame = mem.frame(pa) if mem is not None else None
+        if frame is None:
+            raise MEM_FAULT.with_traceback(None)
+        return frame
+
+    def fill(self, tlb, va, access):
+
+        frame = self.walk(va, access)
+        if len(tlb) >= TLB_ENTRIES:
+            tlb.clear()
+        tlb[va >> PAGE_SHIFT] = frame
+        return frame
+
+    def fetch(self, va):
+
+        Stat.itlb_access += 1
+        frame = self.itlb.get(va >> PAGE_SHIFT)
+        if frame is None:
+            Stat.itlb_miss += 1
+            frame = self.fill(self.itlb, va, PTE_X)
+        if va & 3:
+            raise MEM_FAULT.with_traceback(None)
+        return frame.item((va & (PAGE_SIZE - 1)) >> 2)
+
+    def dframe(self, va):
+
+        Stat.dtlb_access += 1
+        frame = self.dtlb.get(va >> PAGE_SHIFT)
+        if frame is None:
+            Stat.dtlb_miss += 1
+            frame = self.fill(self.dtlb, va, PTE_R)
+        return frame
+
+    def sframe(self, va):
+
+        Stat.dtlb_access += 1
+        frame = self.stlb.get(va >> PAGE_SHIFT)
+        if frame is None:
+            Stat.dtlb_miss += 1
+            frame = self.fill(self.stlb, va, PTE_W)
+        return frame
+
+    def load32(self, va):
+
+        if va & 3:
+            raise MEM_FAULT.with_traceback(None)
+        return self.dframe(va).item((va & (PAGE_SIZE - 1)) >> 2)
+
+    def load16(self, va):
+
+        if va & 1:
+            raise MEM_FAULT.with_traceback(None)
+        return (self.dframe(va).item((va & (PAGE_SIZE - 1)) >> 2) >> ((va & 2) << 3)) & 0xffff
+
+    def load8(self, va):
+        return (self.dframe(va).item((va & (PAGE_SIZE - 1)) >> 2) >> ((va & 3) << 3)) & 0xff
+
+    def store32(self, va, value):
+
+        if va & 3:
+            raise MEM_FAULT.with_traceback(None)
+        self.sframe(va)[(va & (PAGE_SIZE - 1)) >> 2] = value & 0xffffffff
+
+    def store16(self, va, value):
+
+        if va & 1:
+            raise MEM_FAULT.with_traceback(None)
+        frame = self.sframe(va)
+        shift = (va & 2) << 3
+        w = (va & (PAGE_SIZE - 1)) >> 2
+        frame[w] = (frame.item(w) & ~(0xffff << shift)) | ((value & 0xffff) << shift)
+
+    def store8(self, va, value):
+
+        frame = self.sframe(va)
+        shift = (va & 3) << 3
+        w = (va & (PAGE_SIZE - 1)) >> 2
+        frame[w] = (frame.item(w) & ~(0xff << shift)) | ((value & 0xff) << shift)
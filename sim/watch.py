@@ -0,0 +1,112 @@
+#==========================================================================
+#
+#   The PyRISC Project
+#
+#   SNURISC: A RISC-V ISA Simulator
+#
+#   Data watchpoints based on watched pages.
+#
+#   Jin-Soo Kim
+#   Systems Software and Architecture Laboratory
+#   Seoul National University
+#   http://csl.snu.ac.kr
+#
+#==========================================================================
+
+
+from consts import *
+from program import *
+
+
+#--------------------------------------------------------------------------
+#   Constants
+#--------------------------------------------------------------------------
+
+WATCH_READ          = 'r'
+WATCH_WRITE         = 'w'
+WATCH_ACCESS        = 'a'           # read or write
+
+WATCH_NAME = {
+    WATCH_READ      : 'read',
+    WATCH_WRITE     : 'write',
+    WATCH_ACCESS    : 'access',
+}
+
+
+#--------------------------------------------------------------------------
+#   Watchpoints: a set of watched address ranges
+#--------------------------------------------------------------------------
+
+# Every page that overlaps a watched range is put in the pages set. The
+# simulator only tests whether a load or store touches one of these pages;
+# the exact ranges are checked by hit() for those accesses alone, so the
+# traffic to other pages is not slowed down.
+
+class Watchpoints(object):
+
+    def __init__(self):
+
+        self.points     = { }       # id -> (start, end, kind)
+        self.pages      = set()     # page numbers covered by any watchpoint
+        self.next_id    = 1
+        self.triggered  = None      # last hit, cleared by the debugger
+
+    def update_pages(self):
+
+        # Modify the set in place as the simulator keeps a reference to it
+        self.pages.clear()
+        for start, end, kind in self.points.values():
+            self.pages.update(range(start >> PAGE_SHIFT, ((end - 1) >> PAGE_SHIFT) + 1))
+
+    def add(self, start, length, kind = WATCH_WRITE):
+
+        wid = self.next_id
+        self.next_id += 1
+        self.points[wid] = (start, start + max(length, 1), kind)
+        self.update_pages()
+        return wid
+
+    def remove(self, start, length, kind):
+
+        # Removes a watchpoint by its range, as the GDB protocol does
+        for wid, point in list(self.points.items()):
+            if point == (start, start + max(length, 1), kind):
+                del self.points[wid]
+                self.update_pages()
+                return True
+        return False
+
+    def add_spec(self, spec, symbols):
+
+        # Parses 'addr[:length[:r|w|a]]' where addr is a number or a symbol
+        fields = spec.split(':')
+        try:
+            start = symbols[fields[0]] if fields[0] in symbols else int(fields[0], 0)
+            length = int(fields[1], 0) if len(fields) > 1 else WORD_SIZE
+        except ValueError:
+            return None
+        kind = fields[2] if len(fields) > 2 else WATCH_WRITE
+        if kind not in WATCH_NAME:
+            return None
+        return self.add(start, length, kind)
+
+    def watched(self, addr, size):
+        return (addr >> PAGE_SHIFT) in self.pages or ((addr + size - 1) >> PAGE_SHIFT) in self.pages
+
+    def hit(self, pc, inst, addr, size, kind, old, new):
+
+        # Called for an access to a watched page; reports the watchpoints
+        # whose range overlaps [addr, addr + size)
+        for wid, (start, end, wkind) in self.points.items():
+            if addr >= end or addr + size <= start:
+                continue
+            if wkind != WATCH_ACCESS and wkind != kind:
+                continue
+            if kind == WATCH_WRITE:
+                value = "old=0x%0*x new=0x%0*x" % (size * 2, old, size * 2, new)
+            else:
+                value = "value=0x%0*x" % (size * 2, new)
+            Log.flush()
+            print("Watchpoint %d (%s 0x%08x): pc=0x%08x %-28s%s" % \
+                  (wid, WATCH_NAME[kind], addr, pc, Program.disasm(pc, inst), value))
+            self.triggered = (wid, wkind, addr)